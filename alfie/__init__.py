@@ -18,6 +18,9 @@ example_fasta : list, a list of DNA sequences records. Each record contains data
 example_fastq : list, a list of DNA sequences records. Each record contains data 
 	derieved from a fastq file in dictionary format.
 
+The example data and the pre-trained models are loaded on first access, importing alfie (or one of
+its modules) does not import tensorflow.
+
 dnn_k_four : a pre-trained tensorflow neural network for alignment-free, kingdom-level classification
 	of COI-5P barcode sequences. The model is designed to take 4-mer frequencies as input and make a 
 	multiclass prediction of the kingdom of origin for the input. Both the input 4-mers and the output
@@ -29,25 +32,52 @@ dnn_k_six : a pre-trained tensorflow neural network for alignment-free, kingdom-
 	of COI-5P barcode sequences. The model is designed to take 6-mer frequencies as input and make a 
 	multiclass prediction of the kingdom of origin for the input. Both the input 6-mers and the output
 	kingdom-level classification are encoded values in alphabetical order.
+
+fourmer_numpy_file : str, a path to the weights of dnn_k_four exported to a numpy .npz file. The weights
+	can be loaded with alfie.inference.NumpyModel.load, to classify sequences without tensorflow.
 """
 
 import os
 
-import alfie.seqio as seqio
-from tensorflow.keras.models import load_model
-
 location = os.path.dirname(os.path.realpath(__file__))
 
 ex_fasta_file = os.path.join(location, 'data', 'example_data.fasta')
 ex_fastq_file = os.path.join(location, 'data', 'example_data.fastq')
 
 fourmer_model_file = os.path.join(location, 'data', 'dnn_model_4mers')
+fourmer_numpy_file = os.path.join(location, 'data', 'dnn_model_4mers.npz')
 
 ##commented out - the 6mer isn't worth including
 #sixmer_model_file = os.path.join(location, 'data', 'dnn_model_6mers')
 
-example_fasta = seqio.read_fasta(ex_fasta_file)
-example_fastq = seqio.read_fastq(ex_fastq_file)
 
-dnn_k_four = load_model(fourmer_model_file)
-#dnn_k_six = load_model(sixmer_model_file)
\ No newline at end of file
+def _load_example_fasta():
+	import alfie.seqio as seqio
+	return seqio.read_fasta(ex_fasta_file)
+
+def _load_example_fastq():
+	import alfie.seqio as seqio
+	return seqio.read_fastq(ex_fastq_file)
+
+def _load_dnn_k_four():
+	from tensorflow.keras.models import load_model
+	return load_model(fourmer_model_file)
+
+#the example data and models are loaded on first access, so importing a submodule
+#(i.e. alfie.seqio or alfie.kmerseq) does not pay the cost of importing tensorflow
+_LAZY = {'example_fasta' : _load_example_fasta,
+			'example_fastq' : _load_example_fastq,
+			'dnn_k_four' : _load_dnn_k_four}
+
+
+def __getattr__(name):
+	if name in _LAZY:
+		value = _LAZY[name]()
+		#cache on the module, later lookups don't reach __getattr__
+		globals()[name] = value
+		return value
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+	return sorted(list(globals()) + list(_LAZY))
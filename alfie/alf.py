@@ -1,13 +1,16 @@
+import os
 import sys
 import argparse
-import numpy as np
-
-from tensorflow.keras.models import load_model
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 
-from alfie import dnn_k_four
+import numpy as np
 
 import alfie.seqio as seqio
-from alfie.classify import classify_records
+from alfie.classify import classify_stream, decode_predictions, Dereplicator
+from alfie.inference import NumpyModel
+from alfie.cache import PredictionCache
+from alfie.profiling import Profile, timed
 
 
 def alfie_parser(args):
@@ -18,28 +21,91 @@ def alfie_parser(args):
 		""")
 	parser.add_argument("-f", "--file", type = str,  
 		help = "The file of input sequences to classify.\n"+\
+		"A directory, or a quoted glob pattern (i.e. 'run1/*.fastq.gz'), can be passed to classify "+\
+		"all the sequence files it contains. The model is loaded once for all the files, and a "+\
+		"summary of the number of sequences per class in each file is written to the output "+\
+		"folder (alfie_summary.tsv).\n"+\
 		"Input can be either fasta or fastq formatfile type inferred from the extension.\n"+\
 		"fasta: '.fasta' or '.fa' \n"+\
-		"fastq: '.fastq' or '.fq' \n")
+		"fastq: '.fastq' or '.fq' \n"+\
+		"Compressed input is read directly, the extension may be followed by: "+\
+		"'.gz', '.bgz', '.bz2' or '.xz' \n")
 	parser.add_argument("-m", "--model", type = str, default = '4mer',
 		help = "A file with a trained tensorflow neural network to evaluate sequences." +\
 		"If no model is specified, the default 4mer model is used."+\
 		"Testing has shown the default 4mer model to be ~99.5 percent accurate."+\
+		"A model exported with alfie.inference.export_weights ('.npz' extension) is run with numpy."+\
 		"Ensure the kmer size and classes correspond to the custom network!" +\
 		"If you are passing a model that operates on a different set of classes"+\
 		"the '-c' argument is mandatory/"+\
 		"If you are passing a model that uses different size kmer counts as input"+\
 		"the '-k' flag is mandatory.")
+	parser.add_argument("--fallback_model", type = str, default = None,
+		help = "A second model file for a confidence-gated cascade (tensorflow or '.npz'). "+\
+		"All sequences are classified with the model (-m flag), only the sequences whose top class "+\
+		"probability is below the threshold (--threshold flag) are reclassified with the fallback "+\
+		"model. Both models must predict the same classes.")
+	parser.add_argument("--fallback_k", type = int, default = None,
+		help = "The kmer size used by the fallback model. Default is the same as the -k flag.")
+	parser.add_argument("--threshold", type = float, default = 0.9,
+		help = "The top class probability below which sequences are passed to the fallback model. "+\
+		"Default is 0.9.")
 	parser.add_argument("-k", "--kmer", type = int , default = 4, 
 		help = "The kmer size used to evaluate sequences. Options 4mer (default) or 6mer "+\
 		"The kmer features generated will correspond to the given size "+\
 		"Testing has shown a 4mer model to be optimal. This parameter is mandatory" +\
 		"if you use a custom model (-m flag) that takes a different size kmers as input")
+	parser.add_argument("-r", "--canonical", action = "store_true",
+		help = "Count each kmer together with its reverse complement as a single canonical kmer."+\
+		"Only use this with a custom model (-m flag) trained on canonical kmer features "+\
+		"(see the canonical argument of alfie.training.process_sequences). "+\
+		"Canonical features make the classification independent of the read orientation.")
 	parser.add_argument("-b", "--batch", type = int , default = 0, 
-		help = "should the input file be processed in batches ofsequences?"+\
-		"Default is False, passing an integer indicating the batch size to this flag"+\
-		"will enable sub batches and decrease"+\
-		"the amount of data stored in ram at one time. Tradeoff is slower processing")
+		help = "The number of sequences read and featurized at a time. "+\
+		"The input is streamed in batches, with reading, featurization, classification "+\
+		"and output running concurrently, so only a few batches are held in ram at one time. "+\
+		"Default (0) uses batches of 10000 sequences.")
+	parser.add_argument("-w", "--workers", type = int, default = 1,
+		help = "The number of processes used for kmer featurization. "+\
+		"Default is 1, on a multi-core machine a value up to the number of cores speeds up "+\
+		"the featurization of large batches (-b flag).")
+	parser.add_argument("-s", "--summary", action = "store_true",
+		help = "Summary mode: the sequences are classified but not written to the per class output "+\
+		"files, only a table with the number of sequences in each class is written to the output "+\
+		"folder (counts_<input file>.tsv).")
+	parser.add_argument("-i", "--read_ids", action = "store_true",
+		help = "In summary mode (-s flag), also write the names of the sequences in each class, one per "+\
+		"line, to the output folder (<class>_<input file>.ids).")
+	parser.add_argument("-j", "--jobs", type = int, default = 2,
+		help = "The number of input files classified concurrently when the input (-f flag) is a "+\
+		"directory or glob pattern. Reading, featurization and writing overlap, the predictions of a "+\
+		"tensorflow model are made one batch at a time. Default is 2.")
+	parser.add_argument("-z", "--compress", type = str, default = None, 
+		choices = ["gz", "bz2", "xz"],
+		help = "Compress the output files with the given format (gz, bz2 or xz). "+\
+		"Default is uncompressed output.")
+	parser.add_argument("-d", "--dereplicate", action = "store_true",
+		help = "Classify each distinct sequence in the input only once, copying the prediction to "+\
+		"all the sequences that are identical to it (ignoring case). This is much faster for redundant "+\
+		"data such as amplicon reads. A tab delimited table with the name of the first sequence, the "+\
+		"abundance and the class of each distinct sequence is written to the output folder "+\
+		"(abundance_<input file>.tsv).")
+	parser.add_argument("-e", "--cache", type = str, default = None,
+		help = "An sqlite file used as a persistent cache of predictions (created if it does not exist). "+\
+		"Sequences with a cached prediction from the same model (and kmer settings) are not "+\
+		"featurized or classified again. Predictions from a different model are never reused.")
+	parser.add_argument("--cache_size", type = int, default = 1000000,
+		help = "The maximum number of predictions held in the cache (-e flag), once reached the least "+\
+		"recently used predictions are evicted. Default is 1000000.")
+	parser.add_argument("-t", "--top_k", type = int, default = 0,
+		help = "Write the top_k most probable classes of each sequence, and their probabilities, "+\
+		"to a tab delimited table in the output folder (predictions_<input file>.tsv). "+\
+		"The probability of the first class is the confidence of the prediction. "+\
+		"The model must output class probabilities. Default (0) writes no table.")
+	parser.add_argument("-p", "--profile", action = "store_true",
+		help = "Record the time spent in each stage of the run (parse, featurize, predict and write), "+\
+		"with the records/sec and bytes/sec of each stage and the peak memory use. The report is "+\
+		"printed at the end of the run, and written to the output folder (alfie_profile.json).")
 	parser.add_argument("-c", "--classes", type = str, default = "kingdoms",
 		help = "An optional argument to specify the classes corresponding to a custom model."+\
 		"Default is the 5 taxonomic kingdoms."+\
@@ -55,71 +121,190 @@ def main():
 
 	file = parsed_args.file
 	model_file = parsed_args.model
-	kmer = parsed_args.kmer
-	batch = parsed_args.batch
 	klasses = parsed_args.classes
+	cache_file = parsed_args.cache
+	cache_size = parsed_args.cache_size
+	fallback_file = parsed_args.fallback_model
+	jobs = parsed_args.jobs
 
 	if file == None:
 		raise ValueError("must specify an input data file with the flag -f")
-	
-	if model_file == '4mer':
-		dnn_model = dnn_k_four
+
+	# a single file, or all the sequence files in a directory or matching a glob pattern
+	files = seqio.input_files(file)
+
+	outputs = [seqio.outfile_dict(x, ["alfie"], folder_prefix = None)[0] for x in files]
+	if len(set(outputs)) != len(outputs):
+		raise ValueError("The input files must have distinct names, the outputs are named after them.")
+
+	# the models are loaded once, and shared by all the files
+	dnn_model = load_model_file(model_file)
+	fallback_model = load_model_file(fallback_file) if fallback_file != None else None
+
+	if klasses == "kingdoms":
+		labels = ["animalia","bacteria","fungi","plantae","protista",]
 	else:
-		# load the tensorflow model
-		dnn_model = load_model(model_file)
+		labels = klasses.split( ',')
+
+	cache = PredictionCache(cache_file, cache_size) if cache_file != None else None
+	profile = Profile() if parsed_args.profile == True else None
+
+	try:
+		if len(files) == 1:
+			counts = [classify_file(files[0], parsed_args, labels, dnn_model, fallback_model, cache, 
+									profile)]
+		else:
+			os.makedirs("alfie_out", exist_ok = True)
+			with ThreadPoolExecutor(max(1, jobs)) as pool:
+				counts = list(pool.map(lambda x : classify_file(x, parsed_args, labels, dnn_model, 
+																fallback_model, cache, profile), files))
+	finally:
+		if cache != None:
+			cache.close()
+
+	if len(files) > 1:
+		write_summary(files, counts, "alfie_out/alfie_summary.tsv", labels)
+
+	if profile != None:
+		os.makedirs("alfie_out", exist_ok = True)
+		profile.to_json("alfie_out/alfie_profile.json")
+		print(profile.report(), file = sys.stderr)
+
+
+def classify_file(file, parsed_args, labels, dnn_model, fallback_model = None, cache = None,
+					profile = None):
+	"""
+	Classify the sequences of a file, writing them to one output file per class (or in 
+	summary mode, a table of the number of sequences per class). The stages of the run are
+	timed if an alfie.profiling.Profile is passed.
+
+	Returns the number of sequences assigned to each class.
+	"""
+	batch = parsed_args.batch
+	compress = parsed_args.compress
+	top_k = parsed_args.top_k
 
 	#check if fasta or fastq input
 	ftype = seqio.file_type(file)
 
-	if klasses == "kingdoms":
-		# build the output filenames
-		class_outfiles = seqio.outfile_dict(file)
+	# build the output filenames
+	if parsed_args.classes == "kingdoms":
+		class_outfiles = seqio.outfile_dict(file, compression = compress)
 	else:
-		labels = klasses.split( ',')
-		class_outfiles = seqio.outfile_dict(file, labels)
+		class_outfiles = seqio.outfile_dict(file, labels, compression = compress)
 
-	if ftype == 'fasta': 
-		if batch != 0:
-			# batch fasta processing
-			for b in seqio.iter_read_fasta(file, batch):
+	if batch == 0:
+		batch = 10000
 
-				seq_records, predictions = classify_records(b, dnn_model, kmer)
+	# the input is streamed: reading, featurization, prediction and writing overlap,
+	# with one open output file per class for the whole run
+	if parsed_args.summary == False:
+		writer = seqio.ClassWriter(class_outfiles, ftype)
+	elif parsed_args.read_ids == True:
+		# lists of the read names in each class, in place of the sequences
+		suffix = ".ids" if compress == None else ".ids." + compress
+		id_outfiles = {k : v + suffix for k, v in seqio.outfile_dict(file, labels).items()}
+		writer = seqio.ClassWriter(id_outfiles, 'ids')
+	else:
+		writer = None
 
-				for i, entry in enumerate(seq_records):
-					outfile = class_outfiles[predictions[i]]
-					seqio.write_fasta(entry, outfile)
+	derep = Dereplicator() if parsed_args.dereplicate == True else None
+	counts = np.zeros(len(labels), dtype = np.int64)
 
-		else:
-			# full file fasta processing
-			seq_records = seqio.read_fasta(file)
-			
-			seq_records, predictions = classify_records(seq_records, dnn_model, kmer)
+	tsv = None
 
-			for i, entry in enumerate(seq_records):
-				outfile = class_outfiles[predictions[i]]
-				seqio.write_fasta(entry, outfile)
+	try:
+		if top_k > 0:
+			tsv = open(seqio.outfile_dict(file, ["predictions"])[0] + ".tsv", 'w')
+			tsv.write("name\t" + "\t".join(f"class_{i}\tprobability_{i}" for i in range(1, top_k + 1)) + "\n")
 
+		with writer if writer != None else nullcontext():
+			batches = seqio.iter_read_batches(file, batch)
 
-	elif ftype == 'fastq':
-		if batch != 0:
-			# batch fastq processing
-			for b in seqio.iter_read_fastq(file, batch):
+			for out in classify_stream(batches, dnn_model, parsed_args.kmer, 
+										canonical = parsed_args.canonical, dereplicate = derep, 
+										cache = cache, workers = parsed_args.workers,
+										top_k = top_k if top_k > 0 else None,
+										fallback_model = fallback_model, 
+										fallback_k = parsed_args.fallback_k,
+										threshold = parsed_args.threshold,
+										profile = profile):
+				b = out[0]
+				with timed(profile, "write", len(b), len(b.buffer)):
+					if top_k > 0:
+						_, classes, probabilities = out
+						write_top_predictions(tsv, b.names, classes, probabilities, labels)
+						predictions = classes[:, 0]
+					else:
+						_, predictions = out
+					if writer != None:
+						writer.write(b, predictions)
+					counts += np.bincount(predictions, minlength = len(labels))[:len(labels)]
+	finally:
+		if tsv != None:
+			tsv.close()
 
-				seq_records, predictions = classify_records(b, dnn_model, kmer)
+	if derep != None:
+		write_abundance(derep, seqio.outfile_dict(file, ["abundance"])[0] + ".tsv", labels)
 
-				for i, entry in enumerate(seq_records):
-					outfile = class_outfiles[predictions[i]]
-					seqio.write_fastq(entry, outfile)
+	if parsed_args.summary == True:
+		write_counts(counts, seqio.outfile_dict(file, ["counts"])[0] + ".tsv", labels)
+
+	return counts
+
+
+def load_model_file(model_file):
+	"""Load the default model ('4mer'), a numpy model ('.npz' file) or a tensorflow model file."""
+	if model_file == '4mer':
+		from alfie import dnn_k_four
+		return dnn_k_four
+	elif model_file.endswith('.npz'):
+		# load the numpy model
+		return NumpyModel.load(model_file)
+	else:
+		# load the tensorflow model
+		from tensorflow.keras.models import load_model
+		return load_model(model_file)
+
+
+def write_abundance(derep, filename, labels):
+	"""Write the name, abundance and predicted class of each distinct sequence to a tsv file."""
+	predictions = derep.predictions
+	if predictions.ndim == 2:
+		#class probabilities were kept (top_k output)
+		predictions = np.argmax(predictions, axis = 1)
+	classes = decode_predictions(predictions, labels)
+
+	with open(filename, 'w') as f:
+		f.write("name\tabundance\tclass\n")
+		f.writelines(f"{n}\t{a}\t{c}\n" for n, a, c in zip(derep.names, derep.abundance, classes))
+
+
+
+def write_counts(counts, filename, labels):
+	"""Write the number of sequences in each class to a tsv file."""
+	with open(filename, 'w') as f:
+		f.write("class\tcount\n")
+		f.writelines(f"{x}\t{n}\n" for x, n in zip(labels, counts))
+
+
+def write_summary(files, counts, filename, labels):
+	"""Write the number of sequences in each class, for each input file, to a tsv file."""
+	with open(filename, 'w') as f:
+		f.write("file\ttotal\t" + "\t".join(labels) + "\n")
+		for x, c in zip(files, counts):
+			f.write(f"{x}\t{c.sum()}\t" + "\t".join(str(n) for n in c) + "\n")
+		total = np.sum(counts, axis = 0)
+		f.write(f"all\t{total.sum()}\t" + "\t".join(str(n) for n in total) + "\n")
 
-		else:
-			# full file fastq processing
-			seq_records = seqio.read_fastq(file)
 
-			seq_records, predictions = classify_records(seq_records, dnn_model, kmer)
+def write_top_predictions(f, names, classes, probabilities, labels):
+	"""Write the top-k classes and probabilities of a batch of sequences to an open tsv file."""
+	classes = decode_predictions(classes, labels)
+	probabilities = np.char.mod("%.4g", probabilities).tolist()
 
-			for i, entry in enumerate(seq_records):
-				outfile = class_outfiles[predictions[i]]
-				seqio.write_fastq(entry, outfile)
+	f.writelines(name + "\t" + "\t".join(c + "\t" + p for c, p in zip(cs, ps)) + "\n" 
+					for name, cs, ps in zip(names, classes, probabilities))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,261 @@
+"""
+A persistent on-disk cache of model predictions.
+
+Sequences that have already been classified by a model don't need to be featurized and classified
+again. The PredictionCache stores the output of a model for each sequence in an sqlite database,
+keyed by a fingerprint of the model (computed from its weights, so a different model file never
+reuses the predictions of another), the k-mer features used and the digest of the sequence
+(see alfie.seqio.sequence_digests). The number of cached predictions is bounded, once the limit
+is reached the least recently used predictions are evicted.
+
+==========
+Classes
+==========
+
+PredictionCache : A size bounded sqlite cache of model predictions for sequence digests.
+
+==========
+Functions
+==========
+
+model_fingerprint : Compute a fingerprint of a model, from its weights and structure.
+
+"""
+import hashlib
+import pickle
+import sqlite3
+import threading
+
+import numpy as np
+
+from alfie.inference import NumpyModel
+
+
+def model_fingerprint(model):
+	"""
+	Compute a fingerprint of a model, from its weights and structure.
+
+	Tensorflow models are fingerprinted with their weights and the activation function of each
+	layer, NumpyModels with their weights, biases and activations. Other models (i.e. scikit learn
+	models) are fingerprinted with their pickled representation.
+
+	Arguments
+	---------
+	model : tensorflow model, alfie.inference.NumpyModel or scikit learn model.
+
+	Returns
+	---------
+	out : str, a hexadecimal fingerprint. Models with the same weights have the same fingerprint.
+
+	Examples
+	---------
+	>>> from alfie import dnn_k_four
+	>>> model_fingerprint(dnn_k_four) == model_fingerprint(dnn_k_four)
+	True
+	"""
+	h = hashlib.blake2b(digest_size = 16)
+	h.update(type(model).__name__.encode())
+
+	if isinstance(model, NumpyModel):
+		arrays = model.weights + model.biases
+		h.update(",".join(model.activations).encode())
+	elif hasattr(model, "get_weights") and hasattr(model, "layers"):
+		arrays = model.get_weights()
+		h.update(",".join(str(x.get_config().get("activation")) for x in model.layers).encode())
+	else:
+		arrays = []
+		h.update(pickle.dumps(model))
+
+	for x in arrays:
+		x = np.ascontiguousarray(x)
+		h.update(str((x.dtype.str, x.shape)).encode())
+		h.update(x.tobytes())
+
+	return h.hexdigest()
+
+
+class PredictionCache:
+	"""
+	A size bounded sqlite cache of model predictions for sequence digests.
+
+	The raw output of the model (i.e. the class probabilities of a neural network) is stored
+	for each sequence. Each lookup and store marks the predictions involved as used, when the
+	cache grows beyond max_entries predictions the least recently used are deleted. The cache
+	can be shared by threads, and used as a context manager.
+
+	Arguments
+	---------
+	filename : str, the path of the sqlite database, created if it does not exist.
+
+	max_entries : int, the maximum number of predictions held. Default is 1000000.
+
+	Methods
+	---------
+	model_key : the key under which the predictions of a model are cached.
+
+	lookup : find the cached predictions for a list of sequence digests.
+
+	store : add predictions for a list of sequence digests.
+
+	close : commit and close the database.
+
+	Examples
+	---------
+	>>> from alfie import example_fasta
+	>>> from alfie.classify import classify_records
+	>>> with PredictionCache("alfie_cache.sqlite") as cache:
+	>>> 	seq_records, predictions = classify_records(example_fasta, cache = cache)
+	#the second time, the predictions are read from the cache
+	>>> with PredictionCache("alfie_cache.sqlite") as cache:
+	>>> 	seq_records, predictions = classify_records(example_fasta, cache = cache)
+	"""
+	def __init__(self, filename, max_entries = 1000000):
+		self.filename = filename
+		self.max_entries = max_entries
+		self._lock = threading.Lock()
+		self._fingerprints = {}
+
+		self._db = sqlite3.connect(filename, check_same_thread = False)
+		self._db.execute("PRAGMA journal_mode = WAL")
+		self._db.execute("PRAGMA synchronous = NORMAL")
+		self._db.execute("""CREATE TABLE IF NOT EXISTS models
+								(id INTEGER PRIMARY KEY, key TEXT UNIQUE, dtype TEXT, shape TEXT)""")
+		self._db.execute("""CREATE TABLE IF NOT EXISTS predictions
+								(model INTEGER, digest BLOB, value BLOB, used INTEGER,
+								PRIMARY KEY (model, digest))""")
+		self._db.execute("CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)")
+		self._db.commit()
+
+		self._n = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+		self._used = self._db.execute("SELECT COALESCE(MAX(used), 0) FROM predictions").fetchone()[0]
+
+	def __len__(self):
+		return self._n
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		"""Commit and close the database."""
+		with self._lock:
+			if self._db != None:
+				self._db.commit()
+				self._db.close()
+				self._db = None
+
+	def model_key(self, model, k = 4, canonical = False):
+		"""
+		The key under which the predictions of a model are cached.
+
+		Arguments
+		---------
+		model : tensorflow model, alfie.inference.NumpyModel or scikit learn model.
+
+		k : int, the k-mer size of the model's features. Default is 4.
+
+		canonical : bool, are the model's features canonical k-mers. Default is False.
+
+		Returns
+		---------
+		out : str, the cache key.
+		"""
+		#fingerprinting a large model is not free, remember the fingerprint for the model object
+		cached = self._fingerprints.get(id(model))
+		if cached == None or cached[0] is not model:
+			cached = (model, model_fingerprint(model))
+			self._fingerprints[id(model)] = cached
+
+		return f"{cached[1]}:k{k}:{'canonical' if canonical == True else 'all'}"
+
+	def _model(self, key):
+		return self._db.execute("SELECT id, dtype, shape FROM models WHERE key = ?", (key,)).fetchone()
+
+	def lookup(self, key, digests):
+		"""
+		Find the cached predictions for a list of sequence digests.
+
+		Arguments
+		---------
+		key : str, the model key (see model_key).
+
+		digests : list, the sequence digests (see alfie.seqio.sequence_digests).
+
+		Returns
+		---------
+		found : numpy.ndarray, the indices of the digests with a cached prediction.
+
+		values : numpy.ndarray, the cached predictions, in the order of found.
+		"""
+		with self._lock:
+			model = self._model(key)
+			if model == None or len(digests) == 0:
+				return np.zeros(0, dtype = np.int64), np.zeros(0)
+			model_id, dtype, shape = model
+
+			self._used += 1
+			position = {}
+			for i, x in enumerate(digests):
+				position.setdefault(x, []).append(i)
+
+			found = []
+			blobs = []
+			distinct = list(position)
+			#stay below the sqlite limit on query parameters
+			for start in range(0, len(distinct), 500):
+				chunk = distinct[start:start + 500]
+				rows = self._db.execute("SELECT digest, value FROM predictions WHERE model = ? " +\
+					f"AND digest IN ({','.join('?' * len(chunk))})", [model_id] + chunk).fetchall()
+				for digest, value in rows:
+					for i in position[digest]:
+						found.append(i)
+						blobs.append(value)
+				self._db.executemany("UPDATE predictions SET used = ? WHERE model = ? AND digest = ?",
+										[(self._used, model_id, x[0]) for x in rows])
+
+			if len(found) == 0:
+				return np.zeros(0, dtype = np.int64), np.zeros(0)
+
+			shape = tuple(int(x) for x in shape.split(",") if x != "")
+			values = np.frombuffer(b"".join(blobs), dtype = dtype).reshape((len(found),) + shape)
+			order = np.argsort(found)
+			return np.array(found, dtype = np.int64)[order], values[order]
+
+	def store(self, key, digests, values):
+		"""
+		Add predictions for a list of sequence digests, evicting the least recently used
+		predictions if the cache is full.
+
+		Arguments
+		---------
+		key : str, the model key (see model_key).
+
+		digests : list, the sequence digests (see alfie.seqio.sequence_digests).
+
+		values : numpy.ndarray, the model output for each digest, one row per digest.
+		"""
+		if len(digests) == 0:
+			return
+		values = np.ascontiguousarray(values)
+
+		with self._lock:
+			model = self._model(key)
+			if model == None:
+				self._db.execute("INSERT INTO models (key, dtype, shape) VALUES (?, ?, ?)",
+					(key, values.dtype.str, ",".join(str(x) for x in values.shape[1:])))
+				model = self._model(key)
+			model_id = model[0]
+
+			self._used += 1
+			cursor = self._db.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?)",
+								[(model_id, d, v.tobytes(), self._used) for d, v in zip(digests, values)])
+			self._n += cursor.rowcount
+
+			if self._n > self.max_entries:
+				self._db.execute("DELETE FROM predictions WHERE rowid IN " +\
+					"(SELECT rowid FROM predictions ORDER BY used LIMIT ?)", (self._n - self.max_entries,))
+				self._n = self.max_entries
+
+			self._db.commit()
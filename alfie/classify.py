@@ -7,16 +7,44 @@ Functions
 
 classify_records - Classify a series of DNA sequence records with the designated neural network.
 
+classify_stream - Classify a stream of sequence batches, with the read, featurize and predict stages overlapped.
+
+dereplicate - Find the distinct sequences of a batch, and the number of copies of each.
+
 decode_predictions - Decode numeric predictions to strings.
 
+top_predictions - Find the top-k classes of each record, and their probabilities.
+
+==========
+Classes
+==========
+
+Dereplicator - Track the distinct sequences across a stream of sequence batches.
+
 """
+import time
+import queue
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import scipy.sparse as sp
+
+from alfie.inference import NumpyModel
+from alfie.kmerseq import KmerFeatures, kmer_counts, count_frequencies
+from alfie.profiling import timed
+from alfie.seqio import SeqBatch, sequence_digests
 
-from alfie import dnn_k_four
-from alfie.kmerseq import KmerFeatures
+# tensorflow (and scikit learn) models are not guaranteed to be thread safe, their predictions are
+# serialized when a model is shared by threads (i.e. input files classified concurrently by the cli)
+_PREDICT_LOCK = threading.Lock()
 
 
-def classify_records(seq_records, model = dnn_k_four, k = 4, argmax = True):
+def classify_records(seq_records, model = None, k = 4, argmax = True, canonical = False,
+						sparse = False, keep_kmers = True, dereplicate = False, cache = None, workers = 1,
+						top_k = None, fallback_model = None, fallback_k = None, threshold = 0.9,
+						profile = None):
 	"""
 	Classify a series of DNA sequence records with the designated neural network.
 
@@ -24,15 +52,19 @@ def classify_records(seq_records, model = dnn_k_four, k = 4, argmax = True):
 	read_fasta or reads fastq functions. The `classify_records` function takes the 
 	input sequences, generates a kmerseq.Kmerfeatures class instance for each
 	sequence and passes the feature through the specified dnn_model to obtain a prediction. 
+	The k-mers of the whole set of records are counted in a single vectorized call to 
+	kmerseq.kmer_counts, each record's KmerFeatures instance is a view of its row of counts.
 
 	Arguments
 	---------
-	seq_records : list, a list of sequence records. Where each record is a 
+	seq_records : list or seqio.SeqBatch, a list of sequence records. Where each record is a 
 		dictionary with the keys 'name' (identifying string - header line) and 
-		'sequence' (the sequence line of the fasta entry). Other keys permitted but unused
+		'sequence' (the sequence line of the fasta entry). Other keys permitted but unused.
+		A columnar seqio.SeqBatch (as yielded by seqio.iter_read_batches) can be passed instead,
+		its sequence buffer is featurized directly and no 'kmer_data' is added.
 
-	model : tensorflow_model or scikit learn model. By default the internal
-		kingdom-level classifier model is used. A user may specify a custom model, 
+	model : tensorflow_model or scikit learn model. By default (None) the internal
+		kingdom-level classifier model (alfie.dnn_k_four) is used, it is loaded on first use. A user may specify a custom model, 
 		either a sequential tensorflow neural network or a scikit learn model (such as
 		a random forest or support vector machine).
 		If the custom model utilizes a different kmer feature size, the k parameter 
@@ -46,6 +78,54 @@ def classify_records(seq_records, model = dnn_k_four, k = 4, argmax = True):
 		true. Note for models that return numeric encodings (such as sklearn's LinearSVC)
 		the argmax value must be set to False, otherwise an error will result.
 
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. This must match the features the model was trained on (see the
+		canonical argument of alfie.training.process_sequences). Default is False.
+
+	sparse : bool, should the k-mer frequencies be passed to the model as a scipy.sparse CSR
+		matrix. This is recommended for large k (k >= 6), where the dense feature matrix would
+		be mostly zeros. The model must accept sparse input (i.e. scikit learn's LinearSVC).
+		When True, keep_kmers is ignored and no 'kmer_data' is added to the records, as each
+		KmerFeatures instance would hold a dense row of 4**k counts. Default is False.
+
+	keep_kmers : bool, should a kmerseq.KmerFeatures instance be added to each record under the
+		key 'kmer_data'. Default is True. Pass False to save memory when the k-mer counts are 
+		not needed after classification (the record dictionaries are then left unaltered).
+		Ignored if sparse is True.
+
+	dereplicate : bool, should each distinct sequence be featurized and classified only once, 
+		with the prediction copied to all the records with that sequence. Sequences are compared
+		case-insensitively (see seqio.sequence_digests). This saves time on redundant data 
+		(i.e. amplicon data). The number of records with the same sequence is added to each 
+		record under the key 'abundance' (not for a SeqBatch, see the dereplicate function). 
+		Default is False.
+
+	cache : alfie.cache.PredictionCache, a cache of predictions to consult before featurizing.
+		Only the sequences without a cached prediction for the model (and k, canonical) are
+		featurized and classified, and their predictions are added to the cache. No 'kmer_data'
+		is added to the records when a cache is used. Default is None (no cache).
+
+	workers : int, the number of processes used to count the k-mers (see kmerseq.kmer_counts).
+		Default is 1 (count in the calling process).
+
+	top_k : int, return the top_k most probable classes of each record and their probabilities,
+		in place of the argmax predictions (see top_predictions). The model is run once, its
+		outputs must be class probabilities (i.e. a softmax output layer). Default is None.
+
+	fallback_model : tensorflow model or alfie.inference.NumpyModel, a second (typically larger
+		and slower) model for a confidence-gated cascade. Every record is classified with model,
+		only the records whose top class probability is below threshold are featurized for 
+		the fallback model and reclassified by it. Both models must output probabilities for the
+		same classes. Default is None (no cascade).
+
+	fallback_k : int, the kmer feature size of the fallback model. Default is None (same as k).
+
+	threshold : float, the top class probability below which records are passed to the
+		fallback model. Default is 0.9.
+
+	profile : alfie.profiling.Profile, records the time, records and bytes of the featurize
+		and predict stages. Default is None (not profiled).
+
 	Returns
 	---------
 
@@ -53,6 +133,10 @@ def classify_records(seq_records, model = dnn_k_four, k = 4, argmax = True):
 		pair 'kmer_data' added to each record's dictionary. out2 is an array classifications,
 		whose length corresponds to the the length of the list of sequence records.
 
+	If top_k is passed, a third value is returned: out1, out2, out3. out2 is an array of shape
+		(n_records, top_k) with the most probable classes of each record, and out3 the
+		probabilities of those classes (out3[:, 0] is the confidence of each prediction).
+
 	Examples
 	---------
 	
@@ -71,27 +155,565 @@ def classify_records(seq_records, model = dnn_k_four, k = 4, argmax = True):
 	"""
 
 
-	for entry in seq_records:
-		entry['kmer_data'] = KmerFeatures(entry['name'], entry['sequence'], k=k)
+	if top_k != None or fallback_model != None:
+		seq_records, outputs = classify_records(seq_records, model, k, False, canonical, sparse, 
+									keep_kmers, dereplicate, cache, workers, profile = profile)
+		if fallback_model != None:
+			outputs = _cascade(seq_records, outputs, fallback_model, fallback_k or k, threshold, 
+									canonical, sparse, dereplicate, cache, workers, profile)
+		if top_k != None:
+			return (seq_records,) + top_predictions(outputs, top_k)
+		return seq_records, _argmax(outputs, argmax)
 
-	vals = np.array([seq_records[i]['kmer_data'].kmer_freqs for i in range(len(seq_records))])
-	
-	yht_out = model.predict(vals)
+	model = _default_model(model)
 
-	if argmax == True:
-		predictions = np.argmax(yht_out, axis = 1)
+	digests = None
+	if dereplicate == True or cache != None:
+		digests = sequence_digests(seq_records)
+
+	if dereplicate == True:
+		derep = Dereplicator()
+		inverse, unique = derep.add(seq_records, digests)
+		abundance = derep.abundance
 	else:
-		predictions = yht_out
+		inverse = unique = np.arange(len(seq_records))
+
+	#KmerFeatures hold dense counts, which would undo the memory savings of sparse features
+	if isinstance(seq_records, SeqBatch) or cache != None or sparse == True:
+		keep_kmers = False
+	if dereplicate == True and isinstance(seq_records, SeqBatch) == False:
+		for i, entry in enumerate(seq_records):
+			entry['abundance'] = abundance[inverse[i]]
+
+	if cache != None:
+		#only the sequences without a cached prediction are featurized
+		key = cache.model_key(model, k, canonical)
+		unique_digests = [digests[i] for i in unique]
+		found, cached = cache.lookup(key, unique_digests)
+		missing = np.setdiff1d(np.arange(len(unique)), found)
+
+		counts = _count_records(_take(seq_records, unique[missing]), k, canonical, sparse, workers, profile)
+		outputs = _model_outputs(model, count_frequencies(counts), profile)
+		cache.store(key, [unique_digests[i] for i in missing], outputs)
+
+		predictions = _argmax(_merge(len(unique), found, cached, missing, outputs), argmax)
+		return seq_records, predictions[inverse]
+
+	if dereplicate == True:
+		counts = _count_records(_take(seq_records, unique), k, canonical, sparse, workers, profile)
+	else:
+		counts = _count_records(seq_records, k, canonical, sparse, workers, profile)
+
+	if keep_kmers == True:
+		for i, entry in enumerate(seq_records):
+			entry['kmer_data'] = KmerFeatures.from_counts(entry['name'], entry['sequence'], counts[inverse[i]], 
+															k = k, canonical = canonical)
+
+	vals = count_frequencies(counts)
+	
+	predictions = _predict(model, vals, argmax, profile)
+
+	if dereplicate == True:
+		predictions = predictions[inverse]
 		
 	return seq_records, predictions
 
 
+class Dereplicator:
+	"""
+	Track the distinct sequences across a stream of sequence batches.
+
+	Each distinct sequence is assigned an integer id (in order of first appearance), 
+	sequences are identified by their digest (see seqio.sequence_digests), so only 16 bytes
+	are held in memory per distinct sequence. A Dereplicator can be passed to classify_stream, 
+	which then classifies each distinct sequence only once, and records its prediction.
+
+	Attributes
+	---------
+	names : list, the name of the first record with each distinct sequence.
+
+	abundance : list, the number of records with each distinct sequence.
+
+	predictions : numpy.ndarray, the prediction for each distinct sequence classified so far
+		by classify_stream.
+
+	Methods
+	---------
+	add : assign the records of a batch to distinct sequence ids.
+
+	Examples
+	---------
+	>>> from alfie import ex_fastq_file
+	>>> from alfie.seqio import iter_read_batches
+	>>> derep = Dereplicator()
+	>>> for batch, predictions in classify_stream(iter_read_batches(ex_fastq_file), 
+	>>>												dereplicate = derep):
+	>>> 	pass
+	>>> len(derep), sum(derep.abundance)
+	(100, 100)
+	"""
+	def __init__(self):
+		self._ids = {}
+		self.names = []
+		self.abundance = []
+		self._predictions = None
+
+	def __len__(self):
+		return len(self.names)
+
+	def add(self, seq_records, digests = None):
+		"""
+		Assign the records of a batch to distinct sequence ids, and update the abundances.
+
+		Arguments
+		---------
+		seq_records : list or seqio.SeqBatch, a batch of sequence records.
+
+		digests : list, the digests of the sequences, if already computed (see 
+			seqio.sequence_digests). Default is None, the digests are computed.
+
+		Returns
+		---------
+		ids : numpy.ndarray, the distinct sequence id of each record.
+
+		new : numpy.ndarray, the indices of the records that are the first appearance of 
+			their sequence. The ids of these records are the next ids in order.
+		"""
+		names = seq_records.names if isinstance(seq_records, SeqBatch) else \
+					[x['name'] for x in seq_records]
+		ids = np.empty(len(seq_records), dtype = np.int64)
+		new = []
+
+		if digests == None:
+			digests = sequence_digests(seq_records)
+
+		for i, digest in enumerate(digests):
+			seq_id = self._ids.get(digest)
+			if seq_id == None:
+				seq_id = len(self.names)
+				self._ids[digest] = seq_id
+				self.names.append(names[i])
+				self.abundance.append(0)
+				new.append(i)
+			self.abundance[seq_id] += 1
+			ids[i] = seq_id
+
+		return ids, np.array(new, dtype = np.int64)
+
+	@property
+	def predictions(self):
+		if self._predictions is None:
+			return np.zeros(0)
+		return self._predictions[:self._n_predictions]
+
+	def _add_predictions(self, predictions):
+		"""Append the predictions for the next distinct sequences, growing the storage as needed."""
+		if self._predictions is None:
+			self._predictions = np.zeros((max(len(predictions), 1024),) + predictions.shape[1:], 
+											dtype = predictions.dtype)
+			self._n_predictions = 0
+
+		end = self._n_predictions + len(predictions)
+		if end > len(self._predictions):
+			grown = np.zeros((max(end, 2 * len(self._predictions)),) + self._predictions.shape[1:], 
+								dtype = self._predictions.dtype)
+			grown[:self._n_predictions] = self._predictions[:self._n_predictions]
+			self._predictions = grown
+
+		self._predictions[self._n_predictions:end] = predictions
+		self._n_predictions = end
+
+
+def dereplicate(seq_records):
+	"""
+	Find the distinct sequences of a batch, and the number of copies of each.
+
+	Arguments
+	---------
+	seq_records : list or seqio.SeqBatch, a batch of sequence records.
+
+	Returns
+	---------
+	unique : numpy.ndarray, the index of the first record with each distinct sequence.
+
+	inverse : numpy.ndarray, for each record, the index in unique of its sequence. 
+		So values computed for the unique records can be copied to all records with values[inverse].
+
+	abundance : numpy.ndarray, the number of records with each distinct sequence.
+
+	Examples
+	---------
+	>>> records = [{'name' : 'a', 'sequence' : 'ATGC'}, {'name' : 'b', 'sequence' : 'GGGG'}, 
+	>>>				{'name' : 'c', 'sequence' : 'atgc'}]
+	>>> dereplicate(records)
+	(array([0, 1]), array([0, 1, 0]), array([2, 1]))
+	"""
+	derep = Dereplicator()
+	inverse, unique = derep.add(seq_records)
+	return unique, inverse, np.array(derep.abundance, dtype = np.int64)
+
+
+def _take(seq_records, indices):
+	"""Subset a SeqBatch or a list of sequence records."""
+	if isinstance(seq_records, SeqBatch):
+		return seq_records.take(indices)
+	return [seq_records[i] for i in indices]
+
+
+def _default_model(model):
+	"""Return the model, or the pre-trained kingdom-level model if model is None."""
+	if model == None:
+		from alfie import dnn_k_four
+		return dnn_k_four
+	return model
+
+
+def _n_bytes(seq_records):
+	"""The number of sequence bytes in a SeqBatch or a list of sequence records."""
+	if isinstance(seq_records, SeqBatch):
+		return len(seq_records.buffer)
+	return sum(len(entry['sequence']) for entry in seq_records)
+
+
+def _count_records(seq_records, k, canonical, sparse, workers = 1, profile = None):
+	"""Count the k-mers of a SeqBatch or a list of sequence records."""
+	n_bytes = _n_bytes(seq_records) if profile != None else 0
+	with timed(profile, "featurize", len(seq_records), n_bytes):
+		if isinstance(seq_records, SeqBatch):
+			return kmer_counts(seq_records.buffer, offsets = seq_records.offsets,
+								k = k, canonical = canonical, sparse = sparse, workers = workers)
+		return kmer_counts([entry['sequence'] for entry in seq_records], 
+								k = k, canonical = canonical, sparse = sparse, workers = workers)
+
+
+def _predict(model, vals, argmax, profile = None):
+	"""Run the model on a feature matrix, optionally taking the argmax of the outputs."""
+	with timed(profile, "predict", vals.shape[0], vals.data.nbytes if sp.issparse(vals) else vals.nbytes):
+		yht_out = _model_predict(model, vals)
+
+	if argmax == True:
+		return np.argmax(yht_out, axis = 1)
+	return yht_out
+
+
+def _model_outputs(model, vals, profile = None):
+	"""Run the model on a feature matrix, which may have no rows."""
+	if vals.shape[0] == 0:
+		return np.zeros(0)
+	with timed(profile, "predict", vals.shape[0], vals.data.nbytes if sp.issparse(vals) else vals.nbytes):
+		return _model_predict(model, vals)
+
+
+def _model_predict(model, vals):
+	"""Run model.predict, holding the prediction lock unless the model is a (thread safe) NumpyModel."""
+	if isinstance(model, NumpyModel):
+		return model.predict(vals)
+	with _PREDICT_LOCK:
+		return model.predict(vals)
+
+
+def _argmax(yht_out, argmax):
+	"""Optionally take the argmax of the model outputs."""
+	if argmax == True:
+		if len(yht_out) == 0:
+			return np.zeros(0, dtype = np.int64)
+		return np.argmax(yht_out, axis = 1)
+	return yht_out
+
+
+def _cascade(seq_records, outputs, fallback_model, fallback_k, threshold, canonical, sparse,
+				derep, cache, workers, profile = None):
+	"""Reclassify the records whose top class probability is below threshold with the fallback model."""
+	if len(outputs) == 0:
+		return outputs
+	low = np.flatnonzero(outputs.max(axis = 1) < threshold)
+	if len(low) == 0:
+		return outputs
+
+	records = _take(seq_records, low)
+	inverse = np.arange(len(low))
+	if derep == True:
+		unique, inverse, _ = dereplicate(records)
+		records = _take(records, unique)
+
+	_, fallback_outputs = classify_records(records, fallback_model, fallback_k, False, canonical,
+									sparse, keep_kmers = False, cache = cache, workers = workers, 
+									profile = profile)
+	if fallback_outputs.shape[1:] != outputs.shape[1:]:
+		raise ValueError("The fallback model must output probabilities for the same classes as the model.")
+
+	outputs = outputs.copy()
+	outputs[low] = fallback_outputs[inverse]
+	return outputs
+
+
+def _merge(n, found, cached, missing, outputs):
+	"""Combine the cached and the newly computed model outputs of n records."""
+	if n == 0:
+		return np.zeros(0)
+	template = outputs if len(missing) > 0 else cached
+	merged = np.zeros((n,) + template.shape[1:], dtype = template.dtype)
+	if len(found) > 0:
+		merged[found] = cached
+	if len(missing) > 0:
+		merged[missing] = outputs
+	return merged
+
+
+class _Stop(Exception):
+	"""Raised inside a pipeline stage when the consumer has stopped the pipeline."""
+
+
+def _put(q, item, stop):
+	"""Put an item on a bounded queue, giving up if the pipeline is stopped."""
+	while not stop.is_set():
+		try:
+			q.put(item, timeout = 0.1)
+			return
+		except queue.Full:
+			pass
+	raise _Stop()
+
+
+def _get(q, stop):
+	"""Get an item from a queue, giving up if the pipeline is stopped."""
+	while not stop.is_set():
+		try:
+			return q.get(timeout = 0.1)
+		except queue.Empty:
+			pass
+	raise _Stop()
+
+
+def _stage(target, out_q, stop):
+	"""Run a pipeline stage on a thread, passing any error on to the next stage."""
+	def run():
+		try:
+			target()
+		except _Stop:
+			pass
+		except BaseException as e:
+			try:
+				_put(out_q, e, stop)
+			except _Stop:
+				pass
+	thread = threading.Thread(target = run, daemon = True)
+	thread.start()
+	return thread
+
+
+def classify_stream(batches, model = None, k = 4, argmax = True, canonical = False,
+						sparse = False, threads = 2, predict_size = 50000, queue_size = 4,
+						dereplicate = None, cache = None, workers = 1, top_k = None,
+						fallback_model = None, fallback_k = None, threshold = 0.9, profile = None):
+	"""
+	Classify a stream of sequence batches, with the read, featurize and predict stages overlapped.
+
+	The stages of classification run concurrently, connected by bounded queues:
+	a reader thread pulls batches from the input iterable (i.e. parsing the input file), 
+	a pool of featurizer threads generates the k-mer frequencies of each batch, and a predict 
+	thread accumulates features until at least predict_size records are available, so the 
+	model is run on large batches. The results are yielded in input order, so the caller 
+	(i.e. an output writer) also runs concurrently with the other stages. The bounded queues 
+	limit the number of batches held in memory at any one time.
+
+	Arguments
+	---------
+	batches : iterable, the sequence batches to classify. Each batch is a list of sequence records
+		or a seqio.SeqBatch, as yielded by seqio.iter_read_fasta, seqio.iter_read_fastq or 
+		seqio.iter_read_batches.
+
+	model : tensorflow_model or scikit learn model. See classify_records.
+
+	k : int, the kmer input feature sizes corresponding to the model being used. Default is 4.
+
+	argmax : bool, see classify_records. Default is True.
+
+	canonical : bool, see classify_records. Default is False.
+
+	sparse : bool, see classify_records. Default is False.
+
+	threads : int, the number of featurizer threads. Default is 2.
+
+	predict_size : int, the minimum number of records passed to each call of model.predict 
+		(except for the final call). Default is 50000.
+
+	queue_size : int, the number of batches buffered between each of the stages. Default is 4.
+
+	dereplicate : Dereplicator or bool, should each distinct sequence in the stream be featurized 
+		and classified only once. Sequences seen in an earlier batch are not featurized again, their
+		prediction is copied. Pass a Dereplicator to access the abundance of each distinct sequence
+		once the stream is consumed, or True to use an internal one. Default is None (no 
+		dereplication).
+
+	cache : alfie.cache.PredictionCache, a cache of predictions to consult before featurizing,
+		see classify_records. Default is None (no cache).
+
+	workers : int, the number of processes used to count the k-mers of each batch, shared by the
+		featurizer threads (see kmerseq.kmer_counts). Default is 1 (count in the featurizer threads).
+
+	top_k : int, yield the top_k most probable classes of each record and their probabilities
+		(see classify_records). Default is None.
+
+	fallback_model, fallback_k, threshold : a second model for a confidence-gated cascade, see 
+		classify_records. The low confidence records of each batch are reclassified in the predict
+		stage. Default is None (no cascade).
+
+	profile : alfie.profiling.Profile, records the time, records and bytes of the parse (reading
+		batches from the input iterable), featurize and predict stages. Default is None.
+
+	Returns
+	---------
+	out : generator, yields a (batch, predictions) tuple for each input batch, in input order.
+		The batches are not altered (no 'kmer_data' is added to the records). If top_k is
+		passed, a (batch, classes, probabilities) tuple is yielded for each batch.
+
+	Examples
+	---------
+	>>> from alfie import ex_fastq_file
+	>>> from alfie.seqio import iter_read_batches
+	>>> for batch, predictions in classify_stream(iter_read_batches(ex_fastq_file, batch = 10)):
+	>>> 	print(len(batch), predictions[:3])
+	"""
+	if top_k != None:
+		stream = classify_stream(batches, model, k, False, canonical, sparse, threads, predict_size,
+									queue_size, dereplicate, cache, workers, None, 
+									fallback_model, fallback_k, threshold, profile)
+		with closing(stream):
+			for batch, outputs in stream:
+				yield (batch,) + top_predictions(outputs, top_k)
+		return
+
+	model = _default_model(model)
+
+	derep = Dereplicator() if dereplicate is True else dereplicate
+	if derep is False:
+		derep = None
+	if cache != None:
+		key = cache.model_key(model, k, canonical)
+
+	stop = threading.Event()
+	done = object()
+	read_q = queue.Queue(queue_size)
+	feature_q = queue.Queue(queue_size)
+	out_q = queue.Queue(queue_size)
+
+	def read():
+		batches_iter = iter(batches)
+		while True:
+			start = time.perf_counter()
+			batch = next(batches_iter, done)
+			if batch is done:
+				break
+			if profile != None:
+				profile.add("parse", time.perf_counter() - start, len(batch), _n_bytes(batch))
+			_put(read_q, batch, stop)
+		_put(read_q, done, stop)
+
+	def featurize(batch):
+		return count_frequencies(_count_records(batch, k, canonical, sparse, workers, profile))
+
+	def dispatch():
+		#submit batches to the featurizer pool, the futures are queued in input order
+		with ThreadPoolExecutor(threads) as pool:
+			while True:
+				batch = _get(read_q, stop)
+				if batch is done or isinstance(batch, BaseException):
+					_put(feature_q, batch, stop)
+					return
+
+				digests = sequence_digests(batch) if derep != None or cache != None else None
+				ids = None
+				work = np.arange(len(batch))
+				if derep != None:
+					#only the first appearance of each sequence is featurized
+					ids, work = derep.add(batch, digests)
+				classified = work
+
+				lookup = None
+				if cache != None:
+					#only the sequences without a cached prediction are featurized
+					work_digests = [digests[i] for i in work]
+					found, cached = cache.lookup(key, work_digests)
+					missing = np.setdiff1d(np.arange(len(work)), found)
+					lookup = (len(work), found, cached, missing, [work_digests[i] for i in missing])
+					work = work[missing]
+
+				subset = batch if len(work) == len(batch) else _take(batch, work)
+				_put(feature_q, (batch, pool.submit(featurize, subset), ids, lookup, classified), stop)
+
+	def predict():
+		pending = []
+		n_pending = 0
+		while True:
+			item = _get(feature_q, stop)
+			if isinstance(item, BaseException):
+				raise item
+			if item is not done:
+				batch, future, ids, lookup, classified = item
+				pending.append((batch, future.result(), ids, lookup, classified))
+				n_pending += len(batch)
+
+			if pending and (item is done or n_pending >= predict_size):
+				if sparse == True:
+					vals = sp.vstack([x[1] for x in pending], format = 'csr')
+				else:
+					vals = np.concatenate([x[1] for x in pending])
+				outputs = _model_outputs(model, vals, profile)
+
+				start = 0
+				for batch, features, ids, lookup, classified in pending:
+					batch_outputs = outputs[start:start + features.shape[0]]
+					start += features.shape[0]
+
+					if lookup != None:
+						n_work, found, cached, missing, missing_digests = lookup
+						cache.store(key, missing_digests, batch_outputs)
+						batch_outputs = _merge(n_work, found, cached, missing, batch_outputs)
+
+					if fallback_model != None:
+						records = batch if len(classified) == len(batch) else _take(batch, classified)
+						batch_outputs = _cascade(records, batch_outputs, fallback_model, fallback_k or k, 
+									threshold, canonical, sparse, False, cache, workers, profile)
+
+					predictions = _argmax(batch_outputs, argmax)
+					if derep != None:
+						if len(predictions) > 0:
+							derep._add_predictions(predictions)
+						predictions = derep.predictions[ids]
+
+					_put(out_q, (batch, predictions), stop)
+				pending = []
+				n_pending = 0
+
+			if item is done:
+				_put(out_q, done, stop)
+				return
+
+	stages = [_stage(read, read_q, stop), 
+				_stage(dispatch, feature_q, stop), 
+				_stage(predict, out_q, stop)]
+	try:
+		while True:
+			item = out_q.get()
+			if item is done:
+				return
+			if isinstance(item, BaseException):
+				raise item
+			yield item
+	finally:
+		stop.set()
+		for x in stages:
+			x.join()
+
+
 def decode_predictions(predictions,
 						tax_list = ["animalia","bacteria","fungi","plantae","protista",]):
 	"""
 	Decode numeric predictions to strings.
 
-	Take in an array of numeric predictions from classify_records() and 
+	Take in an array of numeric predictions from classify_records() and decode them with a
+	vectorized lookup in an array of the labels.
 
 	Default decoding to kingdom. A custom tax_list with the classifications corresponding
 	to a custom neural network's numeric precidions can be procided as well.
@@ -101,14 +723,15 @@ def decode_predictions(predictions,
 	
 	Arguments
 	---------
-	predictions : list like object, a list of numeric encoded predictions.
+	predictions : list like object, a list of numeric encoded predictions. A 2d array 
+		(i.e. the top-k classes from top_predictions) is decoded row by row.
 
 	tax_list : list, a list of strings indicating what the numeric predictions should
 		be decoded to. By default kingdom labels are utilized.
 
 	Returns
 	---------
-		out : list, a list of decoded strings.
+		out : list, a list of decoded strings (a list of lists for 2d input).
 	
 	Examples
 	---------
@@ -122,11 +745,49 @@ def decode_predictions(predictions,
 	>>> predicted_kingdoms[:5]
 	['plantae', 'bacteria', 'protista', 'animalia', 'animalia']
 	"""
-	class_dict = {}
-	for i, x in enumerate(tax_list):
-		class_dict[i] = x
+	predictions = np.asarray(predictions, dtype = np.int64)
+	if predictions.size > 0 and predictions.min() < 0:
+		raise IndexError("Negative class encodings cannot be decoded.")
+
+	return np.asarray(tax_list, dtype = object)[predictions].tolist()
+
+
+def top_predictions(outputs, top_k = 1):
+	"""
+	Find the top-k classes of each record, and their probabilities.
+
+	Arguments
+	---------
+	outputs : numpy.ndarray, the model outputs (class probabilities), one row per record. 
+		As returned by classify_records with argmax = False.
 
-	outpred = [class_dict[i] for i in predictions]
+	top_k : int, the number of classes returned per record. Default is 1.
 
-	return outpred
+	Returns
+	---------
+	classes : numpy.ndarray, an array of shape (n_records, top_k) with the numeric encoded classes
+		of each record, from most to least probable. The first column matches the argmax predictions.
+
+	probabilities : numpy.ndarray, the probabilities of the classes, the first column is 
+		the confidence of the prediction.
+
+	Examples
+	---------
+	>>> from alfie import example_fasta
+	>>> seq_records, outputs = classify_records(example_fasta, argmax = False)
+	>>> classes, probabilities = top_predictions(outputs, top_k = 2)
+	>>> decode_predictions(classes)[:2]
+	[['plantae', 'protista'], ['bacteria', 'plantae']]
+	"""
+	outputs = np.asarray(outputs)
+	if outputs.ndim != 2:
+		raise ValueError("The model outputs must be a 2d array of class probabilities.")
+
+	top_k = min(top_k, outputs.shape[1])
+	if top_k == 1:
+		classes = np.argmax(outputs, axis = 1)[:, None]
+	else:
+		#stable, so ties are broken as np.argmax does
+		classes = np.argsort(-outputs, axis = 1, kind = 'stable')[:, :top_k]
 
+	return classes, np.take_along_axis(outputs, classes, axis = 1)
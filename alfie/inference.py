@@ -0,0 +1,176 @@
+"""
+A module for running dense neural networks with numpy, without tensorflow.
+
+The neural networks used by alfie (the pre-trained kingdom-level classifier, and the networks
+built by alfie.training.alfie_dnn_default) are a stack of Dense layers, with Dropout layers that
+are inactive at prediction time. The weights of such a network can be exported to a numpy .npz
+file, and the network evaluated with a float32 forward pass in numpy. This avoids the time taken
+to import tensorflow and the overhead of the Keras predict method, and allows classification on
+machines where tensorflow is not installed.
+
+==========
+Classes
+==========
+
+NumpyModel : A dense neural network evaluated with numpy.
+
+==========
+Functions
+==========
+
+export_weights : Export the weights of a tensorflow Sequential dense network to a numpy .npz file.
+
+"""
+import numpy as np
+import scipy.sparse as sp
+
+
+def _relu(x):
+	return np.maximum(x, 0, out = x)
+
+def _softmax(x):
+	x -= x.max(axis = 1, keepdims = True)
+	np.exp(x, out = x)
+	x /= x.sum(axis = 1, keepdims = True)
+	return x
+
+def _sigmoid(x):
+	return 1 / (1 + np.exp(-x))
+
+# activation functions supported by NumpyModel, keyed by their keras names
+_ACTIVATIONS = {"relu" : _relu,
+				"softmax" : _softmax,
+				"sigmoid" : _sigmoid,
+				"tanh" : np.tanh,
+				"linear" : lambda x : x}
+
+
+def export_weights(model, filename):
+	"""
+	Export the weights of a tensorflow Sequential dense network to a numpy .npz file.
+
+	Dense layers are exported with their weights, biases and activation function. Dropout layers
+	have no effect at prediction time and are skipped. Any other layer type raises a ValueError.
+
+	Arguments
+	---------
+	model : a tensorflow Sequential neural network, i.e. one built with
+		alfie.training.alfie_dnn_default.
+
+	filename : str, the path of the output file, should have the extension '.npz'.
+
+	Returns
+	---------
+	out : No return, data written to file.
+
+	Examples
+	---------
+	>>> from alfie import dnn_k_four
+	>>> export_weights(dnn_k_four, "dnn_model_4mers.npz")
+	>>> numpy_model = NumpyModel.load("dnn_model_4mers.npz")
+	"""
+	arrays = {}
+	n_layers = 0
+
+	for layer in model.layers:
+		layer_type = type(layer).__name__
+
+		if layer_type == "Dropout":
+			continue
+		if layer_type != "Dense":
+			raise ValueError(f"Layers of type {layer_type} cannot be exported, " +\
+				"only Dense and Dropout layers are supported.")
+
+		activation = layer.get_config()["activation"]
+		if activation not in _ACTIVATIONS:
+			raise ValueError(f"The activation function {activation} is not supported.")
+
+		weights, bias = layer.get_weights()
+		arrays[f"weights_{n_layers}"] = weights.astype(np.float32)
+		arrays[f"bias_{n_layers}"] = bias.astype(np.float32)
+		arrays[f"activation_{n_layers}"] = np.array(activation)
+		n_layers += 1
+
+	np.savez(filename, n_layers = n_layers, **arrays)
+
+
+class NumpyModel:
+	"""
+	A dense neural network evaluated with numpy.
+
+	The predict method matches the predict method of the exported tensorflow model
+	(within float32 rounding error), so a NumpyModel can be passed as the model to
+	alfie.classify.classify_records, or used with the alfie command line interface (-m flag).
+
+	Attributes
+	---------
+	weights : list, the float32 weight matrix of each dense layer.
+
+	biases : list, the float32 bias vector of each dense layer.
+
+	activations : list, the name of the activation function of each dense layer. One of: relu,
+		softmax, sigmoid, tanh or linear.
+
+	Methods
+	---------
+	load : build a NumpyModel from a file written by export_weights.
+
+	predict : run the forward pass of the network on a feature matrix.
+
+	Examples
+	---------
+	>>> from alfie import fourmer_numpy_file, example_fasta
+	>>> from alfie.classify import classify_records
+	>>> numpy_model = NumpyModel.load(fourmer_numpy_file)
+	>>> seq_records, predictions = classify_records(example_fasta, model = numpy_model)
+	"""
+	def __init__(self, weights, biases, activations):
+		if not len(weights) == len(biases) == len(activations):
+			raise ValueError("There must be a weight matrix, bias vector and activation per layer.")
+		for x in activations:
+			if x not in _ACTIVATIONS:
+				raise ValueError(f"The activation function {x} is not supported.")
+
+		self.weights = [np.asarray(x, dtype = np.float32) for x in weights]
+		self.biases = [np.asarray(x, dtype = np.float32) for x in biases]
+		self.activations = list(activations)
+
+	@classmethod
+	def load(cls, filename):
+		"""Build a NumpyModel from a file written by export_weights."""
+		with np.load(filename) as data:
+			n_layers = int(data["n_layers"])
+			return cls([data[f"weights_{i}"] for i in range(n_layers)],
+						[data[f"bias_{i}"] for i in range(n_layers)],
+						[str(data[f"activation_{i}"]) for i in range(n_layers)])
+
+	def predict(self, x, batch_size = 65536):
+		"""
+		Run the forward pass of the network on a feature matrix.
+
+		Arguments
+		---------
+		x : numpy.ndarray or scipy.sparse matrix, the input features, one row per observation.
+
+		batch_size : int, the number of rows evaluated at a time, this bounds the memory used
+			by the intermediate layers. Default is 65536.
+
+		Returns
+		---------
+		out : numpy.ndarray, a float32 array with the output of the final layer.
+		"""
+		out = np.zeros((x.shape[0], self.biases[-1].shape[0]), dtype = np.float32)
+
+		for start in range(0, x.shape[0], batch_size):
+			h = x[start:start + batch_size]
+			if sp.issparse(h) == False:
+				h = np.asarray(h, dtype = np.float32)
+
+			for weights, bias, activation in zip(self.weights, self.biases, self.activations):
+				h = np.asarray(h @ weights, dtype = np.float32)
+				h += bias
+				h = _ACTIVATIONS[activation](h)
+
+			out[start:start + batch_size] = h
+
+		return out
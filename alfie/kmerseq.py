@@ -1,5 +1,5 @@
 """
-Module containing the KmerFeatures class.
+Module containing the KmerFeatures class and batch k-mer featurization functions.
 
 ==========
 Classes
@@ -7,41 +7,124 @@ Classes
 
 KmerFeatures : A class to represent a DNA sequence and derive kmer measurements.
 
+==========
+Functions
+==========
+
+encode_sequences : Concatenate a list of sequences into a single byte buffer with record offsets.
+
+kmer_counts : Count the k-mers of a batch of sequences, returning a count matrix.
+
+kmer_frequencies : Generate the k-mer frequencies of a batch of sequences, returning a feature matrix.
+
+window_kmer_counts : Count the k-mers of many windows of a batch of sequences, from prefix counts.
+
+count_frequencies : Convert a k-mer count matrix to frequencies.
+
+multi_kmer_counts : Count the k-mers of a batch of sequences for several values of k in a single pass.
+
+multi_kmer_frequencies : Generate the k-mer frequencies of a batch of sequences for several values of k in a single pass.
+
+kmer_labels : Return the array of all k-mer labels of size k, in alphabetical order.
+
+n_kmer_features : Return the number of k-mer features for size k.
+
 """
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import numpy as np
+import scipy.sparse as sp
+
+# k-mer label tables, built on first use for each k. See: kmer_labels
+_LABELS = {}
+
+# process pools for parallel featurization, keyed by the number of workers. See: _worker_pool
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# the minimum number of records featurized by each task of the process pool, smaller
+# inputs are featurized in the calling process
+_MIN_TASK_RECORDS = 1000
+
+# the approximate number of bases counted at a time, the rolling k-mer indices
+# take around 50 bytes per base. See: _record_blocks
+_BLOCK_BASES = 1 << 20
+
+# the maximum number of cells (rows * k-mers) of a temporary count matrix, the int64
+# bincount takes 8 bytes per cell. See: _record_blocks and window_kmer_counts
+_BLOCK_CELLS = 1 << 22
+
+# canonical k-mer index permutations, built on first use for each k. See: _canonical_map
+_CANONICAL = {}
+
+# lookup table for the 2-bit nucleotide encoding, indexed by ascii code.
+# A, C, G, T -> 0, 1, 2, 3; N and - are skipped (4); everything else is unallowed (5)
+_NT_CODES = np.full(256, 5, dtype = np.uint8)
+for _i, _nt in enumerate("ACGT"):
+	_NT_CODES[ord(_nt)] = _i
+	_NT_CODES[ord(_nt.lower())] = _i
+for _nt in "Nn-":
+	_NT_CODES[ord(_nt)] = 4
+
 
 class KmerFeatures:
 	"""
 	A class to represent a DNA sequence and derive kmer measurements.
 
+	Counts are stored in a single integer array, in alphabetical k-mer order. The k-mer labels
+	for each value of k are built once and shared by all instances (see kmer_labels).
+
+	In canonical mode each k-mer is counted together with its reverse complement, under the
+	alphabetically smaller of the two labels. This makes the counts independent of the
+	orientation of the sequence and reduces the number of features by almost half.
+
 	Attributes
 	---------
 	name : str, the identifier for the sequence.
 
 	k : int, the size of k-mers (substrings of length k) to count. Default is 4.
 	
+	canonical : bool, should k-mers and their reverse complements be counted as a single 
+		canonical k-mer. Default is False.
+
 	sequence : str, the nucleotide sequence to generate k-mer counts from. Only counted characters 
 		in input are: A, C, G, T. The chatacters N and - are also permitted, but all substrings containing
 		these characters are not counted. Presence of any other characters will produce an error.
 	
+	counts : numpy.ndarray, the counts of the different k-mers. Count order corresponds to the
+		order of the labels.
+
 	labels : numpy.ndarray, the different k-mers for the given size of k. Order of k-mers
 		is alphabetical and the labels order corresponds to the order of the kmer_freqs values. 
+		The array is shared by all instances, and read-only.
 	
 	kmer_freqs : numpy.ndarray, the frequencies of the different k-mers. Frequency order
-		corresponds to the order of the labels.
+		corresponds to the order of the labels. The array is computed once and read-only, 
+		use freq_values for an array that can be modified.
+
+	k_dict : dict, the k-mer counts in dictionary format, keys are the k-mer labels. A new
+		dictionary is built from counts on each access, so editing it does not change the 
+		counts (modify counts instead).
 
 	Methods
 	---------
 	init : takes in a name, sequence, and k value and generates kmer counts and frequency data.
 
+	from_counts : build an instance from precomputed k-mer counts, without recounting.
+
 	keys : list, the different k-mers for the given size of k. Order of k-mers
 		is alphabetical and the labels order corresponds to the order of the kmer_freqs values. 
 	
 	values : list, the counts of the different kmers
 
-	freq_values : the frequencies of the different kmers. Calculated as count/total number
-		of recorded kmers. Note this means that any substrings with "N" or "-" in them do
-		not contribute to the denominator
+	freq_values : the frequencies of the different kmers, as a new (writable) array. Calculated 
+		as count/total number of recorded kmers. Note this means that any substrings with "N" 
+		or "-" in them do not contribute to the denominator
  	
 	items : list, the (key, value) pairs of kmer counts. 
 	
@@ -75,17 +158,30 @@ class KmerFeatures:
 	>>> ex_inst.change_k(2)
 	>>> ex_inst.items()
 	"""
-	def __init__(self, name, sequence, k = 4):
+	__slots__ = ("name", "k", "canonical", "seq", "counts", "_freqs")
+
+	def __init__(self, name, sequence, k = 4, canonical = False):
 
 		self.name = name
-		self.k = k
+		self.canonical = canonical
 		
 		up_seq = sequence.upper()
 		if self.__check_seq(up_seq) == True:
 			self.seq = up_seq
 
-		self.k_dict = self.__kmer_dict(k = self.k)
-		self.__count_kmers()
+		self.change_k(k)
+
+	@classmethod
+	def from_counts(cls, name, sequence, counts, k = 4, canonical = False):
+		"""Build an instance from precomputed k-mer counts (i.e. a row of kmer_counts)."""
+		new = cls.__new__(cls)
+		new.name = name
+		new.seq = sequence.upper()
+		new.k = k
+		new.canonical = canonical
+		new.counts = counts
+		new._freqs = None
+		return new
 
 	def __check_seq(self, seq):
 		"""Check the input sequence for invalid characters."""
@@ -96,75 +192,706 @@ class KmerFeatures:
 			raise ValueError("Unallowed characters in input sequence")
 		return True		
 
-	def __kmer_build(self, k = 4, dna_list = ["A", "C", "G", "T"]):
-		"""Recursive construction of all nucleotide kmer combinations."""
-		
-		# all the nucleotides to be appended to new kmers
-		# note - doing this in alpha order, so keys are pre-sorted
-		nts = ['A', 'C', 'G', 'T']
-		#decrement k
-		k -= 1
-
-		if k == 0:
-			return dna_list
-		
-		else:
-			new_dna_list = []
-
-			for kmer in dna_list:
-				for n in nts:
-					new = kmer + n
-					new_dna_list.append(new)
-			return self.__kmer_build(k, new_dna_list)
-
-	def __kmer_dict(self, k = 4):
-		"""Build an dictionary of all string combos for size k, values all 0. """
-		return {k : 0 for k in self.__kmer_build(k)}
-
 	def change_k(self, k, count = True):
-		"""Reset k and by default populate the new dictionary. """
+		"""Reset k and by default count the k-mers of the new size. """
 		#override existing k
 		self.k = k
-		#build a new empty dictonary
-		self.k_dict = self.__kmer_dict(self.k)
+		self._freqs = None
 
 		if count == True:
-			self.__count_kmers()
-
-	def __count_kmers(self):
-		"""Iterate across a the dna string and count the kmer occurances."""
-		for i in range(len(self.seq)-(self.k-1)):
-			subseq = self.seq[i:i+self.k]
+			self.counts = kmer_counts([self.seq], k = self.k, canonical = self.canonical)[0]
+		else:
+			self.counts = np.zeros(n_kmer_features(self.k, self.canonical), dtype = np.int32)
 
-			if ("N" not in subseq) and ("-" not in subseq):
-				self.k_dict[subseq] +=1
+	@property
+	def k_dict(self):
+		"""A new dictionary of the kmer counts, keyed by kmer. Edits do not change the counts."""
+		return dict(self.items())
 
 	def keys(self):
 		"""Returns a list of the kmer keys, in sorted alphabetical order."""
-		return [k for k , v in sorted(self.k_dict.items())]
+		return self.labels.tolist()
 
 	def values(self):
 		"""A list of the kmer count values, maps to keys in alphabetical order."""
-		return [v for k , v in sorted(self.k_dict.items())]
+		return self.counts.tolist()
 
 	def freq_values(self):
-		"""Returns an array of kmer frequencies. """
-		vals = np.array(self.values())
-		total_count = sum(vals)
-		if total_count == 0:
-			return vals
-		return vals/total_count 
+		"""Returns a new array of kmer frequencies, which can be modified in place. """
+		return self.kmer_freqs.copy()
 
 	def items(self):
-		return [(k, v) for k, v in sorted(self.k_dict.items())]
+		return list(zip(self.keys(), self.values()))
 
 	@property
 	def labels(self):
 		"""The string labels of the kmer frequencies."""
-		return np.array(self.keys())
+		return kmer_labels(self.k, self.canonical)
 
 	@property
 	def kmer_freqs(self):
-		"""A numpy array of kmer frequency values."""
-		return np.array(self.freq_values())
+		"""A read-only numpy array of kmer frequency values, computed once."""
+		if self._freqs is None:
+			self._freqs = count_frequencies(self.counts[np.newaxis, :], dtype = np.float64)[0]
+			self._freqs.flags.writeable = False
+		return self._freqs
+
+
+def kmer_labels(k = 4, canonical = False):
+	"""
+	Return the array of all k-mer labels of size k, in alphabetical order.
+
+	The table for each k is built once and shared by every caller, it is read-only.
+	If canonical is True, only the canonical k-mers (the alphabetically smaller of each
+	k-mer and its reverse complement) are returned.
+
+	Examples
+	---------
+	>>> kmer_labels(2)[:4]
+	array(['AA', 'AC', 'AG', 'AT'], dtype='<U2')
+	>>> kmer_labels(1, canonical = True)
+	array(['A', 'C'], dtype='<U1')
+	"""
+	if (k, canonical) not in _LABELS:
+		if canonical == True:
+			labels = kmer_labels(k)[_canonical_map(k)[1]]
+		else:
+			labels = np.array(["".join(x) for x in itertools.product("ACGT", repeat = k)])
+		labels.flags.writeable = False
+		_LABELS[(k, canonical)] = labels
+	return _LABELS[(k, canonical)]
+
+
+def n_kmer_features(k = 4, canonical = False):
+	"""
+	Return the number of k-mer features for size k.
+
+	This is the input shape of a model trained on k-mer frequencies, i.e. the in_shape
+	argument of alfie.training.alfie_dnn_default.
+
+	Examples
+	---------
+	>>> n_kmer_features(4)
+	256
+	>>> n_kmer_features(4, canonical = True)
+	136
+	"""
+	if canonical == True:
+		return len(_canonical_map(k)[1])
+	return 4 ** k
+
+
+def _canonical_map(k):
+	"""
+	Return the canonical column of every k-mer index, the index of every canonical k-mer and 
+	the reverse complement index of every k-mer index.
+	"""
+	if k not in _CANONICAL:
+		idx = np.arange(4 ** k, dtype = np.int64)
+		#complement is 3 - code, the reverse complement reads the codes back to front
+		rc_idx = np.zeros(4 ** k, dtype = np.int64)
+		remaining = idx.copy()
+		for j in range(k):
+			rc_idx <<= 2
+			rc_idx |= 3 - (remaining & 3)
+			remaining >>= 2
+		canonical_idx, columns = np.unique(np.minimum(idx, rc_idx), return_inverse = True)
+		_CANONICAL[k] = (columns, canonical_idx, rc_idx)
+	return _CANONICAL[k]
+
+
+def _fold_canonical(counts, k):
+	"""Sum the columns of a full k-mer count matrix into canonical k-mer columns."""
+	columns, canonical_idx, rc_idx = _canonical_map(k)
+	folded = counts[:, canonical_idx].copy()
+	#palindromic k-mers are their own reverse complement, only count them once
+	not_palindrome = rc_idx[canonical_idx] != canonical_idx
+	folded[:, not_palindrome] += counts[:, rc_idx[canonical_idx][not_palindrome]]
+	return folded
+
+
+def encode_sequences(sequences):
+	"""
+	Concatenate a list of sequences into a single byte buffer with record offsets.
+
+	Arguments
+	---------
+	sequences : list, a list of DNA sequence strings.
+
+	Returns
+	---------
+	out1, out2 : (numpy.ndarray, numpy.ndarray) out1 is a uint8 array with the ascii codes of
+		all the sequences, back to back. out2 is an int64 array of length len(sequences) + 1,
+		sequence i occupies out1[out2[i]:out2[i+1]].
+
+	Examples
+	---------
+	>>> buffer, offsets = encode_sequences(["ACGT", "AAN"])
+	>>> offsets
+	array([0, 4, 7])
+	"""
+	offsets = np.zeros(len(sequences) + 1, dtype = np.int64)
+	np.cumsum([len(s) for s in sequences], out = offsets[1:])
+
+	try:
+		buffer = np.frombuffer("".join(sequences).encode("ascii"), dtype = np.uint8)
+	except UnicodeEncodeError:
+		raise ValueError("Unallowed characters in input sequence")
+
+	return buffer, offsets
+
+
+def _two_bit(buffer):
+	"""Translate an ascii sequence buffer to 2-bit nucleotide codes (4 marks N and -)."""
+	codes = _NT_CODES[buffer]
+	if np.any(codes == 5):
+		raise ValueError("Unallowed characters in input sequence")
+	return codes
+
+
+def _kmer_positions(buffer, offsets, k):
+	"""
+	Return the record number, k-mer index and valid run length of every position in the buffer.
+
+	The run length is the number of consecutive A/C/G/T bases starting at the position,
+	within its record, capped at k. A window of size j <= k starting at the position is
+	countable if the run length is >= j, its index is the k-mer index shifted right by 2*(k-j).
+	"""
+	codes = _two_bit(buffer)
+	n_pos = len(codes)
+	n_records = len(offsets) - 1
+
+	#rolling k-mer index, the first base is the most significant so the
+	#index order matches the alphabetical order of the k-mer labels.
+	#the end of the buffer is zero padded, those windows have a run length < k
+	padded = np.zeros(n_pos + k - 1, dtype = np.int64)
+	padded[:n_pos] = codes & 3
+	idx = np.zeros(n_pos, dtype = np.int64)
+	for j in range(k):
+		idx <<= 2
+		idx |= padded[j:j + n_pos]
+
+	#distance to the next N, - or record end
+	record = np.repeat(np.arange(n_records), np.diff(offsets))
+	stop = np.where(codes == 4, np.arange(n_pos), n_pos)
+	stop = np.minimum.accumulate(stop[::-1])[::-1]
+	np.minimum(stop, offsets[1:][record], out = stop)
+	run = np.minimum(stop - np.arange(n_pos), k)
+
+	return record, idx, run
+
+
+def _kmer_windows(buffer, offsets, k):
+	"""Return the record number and k-mer index of every countable k-mer in the buffer."""
+	record, idx, run = _kmer_positions(buffer, offsets, k)
+	valid = run == k
+	return record[valid], idx[valid]
+
+
+def _as_buffer(sequences, offsets):
+	"""Return the byte buffer and offsets for a list of sequences or an encoded buffer."""
+	if offsets is None:
+		return encode_sequences(sequences)
+	if isinstance(sequences, (bytes, bytearray, memoryview)):
+		sequences = np.frombuffer(sequences, dtype = np.uint8)
+	return np.asarray(sequences, dtype = np.uint8), np.asarray(offsets, dtype = np.int64)
+
+
+def kmer_counts(sequences, k = 4, offsets = None, canonical = False, sparse = False, workers = 1):
+	"""
+	Count the k-mers of a batch of sequences, returning a count matrix.
+
+	The records are counted in vectorized passes over blocks of about a million bases (so the
+	memory used does not grow with the input beyond the output matrix): the sequences are 2-bit 
+	encoded, rolling k-mer indices are computed for every position and the counts are accumulated
+	with numpy.bincount. Substrings containing N or - are not counted. In canonical mode
+	the k-mer indices are mapped to their canonical column with a precomputed permutation
+	before counting. In sparse mode the counts are built directly from the k-mer indices as a
+	scipy.sparse CSR matrix, the dense matrix is never allocated. This is recommended for 
+	k >= 6, where most of the 4**k k-mers are absent from a barcode length sequence.
+
+	Arguments
+	---------
+	sequences : list or numpy.ndarray, a list of DNA sequence strings, or a uint8 buffer of
+		ascii encoded sequences (as returned by encode_sequences) if offsets is passed.
+
+	k : int, the size of k-mers to count. Default is 4.
+
+	offsets : numpy.ndarray, the record boundaries of an encoded sequence buffer. Default is None,
+		meaning sequences is a list of strings.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	sparse : bool, should the counts be returned as a scipy.sparse.csr_matrix. Default is False.
+
+	workers : int, the number of processes used to count the k-mers of dense output. The records
+		are split into contiguous blocks, counted in a pool of worker processes and written directly
+		into a shared memory count matrix, in input order. The pool is started on first use and 
+		reused by later calls. Default is 1 (count in the calling process).
+
+	Returns
+	---------
+	out : numpy.ndarray or scipy.sparse.csr_matrix, an int32 matrix of shape 
+		(n_records, n_kmer_features(k, canonical)). Columns are in alphabetical k-mer order, 
+		matching kmer_labels(k, canonical).
+
+	Examples
+	---------
+	>>> counts = kmer_counts(["AAAAAA", "ACGTN"], k = 2)
+	>>> counts[:, :2]
+	array([[5, 0],
+	       [0, 1]], dtype=int32)
+	"""
+	buffer, offsets = _as_buffer(sequences, offsets)
+	n_records = len(offsets) - 1
+	n_kmers = n_kmer_features(k, canonical)
+
+	if workers > 1 and sparse == False and n_records >= 2 * _MIN_TASK_RECORDS:
+		return _parallel_features(buffer, offsets, k, canonical, np.int32, False, workers)
+
+	if sparse == True:
+		blocks = [_block_counts(buffer, offsets, first, last, k, canonical, True) 
+					for first, last in _record_blocks(offsets)]
+		if len(blocks) == 1:
+			return blocks[0]
+		return sp.vstack(blocks, format = 'csr') if blocks else sp.csr_matrix((0, n_kmers), dtype = np.int32)
+
+	counts = np.empty((n_records, n_kmers), dtype = np.int32)
+	_fill_features(buffer, offsets, k, canonical, counts, False)
+	return counts
+
+
+def _record_blocks(offsets, n_kmers = None):
+	"""
+	Split the records into contiguous blocks of about _BLOCK_BASES bases, yield (first, last) pairs.
+	If n_kmers is given, a block also has at most _BLOCK_CELLS / n_kmers records, bounding the
+	size of its dense count matrix.
+	"""
+	n_records = len(offsets) - 1
+	max_records = n_records if n_kmers == None else max(1, _BLOCK_CELLS // n_kmers)
+	first = 0
+	while first < n_records:
+		last = int(np.searchsorted(offsets, offsets[first] + _BLOCK_BASES, side = 'right')) - 1
+		#a block holds at least one record
+		last = min(max(last, first + 1), first + max_records, n_records)
+		yield first, last
+		first = last
+
+
+def _block_counts(buffer, offsets, first, last, k, canonical, sparse = False):
+	"""Count the k-mers of records first:last of an encoded sequence buffer."""
+	n_records = last - first
+	n_kmers = n_kmer_features(k, canonical)
+	record, idx = _kmer_windows(buffer[offsets[first]:offsets[last]], 
+								offsets[first:last + 1] - offsets[first], k)
+	if canonical == True:
+		idx = _canonical_map(k)[0][idx]
+
+	if sparse == True:
+		return _sparse_counts(record, idx, n_records, n_kmers)
+
+	counts = np.bincount(record * n_kmers + idx, minlength = n_records * n_kmers)
+	return counts.reshape(n_records, n_kmers)
+
+
+def _fill_features(buffer, offsets, k, canonical, out, frequencies):
+	"""Write the k-mer counts (or frequencies) of the records into out, a block of records at a time."""
+	for first, last in _record_blocks(offsets, out.shape[1]):
+		counts = _block_counts(buffer, offsets, first, last, k, canonical)
+		if frequencies == True:
+			totals = counts.sum(axis = 1, keepdims = True)
+			#divided in float64 and cast on output, as in count_frequencies
+			out[first:last] = 0
+			np.divide(counts, totals, out = out[first:last], where = totals != 0)
+		else:
+			np.copyto(out[first:last], counts, casting = 'unsafe')
+
+
+def _sparse_counts(record, idx, n_records, n_kmers):
+	"""Build a CSR count matrix from the record numbers and k-mer indices of the counted k-mers."""
+	#record is sorted, so the unique keys are in row major order
+	keys, counts = np.unique(record * n_kmers + idx, return_counts = True)
+	rows = keys // n_kmers
+	indptr = np.searchsorted(rows, np.arange(n_records + 1))
+	
+	return sp.csr_matrix((counts.astype(np.int32), keys % n_kmers, indptr), 
+							shape = (n_records, n_kmers))
+
+
+def kmer_frequencies(sequences, k = 4, offsets = None, canonical = False, sparse = False,
+						dtype = np.float32, workers = 1):
+	"""
+	Generate the k-mer frequencies of a batch of sequences, returning a feature matrix.
+
+	The frequencies are identical to those of KmerFeatures.kmer_freqs (cast to dtype), but 
+	are produced for all records at once.
+
+	Arguments
+	---------
+	sequences : list or numpy.ndarray, a list of DNA sequence strings, or a uint8 buffer of
+		ascii encoded sequences (as returned by encode_sequences) if offsets is passed.
+
+	k : int, the size of k-mers to count. Default is 4.
+
+	offsets : numpy.ndarray, the record boundaries of an encoded sequence buffer. Default is None,
+		meaning sequences is a list of strings.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	sparse : bool, should the frequencies be returned as a scipy.sparse.csr_matrix. 
+		Default is False.
+
+	dtype : numpy dtype, the dtype of the output matrix. Default is numpy.float32.
+
+	workers : int, the number of processes used to generate dense output. The worker processes 
+		write the frequencies directly into a shared memory feature matrix (see kmer_counts). 
+		Default is 1 (featurize in the calling process).
+
+	Returns
+	---------
+	out : numpy.ndarray or scipy.sparse.csr_matrix, a matrix of shape 
+		(n_records, n_kmer_features(k, canonical)) with the k-mer frequencies of each record. 
+		Records without any countable k-mers have all frequencies equal to 0.
+
+	Examples
+	---------
+	>>> X = kmer_frequencies(["AAAATTTTGGGGCCCC", "ACGTACGTAC"])
+	>>> X.shape
+	(2, 256)
+	"""
+	buffer, offsets = _as_buffer(sequences, offsets)
+
+	if workers > 1 and sparse == False and len(offsets) - 1 >= 2 * _MIN_TASK_RECORDS:
+		return _parallel_features(buffer, offsets, k, canonical, dtype, True, workers)
+
+	if sparse == True:
+		counts = kmer_counts(buffer, k = k, offsets = offsets, canonical = canonical, sparse = True)
+		return count_frequencies(counts, dtype = dtype)
+
+	#the frequencies are written a block of records at a time, no full size count matrix is held
+	freqs = np.empty((len(offsets) - 1, n_kmer_features(k, canonical)), dtype = dtype)
+	_fill_features(buffer, offsets, k, canonical, freqs, True)
+	return freqs
+
+
+def window_kmer_counts(sequences, record, starts, ends, k = 4, offsets = None, canonical = False):
+	"""
+	Count the k-mers of many windows of a batch of sequences, from prefix counts.
+
+	The k-mers of each sequence are located once, then the counts of every window [start, end)
+	are the difference of two prefix counts (the number of each k-mer before end - k + 1 and 
+	before start). The prefix counts are only built at the window boundaries: the k-mers are 
+	binned by the number of boundaries before them and accumulated with a cumulative sum, so
+	no substring is created and the cost is O(L + n_windows * n_kmers) instead of the 
+	O(n_windows * L) of counting each window. The counts are identical to those of kmer_counts 
+	run on the substrings.
+
+	Arguments
+	---------
+	sequences : list or numpy.ndarray, a list of DNA sequence strings, or a uint8 buffer of
+		ascii encoded sequences (as returned by encode_sequences) if offsets is passed.
+
+	record : numpy.ndarray, the index of the sequence of each window.
+
+	starts, ends : numpy.ndarray, the start (inclusive) and end (exclusive) of each window,
+		relative to the start of its sequence.
+
+	k : int, the size of k-mers to count. Default is 4.
+
+	offsets : numpy.ndarray, the record boundaries of an encoded sequence buffer. Default is None,
+		meaning sequences is a list of strings.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	Returns
+	---------
+	out : numpy.ndarray, an int32 matrix of shape (n_windows, n_kmer_features(k, canonical)).
+		The windows are counted in blocks, so the temporary memory used is bounded, but the
+		output is proportional to n_windows * n_kmer_features: pass the windows in chunks to
+		featurize a large number of windows (i.e. see alfie.training.build_training_data).
+
+	Examples
+	---------
+	>>> counts = window_kmer_counts(["AAAAAA", "ACGTN"], record = [0, 0, 1], 
+	>>>									starts = [0, 2, 0], ends = [6, 5, 3], k = 2)
+	>>> counts[:, :2]
+	array([[5, 0],
+	       [2, 0],
+	       [0, 1]], dtype=int32)
+	"""
+	buffer, offsets = _as_buffer(sequences, offsets)
+	n_kmers = n_kmer_features(k, canonical)
+	starts = offsets[np.asarray(record, dtype = np.int64)] + np.asarray(starts, dtype = np.int64)
+	ends = offsets[np.asarray(record, dtype = np.int64)] + np.asarray(ends, dtype = np.int64)
+	n_windows = len(starts)
+	if n_windows == 0:
+		return np.zeros((0, n_kmers), dtype = np.int32)
+
+	_, idx, run = _kmer_positions(buffer, offsets, k)
+	position = np.flatnonzero(run == k)
+	idx = idx[position]
+	if canonical == True:
+		idx = _canonical_map(k)[0][idx]
+
+	#the prefix counts of a block of windows are limited to _BLOCK_CELLS, and reused between blocks
+	step = max(1, (_BLOCK_CELLS // n_kmers - 1) // 2)
+	prefix = np.empty((2 * min(step, n_windows) + 1, n_kmers), dtype = np.int32)
+	out = np.empty((n_windows, n_kmers), dtype = np.int32)
+	for first in range(0, n_windows, step):
+		w = slice(first, first + step)
+		out[w] = _window_block_counts(position, idx, starts[w], ends[w], k, prefix)
+	return out
+
+
+def _window_block_counts(position, idx, starts, ends, k, prefix):
+	"""The k-mer counts of a block of windows, from the prefix counts at their boundaries."""
+	n_windows, n_kmers = len(starts), prefix.shape[1]
+	#a window counts the k-mers at positions start <= p < end - k + 1
+	boundaries = np.concatenate([starts, np.maximum(ends - k + 1, starts)])
+	order = np.argsort(boundaries, kind = 'stable')
+	rank = np.empty(len(order), dtype = np.int64)
+	rank[order] = np.arange(len(order))
+
+	#k-mers before the first boundary cancel out, and those after the last are in no window
+	first, last = np.searchsorted(position, [boundaries.min(), boundaries.max()])
+	position, idx = position[first:last], idx[first:last]
+
+	#row i of the prefix counts holds the k-mers before the i-th smallest boundary
+	segment = np.searchsorted(boundaries[order], position, side = 'right')
+	prefix = prefix[:len(order) + 1]
+	counts = np.bincount(segment * n_kmers + idx, minlength = prefix.size)
+	np.copyto(prefix, counts.reshape(prefix.shape), casting = 'unsafe')
+	#accumulating in place is several times faster than into a new array
+	np.cumsum(prefix, axis = 0, out = prefix)
+
+	return prefix[rank[n_windows:]] - prefix[rank[:n_windows]]
+
+
+def _worker_pool(workers):
+	"""Return the process pool with the given number of workers, starting it on first use."""
+	with _POOLS_LOCK:
+		pool = _POOLS.get(workers)
+		if pool == None:
+			#spawned workers don't inherit the threads (or locks) of the parent process
+			pool = ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context("spawn"))
+			_POOLS[workers] = pool
+		return pool
+
+
+def _shared_array(shape, dtype):
+	"""Allocate a shared memory block, and a numpy array backed by it."""
+	dtype = np.dtype(dtype)
+	block = shared_memory.SharedMemory(create = True, 
+										size = max(1, int(np.prod(shape)) * dtype.itemsize))
+	return block, np.ndarray(shape, dtype = dtype, buffer = block.buf)
+
+
+def _parallel_features(buffer, offsets, k, canonical, dtype, frequencies, workers):
+	"""
+	Featurize an encoded sequence buffer in a process pool. The buffer and offsets are copied
+	to shared memory once, and each task writes the rows of a contiguous block of records
+	directly into a shared memory output matrix, so no features are pickled.
+	"""
+	n_records = len(offsets) - 1
+	n_tasks = min(4 * workers, n_records // _MIN_TASK_RECORDS)
+	bounds = np.linspace(0, n_records, n_tasks + 1).astype(np.int64).tolist()
+	dtype = np.dtype(dtype)
+	shape = (n_records, n_kmer_features(k, canonical))
+
+	blocks = []
+	try:
+		seq_block, shared_buffer = _shared_array(buffer.shape, np.uint8)
+		blocks.append(seq_block)
+		shared_buffer[:] = buffer
+		offsets_block, shared_offsets = _shared_array(offsets.shape, np.int64)
+		blocks.append(offsets_block)
+		shared_offsets[:] = offsets
+		out_block, out = _shared_array(shape, dtype)
+		blocks.append(out_block)
+
+		pool = _worker_pool(workers)
+		try:
+			tasks = [pool.submit(_featurize_task, seq_block.name, len(buffer), offsets_block.name, 
+									out_block.name, shape, dtype.str, bounds[i], bounds[i + 1], 
+									k, canonical, frequencies) for i in range(n_tasks)]
+			for x in tasks:
+				x.result()
+		except BrokenProcessPool:
+			#a worker died, the pool can't be reused
+			with _POOLS_LOCK:
+				_POOLS.pop(workers, None)
+			raise
+
+		result = out.copy()
+	finally:
+		shared_buffer = shared_offsets = out = None
+		for x in blocks:
+			x.close()
+			x.unlink()
+
+	return result
+
+
+def _featurize_task(seq_name, n_bytes, offsets_name, out_name, shape, dtype, start, stop, 
+						k, canonical, frequencies):
+	"""Featurize records start:stop of a shared memory sequence buffer, into the shared output."""
+	blocks = [shared_memory.SharedMemory(name = x) for x in (seq_name, offsets_name, out_name)]
+	try:
+		buffer = np.ndarray((n_bytes,), dtype = np.uint8, buffer = blocks[0].buf)
+		offsets = np.ndarray((shape[0] + 1,), dtype = np.int64, buffer = blocks[1].buf)
+		out = np.ndarray(shape, dtype = dtype, buffer = blocks[2].buf)
+
+		task_offsets = offsets[start:stop + 1] - offsets[start]
+		task_buffer = buffer[offsets[start]:offsets[stop]]
+		_fill_features(task_buffer, task_offsets, k, canonical, out[start:stop], frequencies)
+	finally:
+		#the arrays must be released before the shared memory is closed
+		buffer = offsets = out = task_buffer = None
+		for x in blocks:
+			x.close()
+
+
+def count_frequencies(counts, dtype = np.float32):
+	"""
+	Convert a k-mer count matrix to frequencies.
+
+	Each row is divided by its total, rows without any counts are left as 0.
 
+	Arguments
+	---------
+	counts : numpy.ndarray or scipy.sparse.csr_matrix, a 2d array of k-mer counts, 
+		one row per record.
+
+	dtype : numpy dtype, the dtype of the output matrix. Default is numpy.float32.
+
+	Returns
+	---------
+	out : numpy.ndarray or scipy.sparse.csr_matrix, the k-mer frequencies, with the same 
+		shape (and format) as counts.
+	"""
+	if sp.issparse(counts):
+		freqs = sp.csr_matrix(counts, dtype = np.float64)
+		totals = np.asarray(freqs.sum(axis = 1)).ravel()
+		#empty rows have no stored values, so there is no division by zero
+		freqs.data /= np.repeat(totals, np.diff(freqs.indptr))
+		return freqs.astype(dtype)
+
+	totals = counts.sum(axis = 1, keepdims = True)
+	freqs = np.divide(counts, totals, out = np.zeros(counts.shape), where = totals != 0)
+	return freqs.astype(dtype, copy = False)
+
+
+def multi_kmer_counts(sequences, ks = [2, 3, 4], offsets = None, canonical = False):
+	"""
+	Count the k-mers of a batch of sequences for several values of k in a single pass.
+
+	The sequences are scanned once, at the largest k. The counts for each smaller k are 
+	derived by marginalizing the largest k counts over their trailing bases, plus the k-mers 
+	whose longer window is cut short by an N, - or the end of the record. The results are
+	identical to calling kmer_counts once per k.
+
+	Arguments
+	---------
+	sequences : list or numpy.ndarray, a list of DNA sequence strings, or a uint8 buffer of
+		ascii encoded sequences (as returned by encode_sequences) if offsets is passed.
+
+	ks : list, the k-mer sizes to count. Default is [2, 3, 4].
+
+	offsets : numpy.ndarray, the record boundaries of an encoded sequence buffer. Default is None,
+		meaning sequences is a list of strings.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	Returns
+	---------
+	out : dict, keys are the values of k and values are int32 count matrices of 
+		shape (n_records, n_kmer_features(k, canonical)).
+
+	Examples
+	---------
+	>>> counts = multi_kmer_counts(["AAAATTTTGGGGCCCC", "ACGTACGTAC"], ks = [4, 6])
+	>>> counts[4].shape, counts[6].shape
+	((2, 256), (2, 4096))
+	"""
+	buffer, offsets = _as_buffer(sequences, offsets)
+	n_records = len(offsets) - 1
+
+	out = {k : np.zeros((n_records, n_kmer_features(k, canonical)), dtype = np.int32) for k in ks}
+	for first, last in _record_blocks(offsets, 4 ** max(ks)):
+		block = _multi_block_counts(buffer[offsets[first]:offsets[last]], 
+									offsets[first:last + 1] - offsets[first], ks, canonical)
+		for k in out:
+			out[k][first:last] = block[k]
+
+	return out
+
+
+def _multi_block_counts(buffer, offsets, ks, canonical):
+	"""Count the k-mers of an encoded block of records for several values of k."""
+	n_records = len(offsets) - 1
+	max_k = max(ks)
+
+	record, idx, run = _kmer_positions(buffer, offsets, max_k)
+
+	full = run == max_k
+	max_counts = np.bincount(record[full] * 4 ** max_k + idx[full], 
+								minlength = n_records * 4 ** max_k).reshape(n_records, 4 ** max_k)
+
+	out = {}
+	for k in sorted(set(ks), reverse = True):
+		shift = max_k - k
+		counts = max_counts.reshape(n_records, 4 ** k, 4 ** shift).sum(axis = 2)
+		
+		#windows that are valid at k, but not at max_k
+		partial = (run >= k) & (run < max_k)
+		counts += np.bincount(record[partial] * 4 ** k + (idx[partial] >> (2 * shift)),
+								minlength = n_records * 4 ** k).reshape(n_records, 4 ** k)
+		
+		if canonical == True:
+			counts = _fold_canonical(counts, k)
+
+		out[k] = counts.astype(np.int32)
+
+	return {k : out[k] for k in ks}
+
+
+def multi_kmer_frequencies(sequences, ks = [2, 3, 4], offsets = None, canonical = False, 
+							dtype = np.float32):
+	"""
+	Generate the k-mer frequencies of a batch of sequences for several values of k in a single pass.
+
+	See multi_kmer_counts for details, the frequencies are identical to calling 
+	kmer_frequencies once per k.
+
+	Arguments
+	---------
+	sequences : list or numpy.ndarray, a list of DNA sequence strings, or a uint8 buffer of
+		ascii encoded sequences (as returned by encode_sequences) if offsets is passed.
+
+	ks : list, the k-mer sizes to count. Default is [2, 3, 4].
+
+	offsets : numpy.ndarray, the record boundaries of an encoded sequence buffer. Default is None,
+		meaning sequences is a list of strings.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	dtype : numpy dtype, the dtype of the output matrices. Default is numpy.float32.
+
+	Returns
+	---------
+	out : dict, keys are the values of k and values are frequency matrices of 
+		shape (n_records, n_kmer_features(k, canonical)).
+
+	Examples
+	---------
+	>>> freqs = multi_kmer_frequencies(["AAAATTTTGGGGCCCC", "ACGTACGTAC"], ks = [4, 6])
+	>>> freqs[6].shape
+	(2, 4096)
+	"""
+	counts = multi_kmer_counts(sequences, ks = ks, offsets = offsets, canonical = canonical)
+	return {k : count_frequencies(v, dtype = dtype) for k, v in counts.items()}
@@ -0,0 +1,197 @@
+"""
+Timing and throughput instrumentation for classification runs.
+
+A Profile records the time spent in each stage of a run (i.e. parse, featurize, predict and write),
+with the number of records and sequence bytes processed, so the throughput of the stages can be
+compared and a slow run identified as I/O bound or compute bound. The peak resident memory of the
+process is recorded as well. Pass a Profile to alfie.classify.classify_records or classify_stream,
+or use the --profile flag of the command line interface.
+
+In a streamed run the stages run concurrently, so the stage times are the busy time of each stage,
+and their sum can exceed the wall time of the run.
+
+==========
+Classes
+==========
+
+Profile : Accumulate the time, records and bytes processed by each stage of a run.
+
+==========
+Functions
+==========
+
+peak_rss : Return the peak resident memory of the process, in megabytes.
+
+timed : Time a block of code as a stage of a profile, if a profile is given.
+
+"""
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+	import resource
+except ImportError:
+	#not available on windows
+	resource = None
+
+
+def peak_rss():
+	"""
+	Return the peak resident memory of the process, in megabytes.
+
+	Returns
+	---------
+	out : float, the peak resident set size, or None if it cannot be measured on this platform.
+	"""
+	if resource == None:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	#bytes on macOS, kilobytes on linux
+	if sys.platform == "darwin":
+		return rss / 1024 ** 2
+	return rss / 1024
+
+
+class Profile:
+	"""
+	Accumulate the time, records and bytes processed by each stage of a run.
+
+	A Profile can be shared by threads. Stages are reported in the order they are first recorded.
+	The bytes of a stage are the sequence bytes processed, except for the predict stage where
+	they are the bytes of the feature matrix passed to the model.
+
+	Attributes
+	---------
+	stages : dict, for each stage name, a dictionary with the total 'seconds', 'records', 'bytes'
+		and number of 'calls' recorded.
+
+	Methods
+	---------
+	stage : a context manager, timing the code it wraps as a stage.
+
+	add : record the time, records and bytes of a stage.
+
+	to_dict : the profile as a dictionary, with the throughput of each stage.
+
+	to_json : the profile in JSON format, optionally written to a file.
+
+	report : the profile as a printable table.
+
+	Examples
+	---------
+	>>> from alfie import example_fasta
+	>>> from alfie.classify import classify_records
+	>>> profile = Profile()
+	>>> seq_records, predictions = classify_records(example_fasta, profile = profile)
+	>>> print(profile.report())
+	stage             seconds     records   records/s      MB/s
+	featurize           0.006         100       16543      64.0
+	predict             0.049         100        2036       7.9
+	wall time 1.271s, peak memory 512.3 MB
+	"""
+	def __init__(self):
+		self.stages = {}
+		self._lock = threading.Lock()
+		self._start = time.perf_counter()
+
+	@contextmanager
+	def stage(self, name, records = 0, n_bytes = 0):
+		"""
+		Time the wrapped code as a stage.
+
+		Arguments
+		---------
+		name : str, the name of the stage.
+
+		records : int, the number of records processed. Default is 0.
+
+		n_bytes : int, the number of sequence bytes processed. Default is 0.
+		"""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add(name, time.perf_counter() - start, records, n_bytes)
+
+	def add(self, name, seconds, records = 0, n_bytes = 0):
+		"""Record the time, records and bytes of a stage."""
+		with self._lock:
+			if name not in self.stages:
+				self.stages[name] = {"seconds" : 0.0, "records" : 0, "bytes" : 0, "calls" : 0}
+			x = self.stages[name]
+			x["seconds"] += seconds
+			x["records"] += int(records)
+			x["bytes"] += int(n_bytes)
+			x["calls"] += 1
+
+	def to_dict(self):
+		"""The profile as a dictionary, with the records/s and bytes/s of each stage."""
+		with self._lock:
+			stages = {}
+			for name, x in self.stages.items():
+				stages[name] = dict(x)
+				seconds = x["seconds"]
+				stages[name]["records_per_second"] = x["records"] / seconds if seconds > 0 else None
+				stages[name]["bytes_per_second"] = x["bytes"] / seconds if seconds > 0 else None
+
+		return {"wall_seconds" : time.perf_counter() - self._start,
+				"peak_rss_mb" : peak_rss(),
+				"stages" : stages}
+
+	def to_json(self, filename = None):
+		"""
+		The profile in JSON format.
+
+		Arguments
+		---------
+		filename : str, a file to write the JSON to. Default is None (not written).
+
+		Returns
+		---------
+		out : str, the JSON string.
+		"""
+		out = json.dumps(self.to_dict(), indent = 2)
+		if filename != None:
+			with open(filename, 'w') as f:
+				f.write(out + "\n")
+		return out
+
+	def report(self):
+		"""The profile as a printable table."""
+		data = self.to_dict()
+		lines = [f"{'stage':<12}{'seconds':>12}{'records':>12}{'records/s':>12}{'MB/s':>10}"]
+		for name, x in data["stages"].items():
+			rate = x["records_per_second"] or 0
+			mb_rate = (x["bytes_per_second"] or 0) / 1e6
+			lines.append(f"{name:<12}{x['seconds']:>12.3f}{x['records']:>12}{rate:>12.0f}{mb_rate:>10.1f}")
+
+		memory = "unknown" if data["peak_rss_mb"] == None else f"{data['peak_rss_mb']:.1f} MB"
+		lines.append(f"wall time {data['wall_seconds']:.3f}s, peak memory {memory}")
+		return "\n".join(lines)
+
+
+def timed(profile, name, records = 0, n_bytes = 0):
+	"""
+	Time a block of code as a stage of a profile, if a profile is given.
+
+	Arguments
+	---------
+	profile : Profile or None.
+
+	name, records, n_bytes : see Profile.stage.
+
+	Returns
+	---------
+	out : a context manager, which does nothing if profile is None.
+
+	Examples
+	---------
+	>>> with timed(profile, "parse", records = 10):
+	>>> 	records = read_fasta(ex_fasta_file)
+	"""
+	if profile == None:
+		return nullcontext()
+	return profile.stage(name, records, n_bytes)
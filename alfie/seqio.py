@@ -2,7 +2,10 @@
 Sequence input and output functions.
 
 This module contains functions for the reading and writing of sequence data from fasta or fastq
-formatted files. 
+formatted files. Files compressed with gzip (or bgzip), bzip2 or xz are read and written 
+transparently, the compression is inferred from the file extension (.gz, .bgz, .bz2 or .xz).
+Compressed input is decompressed on a background thread, overlapping with the processing 
+of the sequences.
 
 ==========
 Input functions
@@ -16,6 +19,8 @@ iter_read_fasta : Iteratively read data from fasta file.
 
 iter_read_fastq : Iteratively read data from fastq file. 
 
+iter_read_batches : Iteratively read a fasta or fastq file in binary mode, yielding columnar SeqBatch objects.
+
 ==========
 Output functions
 ==========
@@ -24,25 +29,202 @@ write_fasta : Write a sequence record, or list of records, to a file in fasta fo
 
 write_fastq : Write a sequence record, or list of records, to a file in fastq format.
 
+ClassWriter : Buffered output of classified sequences, to one file per class.
+
+==========
+Classes
+==========
+
+SeqBatch : A columnar batch of sequence records.
+
+ClassWriter : Buffered output of classified sequences, to one file per class.
+
 ==========
 Support functions
 ==========
 
 file_type : Take in a filename and determine if the extension indicates a fasta or fastq file.
 
+compression_type : Take in a filename and determine if the extension indicates a compressed file.
+
+input_files : List the fasta and fastq files given by a file name, a directory or a glob pattern.
+
+open_input : Open a sequence file for binary reading, decompressing it if required.
+
 outfile_dict : Build a dictionary of output filenames for classified sequences.
 
+sequence_digests : Hash the sequences of a batch, for the identification of duplicate sequences.
+
 process_fastq_record : Create a dictionary from a list of the four lines of a fastq record.
 
 """
 
+import io
 import os 
-import copy
+import bz2
+import glob
+import hashlib
+import gzip
+import lzma
+import mmap
+import queue
+import threading
+
+import numpy as np
+
+# file extensions of the supported compression formats, bgzip files are valid gzip files
+_COMPRESSION = {"gz" : gzip, "bgz" : gzip, "bz2" : bz2, "xz" : lzma}
+
+
+def compression_type(s):
+	"""
+	Take in a filename and determine if the extension indicates a compressed file.
+
+	Arguments
+	---------
+	s : str, a filename string
+
+	Returns
+	---------
+	out : string or None, the compression extension ('gz', 'bgz', 'bz2' or 'xz'), or None
+		for an uncompressed file.
+
+	Examples
+	---------
+	>>> compression_type("example_file.fastq.gz")
+	"gz"
+	>>> compression_type("example_file.fastq")
+	None
+	"""
+	suffix = s.split(".")[-1]
+	if suffix in _COMPRESSION:
+		return suffix
+	return None
+
+
+def _strip_compression(s):
+	"""Remove the compression extension, if any, from a filename."""
+	if compression_type(s) is not None:
+		return s[:s.rindex(".")]
+	return s
+
+
+class _PrefetchReader(io.RawIOBase):
+	"""Read a binary file object on a background thread, so decompression overlaps with processing."""
+	def __init__(self, file, chunk_size = 1 << 20, max_chunks = 8):
+		self._file = file
+		self._chunk_size = chunk_size
+		self._queue = queue.Queue(max_chunks)
+		self._stop = threading.Event()
+		self._chunk = b''
+		self._pos = 0
+		self._done = False
+		self._thread = threading.Thread(target = self._fill, daemon = True)
+		self._thread.start()
+
+	def _put(self, item):
+		"""Add an item to the queue, giving up if the reader is closed."""
+		while not self._stop.is_set():
+			try:
+				self._queue.put(item, timeout = 0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def _fill(self):
+		try:
+			while True:
+				chunk = self._file.read(self._chunk_size)
+				if not self._put(chunk) or not chunk:
+					return
+		except Exception as e:
+			self._put(e)
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		while self._pos >= len(self._chunk):
+			if self._done:
+				return 0
+			item = self._queue.get()
+			if isinstance(item, Exception):
+				raise item
+			if not item:
+				self._done = True
+				return 0
+			self._chunk = item
+			self._pos = 0
+
+		n = min(len(b), len(self._chunk) - self._pos)
+		b[:n] = self._chunk[self._pos:self._pos + n]
+		self._pos += n
+		return n
+
+	def close(self):
+		if not self.closed:
+			self._stop.set()
+			self._thread.join()
+			self._file.close()
+		super().close()
+
+
+def open_input(filename, threaded = True):
+	"""
+	Open a sequence file for binary reading, decompressing it if required.
+
+	Arguments
+	---------
+	filename : str, the path to the file. Compression is inferred from the extension.
+
+	threaded : bool, should compressed files be decompressed on a background thread. 
+		Default is True.
+
+	Returns
+	---------
+	out : a binary file object.
+
+	Examples
+	---------
+	>>> with open_input("reads.fastq.gz") as file:
+	>>> 	first_line = file.readline()
+	"""
+	compression = compression_type(filename)
+
+	if compression is None:
+		return open(filename, 'rb')
+	
+	file = _COMPRESSION[compression].open(filename, 'rb')
+	if threaded == True:
+		return io.BufferedReader(_PrefetchReader(file))
+	return file
+
+
+def _open_text(filename):
+	"""Open a sequence file for text reading, decompressing it if required."""
+	return io.TextIOWrapper(open_input(filename))
+
+
+def _open_output(filename, mode):
+	"""Open a sequence file for text writing ('w' or 'a'), compressing it if required."""
+	compression = compression_type(filename)
+
+	if compression is None:
+		return open(filename, mode)
+	if _COMPRESSION[compression] is gzip:
+		#the default level of 9 is much slower, for a marginal reduction in size
+		return gzip.open(filename, mode + 't', compresslevel = 6)
+	return _COMPRESSION[compression].open(filename, mode + 't')
+
 
 def file_type(s):
 	"""
 	Take in a filename and determine if the extension indicates a fasta or fastq file.
 
+	A compression extension (.gz, .bgz, .bz2 or .xz) following the fasta or fastq 
+	extension is permitted.
+
 	Arguments
 	---------
 	s : str, a filename string
@@ -61,11 +243,13 @@ def file_type(s):
 	"fastq"
 	>>> file_type("example_file.fq")
 	"fastq"
+	>>> file_type("example_file.fq.gz")
+	"fastq"
 	>>> file_type("example_file.txt")
 	ValueError: Input file must be in fasta or fastq format. Accepted file extensions: fa, fq, fasta, or fastq.	
 
 	"""
-	suffix = s.split(".")[-1]
+	suffix = _strip_compression(s).split(".")[-1]
 
 	if suffix == "fa" or suffix == "fasta":
 		return "fasta"
@@ -75,12 +259,57 @@ def file_type(s):
 
 	else:
 		raise ValueError("File must be in fasta or fastq format. "+\
-			"Accepted file extensions: fa, fq, fasta, or fastq.")
+			"Accepted file extensions: fa, fq, fasta, or fastq. "+\
+			"Optionally followed by a compression extension: gz, bgz, bz2 or xz.")
+
+
+def input_files(path):
+	"""
+	List the fasta and fastq files given by a file name, a directory or a glob pattern.
+
+	Arguments
+	---------
+	path : str, the name of a sequence file, a directory containing sequence files, or a 
+		glob pattern (i.e. 'run1/*.fastq.gz'). Files in a directory (or matching a pattern) 
+		without a fasta or fastq extension (see file_type) are skipped.
+
+	Returns
+	---------
+	out : list, the sorted file names.
+
+	Examples
+	---------
+	>>> input_files('alfie/data')
+	['alfie/data/example_data.fasta', 'alfie/data/example_data.fastq']
+	>>> input_files('alfie/data/*.fastq')
+	['alfie/data/example_data.fastq']
+	"""
+	if os.path.isfile(path):
+		return [path]
+
+	if os.path.isdir(path):
+		candidates = [os.path.join(path, x) for x in os.listdir(path)]
+	else:
+		candidates = glob.glob(path)
+
+	files = []
+	for x in candidates:
+		try:
+			if os.path.isfile(x):
+				file_type(x)
+				files.append(x)
+		except ValueError:
+			pass
+
+	if len(files) == 0:
+		raise ValueError(f"No fasta or fastq files found for the input: {path}")
+
+	return sorted(files)
 
 
 def outfile_dict(filename, 
 					labels = ["animalia", "bacteria", "fungi", "plantae", "protista"],
-					folder_prefix = "alfie_out/"):
+					folder_prefix = "alfie_out/", compression = None):
 	""" 
 	Build a dictionary of output filenames for classified sequences.
 
@@ -94,6 +323,9 @@ def outfile_dict(filename,
 		By default, a new folder named 'alfie_out/' is generated. Passing 'folder_prefix = None'
 		will omit the prefix, and files will be output to the current working directory and no
 		new folder will be generated.
+	compression - str, the compression extension ('gz', 'bz2' or 'xz') added to the output 
+		filenames, the outputs are then written compressed. Default is None, in which case the
+		outputs are not compressed (even if the input file is).
 
 	Returns
 	---------
@@ -112,8 +344,15 @@ def outfile_dict(filename,
 	>>> outfile_dict('test_file.fastq', labels = ['hot_dog','not_hot_dog'], folder_prefix = None)
 	{0: 'hot_dog_test_file.fastq', 1: 'not_hot_dog_test_file.fastq'}
 
+	>>> outfile_dict('test_file.fastq.gz', labels = ['hot_dog','not_hot_dog'], 
+	>>>					folder_prefix = None, compression = 'bz2')
+	{0: 'hot_dog_test_file.fastq.bz2', 1: 'not_hot_dog_test_file.fastq.bz2'}
+
 	"""
-	f_stripped = filename.split('/')[-1]
+	f_stripped = _strip_compression(filename.split('/')[-1])
+
+	if compression != None:
+		f_stripped = f_stripped + "." + compression
 
 	if folder_prefix != None:
 		if os.path.isdir(folder_prefix) == False:
@@ -136,7 +375,7 @@ def read_fasta(filename):
 	
 	Arguments
 	---------
-	filename : str, the path to a file in fasta format.
+	filename : str, the path to a file in fasta format, optionally compressed.
 
 	Returns
 	---------	
@@ -156,21 +395,22 @@ def read_fasta(filename):
 	"""
 	seq_records = []
 
-	record = {"name" : None, "sequence" : ""}
+	name = None
+	seq_lines = []
 
-	with open(filename) as file:
+	with _open_text(filename) as file:
 		for line in file:
 			#if we hit a new record
 			if line[0] == ">":
 				#if current record, append to the record list
-				if record["name"] != None:
-					seq_records.append(copy.copy(record))	
-				record["name"] = line[1:].rstrip()
-				record["sequence"] = ""
+				if name != None:
+					seq_records.append({"name" : name, "sequence" : "".join(seq_lines)})	
+				name = line[1:].rstrip()
+				seq_lines = []
 			else:
-				record["sequence"] += line.rstrip()
+				seq_lines.append(line.rstrip())
 
-	seq_records.append(record)	
+	seq_records.append({"name" : name, "sequence" : "".join(seq_lines)})	
 
 	return seq_records
 
@@ -181,7 +421,7 @@ def iter_read_fasta(filename, batch = 1000):
 	
 	Arguments
 	---------
-	filename : str, the path to a file in fasta format.
+	filename : str, the path to a file in fasta format, optionally compressed.
 
 	batch : int, the number of sequence records to be returned in each batch.
 		The default is 1000.
@@ -208,26 +448,27 @@ def iter_read_fasta(filename, batch = 1000):
 	"""
 	seq_records = []
 
-	record = {"name" : None, "sequence" : ""}
+	name = None
+	seq_lines = []
 
-	with open(filename) as file:
+	with _open_text(filename) as file:
 		for line in file:
 			#if we hit a new record
 			if line[0] == ">":
 				#if current record, append to the record list
-				if record["name"] != None:
-					seq_records.append(copy.copy(record))
+				if name != None:
+					seq_records.append({"name" : name, "sequence" : "".join(seq_lines)})
 					
 					if len(seq_records)	== batch:
 						yield seq_records
 						seq_records = []
 
-				record["name"] = line[1:].rstrip()
-				record["sequence"] = ""
+				name = line[1:].rstrip()
+				seq_lines = []
 			else:
-				record["sequence"] += line.rstrip()
+				seq_lines.append(line.rstrip())
 
-	seq_records.append(record)	
+	seq_records.append({"name" : name, "sequence" : "".join(seq_lines)})	
 
 	yield seq_records
 
@@ -248,7 +489,7 @@ def read_fastq(filename):
 	
 	Arguments
 	---------
-	filename : str, the path to a file in fastq format.
+	filename : str, the path to a file in fastq format, optionally compressed.
 
 	Returns
 	---------	
@@ -270,7 +511,7 @@ def read_fastq(filename):
 	"""
 	records = []
 	n = 4
-	with open(filename, 'r') as file:
+	with _open_text(filename) as file:
 		lines = []
 		for line in file:
 			lines.append(line.rstrip())
@@ -288,7 +529,7 @@ def iter_read_fastq(filename, batch = 1000):
 	
 	Arguments
 	---------
-	filename : str, the path to a file in fastq format.
+	filename : str, the path to a file in fastq format, optionally compressed.
 
 	batch : int, the number of sequence records to be returned in each batch.
 		The default is 1000.
@@ -317,7 +558,7 @@ def iter_read_fastq(filename, batch = 1000):
 	records = []
 	n = 4
 
-	with open(filename, 'r') as file:
+	with _open_text(filename) as file:
 		lines = []
 		for line in file:
 			lines.append(line.rstrip())
@@ -334,6 +575,305 @@ def iter_read_fastq(filename, batch = 1000):
 		yield records
 
 
+class SeqBatch:
+	"""
+	A columnar batch of sequence records.
+
+	Rather than a dictionary per record, the sequences of the batch are stored back to back in
+	a single uint8 buffer, with the record boundaries held in an offsets array. The buffer and
+	offsets can be passed directly to the functions of alfie.kmerseq, and a SeqBatch can be
+	passed directly to alfie.classify.classify_records.
+
+	Attributes
+	---------
+	names : list, the identifier (header line) of each record.
+
+	buffer : numpy.ndarray, a uint8 array with the ascii codes of all the sequences.
+
+	offsets : numpy.ndarray, an int64 array of length len(names) + 1, sequence i 
+		is buffer[offsets[i]:offsets[i+1]].
+
+	strands : list, the strand line of each record for fastq data, None for fasta data.
+
+	qualities : numpy.ndarray, a uint8 array with the quality strings of all the records 
+		for fastq data (these share the sequence offsets), None for fasta data.
+
+	Methods
+	---------
+	from_records : build a SeqBatch from a list of sequence records in dictionary format.
+
+	sequences : list, the sequences of the batch as strings.
+
+	take : SeqBatch, a new batch with a subset of the records.
+
+	to_records : list, the records of the batch in the dictionary format returned by
+		read_fasta and read_fastq.
+
+	Examples
+	---------
+	>>> from alfie import ex_fastq_file
+	>>> batch = next(iter_read_batches(ex_fastq_file, batch = 10))
+	>>> len(batch)
+	10
+	>>> batch.to_records()[0].keys()
+	dict_keys(['name', 'sequence', 'strand', 'quality'])
+	"""
+	def __init__(self, names, buffer, offsets, strands = None, qualities = None):
+		self.names = names
+		self.buffer = buffer
+		self.offsets = offsets
+		self.strands = strands
+		self.qualities = qualities
+
+	@classmethod
+	def from_records(cls, records):
+		"""Build a SeqBatch from a list of sequence records in dictionary format."""
+		names = [x['name'] for x in records]
+		seqs = [x['sequence'].encode('latin-1') for x in records]
+		if len(records) > 0 and 'quality' in records[0]:
+			return _build_batch(names, seqs, [x['strand'] for x in records], 
+								[x['quality'].encode('latin-1') for x in records])
+		return _build_batch(names, seqs)
+
+	@property
+	def ftype(self):
+		"""The format of the records, 'fasta' or 'fastq'."""
+		return 'fasta' if self.qualities is None else 'fastq'
+
+	def __len__(self):
+		return len(self.names)
+
+	def _split(self, buffer):
+		"""Split a buffer into a list of strings at the record offsets."""
+		text = buffer.tobytes().decode('latin-1')
+		bounds = self.offsets.tolist()
+		return [text[bounds[i]:bounds[i+1]] for i in range(len(self.names))]
+
+	def sequences(self):
+		"""The sequences of the batch, as a list of strings."""
+		return self._split(self.buffer)
+
+	def take(self, indices):
+		"""A new SeqBatch with the records at the given indices, in the order given."""
+		indices = np.asarray(indices, dtype = np.int64)
+		starts = self.offsets[indices]
+		lengths = self.offsets[indices + 1] - starts
+
+		offsets = np.zeros(len(indices) + 1, dtype = np.int64)
+		np.cumsum(lengths, out = offsets[1:])
+		#position in the old buffer of each byte of the new buffer
+		positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+		names = [self.names[i] for i in indices]
+		if self.qualities is None:
+			return SeqBatch(names, self.buffer[positions], offsets)
+		return SeqBatch(names, self.buffer[positions], offsets, 
+						[self.strands[i] for i in indices], self.qualities[positions])
+
+	def to_records(self):
+		"""The records of the batch in the dictionary format of read_fasta and read_fastq."""
+		if self.qualities is None:
+			return [{"name" : n, "sequence" : s} for n, s in zip(self.names, self.sequences())]
+
+		return [{"name" : n, "sequence" : s, "strand" : st, "quality" : q} for n, s, st, q in 
+					zip(self.names, self.sequences(), self.strands, self._split(self.qualities))]
+
+
+def sequence_digests(seq_records, digest_size = 16):
+	"""
+	Hash the sequences of a batch, for the identification of duplicate sequences.
+
+	Sequences are hashed with blake2b after conversion to upper case, so sequences differing
+	only in case (which have the same k-mer features) share a digest. The digests are much
+	smaller than the sequences, so a set of the digests seen in a large file can be held in memory.
+
+	Arguments
+	---------
+	seq_records : list or SeqBatch, a list of sequence records in dictionary format
+		(with a 'sequence' key), or a SeqBatch.
+
+	digest_size : int, the size of the digests in bytes. Default is 16.
+
+	Returns
+	---------
+	out : list, a bytes digest for each sequence.
+
+	Examples
+	---------
+	>>> a, b = sequence_digests([{'name' : 'a', 'sequence' : 'ATGC'}, 
+	>>>								{'name' : 'b', 'sequence' : 'atgc'}])
+	>>> a == b
+	True
+	"""
+	if isinstance(seq_records, SeqBatch):
+		buffer = seq_records.buffer
+		#upper case ascii letters
+		buffer = np.where((buffer >= 97) & (buffer <= 122), buffer - 32, buffer).astype(np.uint8)
+		bounds = seq_records.offsets.tolist()
+		return [hashlib.blake2b(buffer[bounds[i]:bounds[i+1]], digest_size = digest_size).digest() 
+					for i in range(len(seq_records))]
+
+	return [hashlib.blake2b(x['sequence'].upper().encode('latin-1'), digest_size = digest_size).digest() 
+				for x in seq_records]
+
+
+def _build_batch(names, seqs, strands = None, quals = None):
+	"""Build a SeqBatch from lists of names and sequence bytes (and fastq strands and qualities)."""
+	offsets = np.zeros(len(seqs) + 1, dtype = np.int64)
+	np.cumsum([len(x) for x in seqs], out = offsets[1:])
+	buffer = np.frombuffer(b''.join(seqs), dtype = np.uint8)
+
+	if quals is None:
+		return SeqBatch(names, buffer, offsets)
+
+	qualities = np.frombuffer(b''.join(quals), dtype = np.uint8)
+	if len(qualities) != len(buffer):
+		raise ValueError("Fastq sequence and quality lines differ in length.")
+	return SeqBatch(names, buffer, offsets, strands, qualities)
+
+
+def _read_chunks(file, chunk_size):
+	"""Yield chunks of bytes from a binary file handle (or mmap) until it is exhausted."""
+	while True:
+		chunk = file.read(chunk_size)
+		if not chunk:
+			return
+		yield chunk
+
+
+def _fasta_fields(chunks):
+	"""Parse chunks of a fasta file, yielding lists of names and sequences for each chunk."""
+	carry = b''
+	first = True
+	for chunk in chunks:
+		data = carry + chunk
+		if first == True:
+			#drop anything before the first header
+			start = data.find(b'>')
+			if start < 0:
+				continue
+			data = data[start + 1:]
+			first = False
+		parts = data.split(b'\n>')
+		carry = parts.pop()
+		yield _split_fasta(parts)
+
+	if carry:
+		yield _split_fasta([carry])
+
+
+def _split_fasta(parts):
+	"""Split the raw text of fasta records (without the leading >) into names and sequences."""
+	names = []
+	seqs = []
+	for part in parts:
+		header, _, body = part.partition(b'\n')
+		names.append(header.rstrip().decode())
+		seqs.append(b''.join(body.split()))
+	return names, seqs
+
+
+def _fastq_fields(chunks):
+	"""Parse chunks of a fastq file, yielding lists of names, sequences, strands and qualities."""
+	carry = b''
+	for chunk in chunks:
+		lines = (carry + chunk).split(b'\n')
+		#the last line is incomplete, keep it along with any incomplete record
+		n_complete = ((len(lines) - 1) // 4) * 4
+		carry = b'\n'.join(lines[n_complete:])
+		yield _split_fastq(lines[:n_complete])
+
+	lines = carry.split(b'\n')
+	yield _split_fastq(lines[:(len(lines) // 4) * 4])
+
+
+def _split_fastq(lines):
+	"""Split a list of complete fastq lines into names, sequences, strands and qualities."""
+	names = [x.rstrip()[1:].decode() for x in lines[0::4]]
+	seqs = [x.rstrip() for x in lines[1::4]]
+	strands = [x.rstrip().decode() for x in lines[2::4]]
+	quals = [x.rstrip() for x in lines[3::4]]
+	return names, seqs, strands, quals
+
+
+def iter_read_batches(filename, batch = 1000, use_mmap = False, chunk_size = 1 << 22):
+	"""
+	Iteratively read a fasta or fastq file in binary mode, yielding columnar SeqBatch objects.
+
+	The file is read in large binary chunks and each batch of records is stored as a single
+	contiguous sequence buffer with offsets (see SeqBatch), rather than as a list of 
+	dictionaries. This is much faster and uses much less memory than read_fasta/read_fastq,
+	the records can be converted to the dictionary format on demand with SeqBatch.to_records.
+	Whitespace within the sequence lines is ignored.
+
+	Arguments
+	---------
+	filename : str, the path to a file in fasta or fastq format, the format is inferred
+		from the extension (see file_type).
+
+	batch : int, the number of sequence records in each batch. Default is 1000. If None,
+		the whole file is returned as a single batch.
+
+	use_mmap : bool, should the file be memory mapped rather than read with buffered 
+		file reads. Ignored for compressed files. Default is False.
+
+	chunk_size : int, the number of bytes read from the file at a time. Default is 4 MB.
+
+	Returns
+	---------
+	out : generator, will yield SeqBatch objects with the given number of records.
+
+	Examples
+	---------
+	# load the path to the alfie example file
+	>>> from alfie import ex_fasta_file
+	>>> data = iter_read_batches(ex_fasta_file, batch = 10)
+	# data is a generator, get the next batch
+	>>> x = next(data)
+	>>> len(x)
+	10
+	>>> x.names[0]
+	'seq1_plantae'
+	"""
+	ftype = file_type(filename)
+	parse = _fasta_fields if ftype == 'fasta' else _fastq_fields
+
+	with open_input(filename) as file:
+		if use_mmap == True and compression_type(filename) is None and \
+				os.fstat(file.fileno()).st_size > 0:
+			source = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+		else:
+			source = file
+
+		pending = None
+		for fields in parse(_read_chunks(source, chunk_size)):
+			if pending is None:
+				pending = list(fields)
+			else:
+				for x, new in zip(pending, fields):
+					x.extend(new)
+
+			while batch is not None and len(pending[0]) >= batch:
+				yield _build_batch(*[x[:batch] for x in pending])
+				pending = [x[batch:] for x in pending]
+
+		if pending is not None and len(pending[0]) > 0:
+			yield _build_batch(*pending)
+
+		if source is not file:
+			source.close()
+
+
+def _fasta_string(x):
+	"""Format a sequence record dictionary as a fasta string."""
+	return f">{x['name']}\n{x['sequence']}\n"
+
+
+def _fastq_string(x):
+	"""Format a sequence record dictionary as a fastq string."""
+	return f"@{x['name']}\n{x['sequence']}\n{x['strand']}\n{x['quality']}\n"
+
+
 def write_fasta(entry, filename, append_seq = True):
 	"""
 	Write a sequence record, or list of records, to a file in fasta format.
@@ -344,7 +884,8 @@ def write_fasta(entry, filename, append_seq = True):
 		in dictionary format with the keys: 'name' (becomes header line of fasta), 
 		'sequence'(becomes the second line of the fasta).
 	
-	filename : str, the path to the output file. Must have extension '.fasta' or '.fa'.
+	filename : str, the path to the output file. Must have extension '.fasta' or '.fa', optionally
+		followed by a compression extension (i.e. '.fasta.gz').
 
 	append_seq : bool, indicate if sequence should be appended to existing data in the file.
 		Default is True. If False, the existing file is overwritten where appliciable.
@@ -373,17 +914,13 @@ def write_fasta(entry, filename, append_seq = True):
 	if type(entry) == dict:
 		entry = [entry]
 
-	outstring = ''
-
-	for x in entry:
-		str_x = f">{x['name']}\n{x['sequence']}\n"
-		outstring+=str_x
+	outstring = ''.join([_fasta_string(x) for x in entry])
 
 	if append_seq == True:
 		mode = "a"
 	else:
 		mode = "w"
-	file = open(filename, mode)
+	file = _open_output(filename, mode)
 	file.write(outstring)
 	file.close()
 
@@ -398,7 +935,8 @@ def write_fastq(entry, filename, append_seq = True):
 		in dictionary format with the keys: 'name', 'sequence', 'strand', and 'quality'.
 		The values are added to the corresponding line of the fastq record.
 	
-	filename : str, the path to the output file. Must have extension '.fastq' or '.fq'.
+	filename : str, the path to the output file. Must have extension '.fastq' or '.fq', optionally
+		followed by a compression extension (i.e. '.fastq.gz').
 
 	append_seq : bool, indicate if sequence should be appended to existing data in the file
 		Default is True. If False, the existing file is overwritten where appliciable.
@@ -430,19 +968,135 @@ def write_fastq(entry, filename, append_seq = True):
 	if type(entry) == dict:
 		entry = [entry]
 
-	outstring = ''
-
-	for x in entry:
-		str_x = f"@{x['name']}\n{x['sequence']}\n{x['strand']}\n{x['quality']}\n"
-		outstring+=str_x
+	outstring = ''.join([_fastq_string(x) for x in entry])
 
 	if append_seq == True:
 		mode = "a"
 	else:
 		mode = "w"
 
-	file = open(filename, mode)
+	file = _open_output(filename, mode)
 	file.write(outstring)
 	file.close()
 
 
+class ClassWriter:
+	"""
+	Buffered output of classified sequences, to one file per class.
+
+	A single file handle is kept open for each class for the lifetime of the writer (files 
+	are opened when the first record of the class is written). Each call to write groups a 
+	batch of records by their predicted class and adds them to the class buffers, a buffer is 
+	written to its file once it exceeds buffer_size characters. All buffers are flushed and the
+	files closed by the close method, or on leaving a with block.
+
+	Arguments
+	---------
+	outfiles : dict, the output file for each numeric class, as returned by outfile_dict.
+
+	ftype : str, the output format, 'fasta' or 'fastq'. The extensions of the outfiles
+		must match the format. The format 'ids' writes only the name of each record, 
+		one per line (read-ID lists), the outfiles may have any extension.
+
+	buffer_size : int, the number of characters buffered for a class before they are written
+		to its file. Default is 1 MB.
+
+	append_seq : bool, indicate if sequences should be appended to existing data in the files.
+		Default is True. If False, existing files are overwritten.
+
+	Methods
+	---------
+	write : add a batch of records and their numeric class predictions to the output.
+
+	flush : write all buffered records to their files.
+
+	close : flush the buffers and close all files.
+
+	Examples
+	---------
+	>>> from alfie import ex_fasta_file
+	>>> from alfie.classify import classify_records
+	>>> outfiles = outfile_dict(ex_fasta_file)
+	>>> with ClassWriter(outfiles, 'fasta') as writer:
+	>>> 	for batch in iter_read_batches(ex_fasta_file):
+	>>> 		batch, predictions = classify_records(batch)
+	>>> 		writer.write(batch, predictions)
+	"""
+	def __init__(self, outfiles, ftype, buffer_size = 1 << 20, append_seq = True):
+		for x in outfiles.values():
+			if ftype != 'ids' and file_type(x) != ftype:
+				raise ValueError(f"Output file {x} does not have a {ftype} extension.")
+
+		self.outfiles = outfiles
+		self.ftype = ftype
+		self.buffer_size = buffer_size
+		self.mode = "a" if append_seq == True else "w"
+
+		self._handles = {}
+		self._buffers = {k : [] for k in outfiles.keys()}
+		self._sizes = {k : 0 for k in outfiles.keys()}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def _strings(self, records):
+		"""Format a SeqBatch or list of record dictionaries as a list of strings."""
+		if self.ftype == 'ids':
+			names = records.names if isinstance(records, SeqBatch) else [x['name'] for x in records]
+			return [f"{n}\n" for n in names]
+
+		if isinstance(records, SeqBatch):
+			if self.ftype == 'fasta':
+				return [f">{n}\n{s}\n" for n, s in zip(records.names, records.sequences())]
+			return [f"@{n}\n{s}\n{st}\n{q}\n" for n, s, st, q in zip(records.names, 
+						records.sequences(), records.strands, records._split(records.qualities))]
+		
+		if self.ftype == 'fasta':
+			return [_fasta_string(x) for x in records]
+		return [_fastq_string(x) for x in records]
+
+	def write(self, records, predictions):
+		"""
+		Add a batch of records and their numeric class predictions to the output.
+
+		Arguments
+		---------
+		records : SeqBatch or list, the sequence records to write.
+
+		predictions : list like, the numeric class of each record, the keys of outfiles.
+		"""
+		strings = self._strings(records)
+		predictions = np.asarray(predictions)
+
+		for klass in np.unique(predictions):
+			klass = klass.item()
+			out = [strings[i] for i in np.flatnonzero(predictions == klass)]
+			self._buffers[klass].append(''.join(out))
+			self._sizes[klass] += len(self._buffers[klass][-1])
+
+			if self._sizes[klass] >= self.buffer_size:
+				self._flush_class(klass)
+
+	def _flush_class(self, klass):
+		"""Write the buffered records of a class to its file."""
+		if klass not in self._handles:
+			self._handles[klass] = _open_output(self.outfiles[klass], self.mode)
+		self._handles[klass].write(''.join(self._buffers[klass]))
+		self._buffers[klass] = []
+		self._sizes[klass] = 0
+
+	def flush(self):
+		"""Write all buffered records to their files."""
+		for klass in self._buffers.keys():
+			if self._sizes[klass] > 0:
+				self._flush_class(klass)
+
+	def close(self):
+		"""Flush the buffers and close all files."""
+		self.flush()
+		for x in self._handles.values():
+			x.close()
+		self._handles = {}
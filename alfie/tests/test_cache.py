@@ -0,0 +1,62 @@
+import numpy as np
+
+from alfie import fourmer_numpy_file, ex_fastq_file
+from alfie.cache import PredictionCache, model_fingerprint
+from alfie.classify import classify_records, classify_stream
+from alfie.inference import NumpyModel
+from alfie.seqio import read_fastq, iter_read_batches, sequence_digests
+
+
+def test_model_fingerprint():
+
+	model = NumpyModel.load(fourmer_numpy_file)
+	assert model_fingerprint(model) == model_fingerprint(NumpyModel.load(fourmer_numpy_file))
+
+	#a change in the weights changes the fingerprint
+	changed = NumpyModel.load(fourmer_numpy_file)
+	changed.biases[-1][0] += 1e-3
+	assert model_fingerprint(model) != model_fingerprint(changed)
+
+
+def test_prediction_cache(tmp_path):
+
+	filename = str(tmp_path / "cache.sqlite")
+	model = NumpyModel.load(fourmer_numpy_file)
+	records = read_fastq(ex_fastq_file)
+
+	_, expected = classify_records(records, model = model, argmax = False, keep_kmers = False)
+
+	with PredictionCache(filename) as cache:
+		_, predictions = classify_records(records[:60], model = model, argmax = False, cache = cache)
+		assert len(cache) == 60
+		assert np.allclose(predictions, expected[:60])
+
+		#the cached predictions are combined with new ones
+		key = cache.model_key(model)
+		found, values = cache.lookup(key, [b"not a digest"])
+		assert len(found) == 0
+
+		_, predictions = classify_records(records, model = model, cache = cache)
+		assert list(predictions) == list(np.argmax(expected, axis = 1))
+		assert len(cache) == 100
+
+	#predictions persist, and are keyed by the model and the features
+	with PredictionCache(filename, max_entries = 150) as cache:
+		assert len(cache) == 100
+
+		stream = classify_stream(iter_read_batches(ex_fastq_file, batch = 30), model = model, 
+									cache = cache, argmax = False)
+		assert np.allclose(np.concatenate([p for b, p in stream]), expected)
+		assert len(cache) == 100
+
+		changed = NumpyModel.load(fourmer_numpy_file)
+		changed.biases[-1][0] += 1e-3
+		assert cache.model_key(changed) != cache.model_key(model)
+		assert cache.model_key(model, canonical = True) != cache.model_key(model)
+
+		#the least recently used predictions are evicted
+		classify_records(records, model = changed, cache = cache)
+		assert len(cache) == 150
+		digests = sequence_digests(records)
+		assert len(cache.lookup(cache.model_key(changed), digests)[0]) == 100
+		assert len(cache.lookup(cache.model_key(model), digests)[0]) == 50
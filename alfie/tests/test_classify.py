@@ -1,7 +1,16 @@
+import sys
+import subprocess
+
 import pytest
+import numpy as np
+
 from alfie import classify
+from alfie.kmerseq import kmer_frequencies
+from alfie.training import alfie_dnn_default
+from sklearn.svm import LinearSVC
 
-from alfie import example_fasta
+from alfie import example_fasta, example_fastq, ex_fastq_file
+from alfie.seqio import iter_read_batches, iter_read_fastq, read_fastq, SeqBatch
 	
 def test_classification_worklow():
 
@@ -40,3 +49,224 @@ def test_decode_predictions():
 
 	for i, x in enumerate(predictions_custom):
 		assert x == expected_output[i]
+
+	#2d input is decoded row by row
+	assert classify.decode_predictions(np.array([[2, 0], [1, 2]]), tax_list = tax_classes) == \
+		[["sue", "bill"], ["george", "sue"]]
+
+	with pytest.raises(IndexError):
+		classify.decode_predictions([0, -1], tax_list = tax_classes)
+
+
+def test_top_predictions():
+	"""The top-k classes are ordered by probability, the first matches the argmax predictions."""
+	outputs = np.array([[0.1, 0.6, 0.3], [0.5, 0.2, 0.3], [0.4, 0.4, 0.2]])
+
+	classes, probabilities = classify.top_predictions(outputs, top_k = 2)
+	assert classes.tolist() == [[1, 2], [0, 2], [0, 1]]
+	assert np.allclose(probabilities, [[0.6, 0.3], [0.5, 0.3], [0.4, 0.4]])
+	assert classify.top_predictions(outputs, top_k = 5)[0].shape == (3, 3)
+
+	_, expected = classify.classify_records(example_fastq, keep_kmers = False)
+	_, classes, probabilities = classify.classify_records(example_fastq, top_k = 3, keep_kmers = False)
+	assert classes.shape == probabilities.shape == (100, 3)
+	assert list(classes[:, 0]) == list(expected)
+	assert np.all(np.diff(probabilities, axis = 1) <= 0)
+
+	out = list(classify.classify_stream(iter_read_batches(ex_fastq_file, batch = 30), top_k = 1))
+	assert [len(x) for x in out[0]] == [30, 30, 30]
+	assert list(np.concatenate([x[1][:, 0] for x in out])) == list(expected)
+
+
+def test_classify_canonical():
+	"""Canonical feature models give the same prediction for a read and its reverse complement."""
+	model = alfie_dnn_default(in_shape = 136)
+	
+	records = [{"name" : "fwd", "sequence" : example_fasta[0]["sequence"]},
+				{"name" : "rev", "sequence" : example_fasta[0]["sequence"][::-1].translate(
+													str.maketrans("ACGT", "TGCA"))}]
+
+	seq_records, predictions = classify.classify_records(records, model, canonical = True, 
+															argmax = False)
+
+	assert predictions.shape == (2, 5)
+	assert np.allclose(predictions[0], predictions[1])
+	assert seq_records[0]["kmer_data"].labels.shape == (136,)
+
+
+def test_classify_sparse():
+	"""Sparse k-mer features can be passed to models that accept sparse input."""
+	records = [{"name" : x["name"], "sequence" : x["sequence"]} for x in example_fasta[:20]]
+	X = kmer_frequencies([x["sequence"] for x in records], k = 6)
+	y = [x["name"].split('_')[-1] for x in records]
+
+	svm = LinearSVC().fit(X, y)
+
+	seq_records, dense_predictions = classify.classify_records(records, svm, k = 6, argmax = False,
+																keep_kmers = False)
+	assert "kmer_data" not in seq_records[0]
+
+	seq_records, sparse_predictions = classify.classify_records(records, svm, k = 6, argmax = False,
+																	sparse = True)
+	assert list(sparse_predictions) == list(dense_predictions)
+	#dense KmerFeatures are not kept for sparse features
+	assert "kmer_data" not in seq_records[0]
+
+
+def test_classify_batch():
+	"""A columnar SeqBatch gives the same predictions as the list of records."""
+	batch = next(iter_read_batches(ex_fastq_file, batch = None))
+	
+	out_batch, predictions = classify.classify_records(batch)
+	assert out_batch is batch
+
+	seq_records, expected = classify.classify_records(example_fastq)
+	assert list(predictions) == list(expected)
+
+
+def test_classify_stream():
+	"""The streamed predictions match classify_records, in input order."""
+	seq_records, expected = classify.classify_records(read_fastq(ex_fastq_file))
+
+	#predict_size smaller and larger than the batches
+	for predict_size in [15, 1000]:
+		stream = classify.classify_stream(iter_read_batches(ex_fastq_file, batch = 10), 
+											predict_size = predict_size, threads = 3)
+		out = list(stream)
+		assert [len(b) for b, p in out] == [10] * 10
+		assert out[0][0].names[0] == "seq1_plantae"
+		assert list(np.concatenate([p for b, p in out])) == list(expected)
+
+	#lists of records are accepted as well
+	out = list(classify.classify_stream(iter_read_fastq(ex_fastq_file, batch = 30)))
+	assert list(np.concatenate([p for b, p in out])) == list(expected)
+
+	#stopping early shuts the pipeline down
+	stream = classify.classify_stream(iter_read_batches(ex_fastq_file, batch = 10), predict_size = 10)
+	next(stream)
+	stream.close()
+
+	#errors in any stage are raised to the caller
+	with pytest.raises(ValueError):
+		list(classify.classify_stream([[{"name" : "x", "sequence" : "NOTDNA"}]]))
+
+
+
+def test_dereplicate():
+	"""Each distinct sequence is classified once, the predictions match classifying every record."""
+	records = read_fastq(ex_fastq_file)
+	#duplicates, including a lower case copy
+	records = records + records[:40] + [dict(records[5], sequence = records[5]["sequence"].lower())]
+
+	unique, inverse, abundance = classify.dereplicate(records)
+	assert list(unique) == list(range(100))
+	assert list(inverse[100:]) == list(range(40)) + [5]
+	assert list(abundance[:6]) == [2, 2, 2, 2, 2, 3]
+
+	_, expected = classify.classify_records([dict(x) for x in records])
+	derep_records, predictions = classify.classify_records(records, dereplicate = True)
+	assert list(predictions) == list(expected)
+	assert derep_records[0]["abundance"] == 2 and derep_records[99]["abundance"] == 1
+	assert derep_records[-1]["kmer_data"].name == records[-1]["name"]
+
+	batch = SeqBatch.from_records(records)
+	_, batch_predictions = classify.classify_records(batch, dereplicate = True)
+	assert list(batch_predictions) == list(expected)
+
+	#across the batches of a stream
+	derep = classify.Dereplicator()
+	stream = classify.classify_stream([batch.take(range(i, min(i + 30, len(batch)))) 
+										for i in range(0, len(batch), 30)],
+										predict_size = 50, dereplicate = derep)
+	assert list(np.concatenate([p for b, p in stream])) == list(expected)
+	assert len(derep) == 100
+	assert sum(derep.abundance) == len(records)
+	assert derep.names[0] == "seq1_plantae"
+	assert list(derep.predictions) == list(expected[:100])
+
+
+def test_classify_workers():
+	"""Featurizing in a process pool gives the same predictions."""
+	batch = SeqBatch.from_records(read_fastq(ex_fastq_file) * 25)
+
+	_, expected = classify.classify_records(batch)
+	_, predictions = classify.classify_records(batch, workers = 2)
+	assert list(predictions) == list(expected)
+
+
+def test_shared_model_threads():
+	"""A model shared by threads is never asked to predict concurrently."""
+	import time
+	import threading
+	from concurrent.futures import ThreadPoolExecutor
+
+	class SlowModel:
+		def __init__(self):
+			self.active = 0
+			self.overlaps = 0
+			self.lock = threading.Lock()
+
+		def predict(self, x):
+			with self.lock:
+				self.active += 1
+				self.overlaps += self.active > 1
+			time.sleep(0.02)
+			with self.lock:
+				self.active -= 1
+			return np.zeros((x.shape[0], 5))
+
+	model = SlowModel()
+	records = [{"name" : x["name"], "sequence" : x["sequence"]} for x in example_fasta[:10]]
+	with ThreadPoolExecutor(4) as pool:
+		list(pool.map(lambda _ : classify.classify_records(records, model, keep_kmers = False), range(8)))
+	assert model.overlaps == 0
+
+
+def test_classify_cascade():
+	"""Only the low confidence records are reclassified, with the fallback model's features."""
+	from alfie import fourmer_numpy_file
+	from alfie.inference import NumpyModel
+
+	model = NumpyModel.load(fourmer_numpy_file)
+	fallback = alfie_dnn_default(hidden_sizes = [10], in_shape = 4096, n_classes = 5)
+
+	_, outputs = classify.classify_records(example_fastq, model = model, argmax = False, keep_kmers = False)
+	_, fallback_outputs = classify.classify_records(example_fastq, model = fallback, k = 6, 
+														argmax = False, keep_kmers = False)
+	#send the less confident half of the records to the fallback model
+	threshold = np.median(outputs.max(axis = 1))
+	low = outputs.max(axis = 1) < threshold
+	expected = np.where(low[:, None], fallback_outputs, outputs)
+
+	_, cascade_outputs = classify.classify_records(example_fastq, model = model, argmax = False, 
+								fallback_model = fallback, fallback_k = 6, threshold = threshold)
+	assert np.allclose(cascade_outputs, expected, atol = 1e-6)
+
+	_, predictions = classify.classify_records(example_fastq, model = model, fallback_model = fallback, 
+												fallback_k = 6, threshold = threshold, dereplicate = True)
+	assert list(predictions) == list(np.argmax(expected, axis = 1))
+
+	stream = classify.classify_stream(iter_read_batches(ex_fastq_file, batch = 30), model = model, 
+										fallback_model = fallback, fallback_k = 6, threshold = threshold)
+	assert list(np.concatenate([p for b, p in stream])) == list(np.argmax(expected, axis = 1))
+
+	#the fallback model must predict the same classes
+	with pytest.raises(ValueError):
+		classify.classify_records(example_fastq, model = model, threshold = 1.1,
+			fallback_model = alfie_dnn_default(in_shape = 256, n_classes = 3))
+
+def test_lazy_model_loading():
+
+	#importing the modules does not import tensorflow or load the example data
+	code = "import sys, alfie, alfie.seqio, alfie.kmerseq, alfie.classify, alfie.inference, alfie.alf;" +\
+		"assert 'tensorflow' not in sys.modules;" +\
+		"assert 'example_fasta' not in vars(alfie) and 'dnn_k_four' not in vars(alfie);" +\
+		"assert len(alfie.example_fastq) == 100 and 'example_fastq' in vars(alfie);" +\
+		"assert 'tensorflow' not in sys.modules"
+	subprocess.run([sys.executable, "-c", code], check = True)
+
+	import alfie
+	assert alfie.dnn_k_four is alfie.dnn_k_four
+	assert "dnn_k_four" in dir(alfie)
+	with pytest.raises(AttributeError):
+		alfie.dnn_k_five
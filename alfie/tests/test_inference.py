@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+import scipy.sparse as sp
+
+from alfie import dnn_k_four, example_fasta, fourmer_numpy_file
+from alfie.classify import classify_records
+from alfie.inference import NumpyModel, export_weights
+from alfie.kmerseq import kmer_frequencies
+from alfie.training import alfie_dnn_default
+
+
+def test_numpy_model_matches_tensorflow():
+
+	x = kmer_frequencies([r["sequence"] for r in example_fasta])
+
+	numpy_model = NumpyModel.load(fourmer_numpy_file)
+
+	assert len(numpy_model.weights) == len(numpy_model.biases) == len(numpy_model.activations)
+	assert numpy_model.activations[-1] == "softmax"
+
+	expected = dnn_k_four.predict(x)
+	out = numpy_model.predict(x)
+
+	assert out.dtype == np.float32
+	assert out.shape == expected.shape
+	assert np.allclose(out, expected, atol = 1e-5)
+
+	#small batches and sparse input give the same output
+	assert np.allclose(numpy_model.predict(x, batch_size = 7), out)
+	assert np.allclose(numpy_model.predict(sp.csr_matrix(x)), out, atol = 1e-6)
+
+	#usable in place of the tensorflow model
+	_, predictions = classify_records(example_fasta, model = numpy_model)
+	_, expected_predictions = classify_records(example_fasta)
+	assert list(predictions) == list(expected_predictions)
+
+
+def test_export_weights(tmp_path):
+
+	model = alfie_dnn_default(hidden_sizes = [20, 10], dropout = 0.1, in_shape = 256, n_classes = 3)
+	outfile = str(tmp_path / "model.npz")
+
+	export_weights(model, outfile)
+	numpy_model = NumpyModel.load(outfile)
+
+	#dropout layers are skipped
+	assert numpy_model.activations == ["relu", "relu", "relu", "softmax"]
+	assert [w.shape for w in numpy_model.weights] == [(256, 100), (100, 20), (20, 10), (10, 3)]
+
+	x = np.random.rand(25, 256).astype(np.float32)
+	assert np.allclose(numpy_model.predict(x), model.predict(x), atol = 1e-5)
+
+	with pytest.raises(ValueError):
+		NumpyModel(numpy_model.weights, numpy_model.biases, ["relu", "relu", "relu", "swish"])
+
+	with pytest.raises(ValueError):
+		NumpyModel(numpy_model.weights, numpy_model.biases[:3], numpy_model.activations)
@@ -1,5 +1,9 @@
 import pytest
+import numpy as np
+
 from alfie.kmerseq import KmerFeatures
+from alfie.kmerseq import encode_sequences, kmer_counts, kmer_frequencies, kmer_labels, n_kmer_features
+from alfie.kmerseq import multi_kmer_counts, multi_kmer_frequencies, window_kmer_counts
 
 def test_KmerFeatures():
 	"""Unit tests for the KmerFeatures class."""
@@ -34,4 +38,185 @@ def test_KmerFeatures():
 	#should make all the frequencies 0, while avoiding a divide by zero.
 	e_test = KmerFeatures("test2", "")
 
-	assert list(e_test.freq_values()) == [0]*256
\ No newline at end of file
+	assert list(e_test.freq_values()) == [0]*256
+
+def test_kmer_frequencies():
+	"""The batch featurizer matches the frequencies of KmerFeatures."""
+	seqs = ["aaaaaattttttatatatgcgcgccccccgccgcgccgggc",
+			"ACGTNACGTACG-TTGCA",
+			"",
+			"NNNN",
+			"ACG"]
+
+	for k in [1, 2, 4]:
+		expected = np.array([KmerFeatures("x", s, k = k).kmer_freqs for s in seqs])
+
+		freqs64 = kmer_frequencies(seqs, k = k, dtype = np.float64)
+		assert freqs64.shape == (5, 4 ** k)
+		assert np.array_equal(freqs64, expected)
+
+		freqs32 = kmer_frequencies(seqs, k = k)
+		assert freqs32.dtype == np.float32
+		assert np.array_equal(freqs32, expected.astype(np.float32))
+
+	#encoded buffer input gives the same result as a list of strings
+	buffer, offsets = encode_sequences(seqs)
+	assert list(offsets) == [0, 41, 59, 59, 63, 66]
+	assert np.array_equal(kmer_counts(buffer, offsets = offsets), kmer_counts(seqs))
+
+	assert kmer_counts(seqs, k = 2)[0, 0] == KmerFeatures("x", seqs[0], k = 2).items()[0][1]
+
+	with pytest.raises(ValueError):
+		kmer_counts(["ACGT", "NOTDNA"])
+
+
+def test_KmerFeatures_array_backed():
+	"""Counts are an array, labels are shared between instances and k_dict is still available."""
+	kmers1 = KmerFeatures("test1", "ACGTACGTTTGCAN")
+	kmers2 = KmerFeatures("test2", "TTTTTTTTT")
+
+	assert kmers1.labels is kmers2.labels
+	assert kmers1.labels is kmer_labels(4)
+
+	with pytest.raises(AttributeError):
+		kmers1.new_attribute = 1
+
+	assert kmers1.counts.shape == (256,)
+	assert kmers1.k_dict["ACGT"] == 2
+	assert kmers1.k_dict["TTGC"] == 1
+	assert kmers1.values() == kmers1.counts.tolist()
+	assert kmers1.kmer_freqs is kmers1.kmer_freqs
+	assert kmers1.kmer_freqs.flags.writeable == False
+	#freq_values is a new array, which can be normalized in place
+	freqs = kmers1.freq_values()
+	freqs /= freqs.max()
+	assert np.array_equal(kmers1.freq_values() / kmers1.kmer_freqs.max(), freqs)
+
+	#building from a row of a count matrix gives the same instance data
+	counts = kmer_counts(["ACGTACGTTTGCAN", "TTTTTTTTT"])
+	from_counts = KmerFeatures.from_counts("test1", "ACGTACGTTTGCAN", counts[0])
+	assert from_counts.items() == kmers1.items()
+	assert np.array_equal(from_counts.kmer_freqs, kmers1.kmer_freqs)
+
+	kmers2.change_k(3, count = False)
+	assert kmers2.values() == [0] * 64
+	kmers2.change_k(3)
+	assert kmers2.k_dict["TTT"] == 7
+
+
+def test_multi_kmer_counts():
+	"""Single pass multi-k counts match counting each k separately."""
+	seqs = ["aaaaaattttttatatatgcgcgccccccgccgcgccgggc",
+			"ACGTNACGTACG-TTGCAAC",
+			"",
+			"ACGTA"]
+
+	counts = multi_kmer_counts(seqs, ks = [5, 2, 3])
+	assert list(counts.keys()) == [5, 2, 3]
+	for k in [2, 3, 5]:
+		assert np.array_equal(counts[k], kmer_counts(seqs, k = k))
+
+	freqs = multi_kmer_frequencies(seqs, ks = [1, 4], dtype = np.float64)
+	assert np.array_equal(freqs[4], kmer_frequencies(seqs, dtype = np.float64))
+	assert np.array_equal(freqs[1], kmer_frequencies(seqs, k = 1, dtype = np.float64))
+
+
+def test_canonical_kmers():
+	"""Canonical k-mer counts fold reverse complements and ignore orientation."""
+	seq = "AAAAAATTTGCGCGTNACGGT"
+	rev_comp = "ACCGTNACGCGCAAATTTTTT"
+
+	assert n_kmer_features(4, canonical = True) == 136
+	assert n_kmer_features(3, canonical = True) == 32
+	assert list(kmer_labels(2, canonical = True)) == ["AA", "AC", "AG", "AT", "CA", 
+														"CC", "CG", "GA", "GC", "TA"]
+
+	counts = kmer_counts([seq, rev_comp], k = 2, canonical = True)
+	assert counts.shape == (2, 10)
+	assert np.array_equal(counts[0], counts[1])
+	#AA + TT
+	assert counts[0, 0] == 7
+	#palindromes are only counted once
+	assert counts[0, 6] == 3
+
+	kmers = KmerFeatures("test1", seq, k = 2, canonical = True)
+	assert kmers.k_dict["AA"] == 7
+	assert np.array_equal(kmers.kmer_freqs, 
+						kmer_frequencies([rev_comp], k = 2, canonical = True, dtype = np.float64)[0])
+	
+	kmers.change_k(4)
+	assert kmers.labels.shape == (136,)
+
+	multi = multi_kmer_counts([seq, rev_comp], ks = [2, 4], canonical = True)
+	assert np.array_equal(multi[2], counts)
+	assert np.array_equal(multi[4], kmer_counts([seq, rev_comp], canonical = True))
+
+
+def test_window_kmer_counts(monkeypatch):
+	"""Window counts from prefix counts match the counts of the substrings."""
+	rng = np.random.default_rng(1738)
+	seqs = ["".join(rng.choice(list("ACGTN-"), p = [0.24] * 4 + [0.02] * 2, size = rng.integers(5, 300)))
+				for _ in range(50)]
+	record = rng.integers(0, 50, 500)
+	lengths = np.array([len(x) for x in seqs])[record]
+	starts = rng.integers(0, lengths)
+	#includes empty windows and windows shorter than k
+	ends = starts + rng.integers(0, lengths - starts + 1)
+	windows = [seqs[r][s:e] for r, s, e in zip(record, starts, ends)]
+
+	for k in [1, 4]:
+		for canonical in [False, True]:
+			counts = window_kmer_counts(seqs, record, starts, ends, k = k, canonical = canonical)
+			assert counts.dtype == np.int32
+			assert np.array_equal(counts, kmer_counts(windows, k = k, canonical = canonical))
+
+	#an encoded buffer
+	buffer, offsets = encode_sequences(seqs)
+	assert np.array_equal(window_kmer_counts(buffer, record, starts, ends, offsets = offsets),
+							kmer_counts(windows))
+	assert window_kmer_counts(seqs, [], [], []).shape == (0, 256)
+
+	#in blocks of windows, of random order
+	import alfie.kmerseq as kmerseq
+	monkeypatch.setattr(kmerseq, "_BLOCK_CELLS", 5000)
+	assert np.array_equal(window_kmer_counts(seqs, record, starts, ends), kmer_counts(windows))
+
+
+def test_kmer_counts_blocks(monkeypatch):
+	"""Counting in blocks of records gives the same counts as a single block."""
+	import alfie.kmerseq as kmerseq
+	rng = np.random.default_rng(1738)
+	seqs = ["".join(rng.choice(list("ACGTN"), size = rng.integers(0, 300))) for _ in range(200)]
+
+	counts = kmer_counts(seqs)
+	sparse = kmer_counts(seqs, k = 6, sparse = True)
+	freqs = kmer_frequencies(seqs, canonical = True)
+	multi = multi_kmer_counts(seqs, ks = [2, 4])
+
+	monkeypatch.setattr(kmerseq, "_BLOCK_BASES", 1000)
+	assert len(list(kmerseq._record_blocks(encode_sequences(seqs)[1]))) > 10
+	#blocks are also limited by the size of their count matrix
+	monkeypatch.setattr(kmerseq, "_BLOCK_CELLS", 4096 * 3)
+	assert max(b - a for a, b in kmerseq._record_blocks(encode_sequences(seqs)[1], 4096)) == 3
+	assert np.array_equal(kmer_counts(seqs), counts)
+	assert (kmer_counts(seqs, k = 6, sparse = True) != sparse).nnz == 0
+	assert np.array_equal(kmer_frequencies(seqs, canonical = True), freqs)
+	assert all(np.array_equal(multi_kmer_counts(seqs, ks = [2, 4])[k], multi[k]) for k in [2, 4])
+
+
+def test_parallel_kmer_features():
+	"""The process pool gives the same features as the calling process, in input order."""
+	rng = np.random.default_rng(4)
+	seqs = ["".join(rng.choice(list("ACGTN"), size = rng.integers(0, 300))) for i in range(2500)]
+
+	counts = kmer_counts(seqs, workers = 2)
+	assert counts.dtype == np.int32
+	assert np.array_equal(counts, kmer_counts(seqs))
+
+	buffer, offsets = encode_sequences(seqs)
+	freqs = kmer_frequencies(buffer, offsets = offsets, k = 3, canonical = True, workers = 2)
+	assert freqs.dtype == np.float32
+	assert np.array_equal(freqs, kmer_frequencies(seqs, k = 3, canonical = True))
+
+	#small inputs are featurized in the calling process
+	assert np.array_equal(kmer_frequencies(seqs[:10], workers = 2), kmer_frequencies(seqs[:10]))
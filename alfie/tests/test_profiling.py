@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from alfie import example_fasta, ex_fastq_file, fourmer_numpy_file
+from alfie.classify import classify_records, classify_stream
+from alfie.inference import NumpyModel
+from alfie.profiling import Profile, timed
+from alfie.seqio import iter_read_batches
+
+
+def test_profile_stages(tmp_path):
+
+	profile = Profile()
+	with profile.stage("parse", records = 10, n_bytes = 1000):
+		pass
+	profile.add("parse", 0.5, 10, 1000)
+	profile.add("predict", 0.0, 5)
+
+	out = profile.to_dict()
+	assert list(out["stages"]) == ["parse", "predict"]
+	assert out["stages"]["parse"]["records"] == 20
+	assert out["stages"]["parse"]["bytes"] == 2000
+	assert out["stages"]["parse"]["calls"] == 2
+	assert out["stages"]["parse"]["records_per_second"] <= 40
+	#no time recorded, no throughput
+	assert out["stages"]["predict"]["records_per_second"] == None
+	assert out["peak_rss_mb"] == None or out["peak_rss_mb"] > 0
+
+	outfile = str(tmp_path / "profile.json")
+	profile.to_json(outfile)
+	with open(outfile) as f:
+		assert json.load(f)["stages"]["parse"]["records"] == 20
+
+	report = profile.report().split("\n")
+	assert report[0].split()[0] == "stage"
+	assert report[1].split()[0] == "parse"
+	assert report[-1].startswith("wall time")
+
+	#errors are still timed, and no profile times nothing
+	with pytest.raises(ValueError):
+		with timed(profile, "write", 1):
+			raise ValueError
+	assert profile.stages["write"]["calls"] == 1
+	with timed(None, "write", 1):
+		pass
+
+
+def test_profile_classification():
+
+	model = NumpyModel.load(fourmer_numpy_file)
+
+	profile = Profile()
+	classify_records(example_fasta, model, keep_kmers = False, profile = profile)
+	assert list(profile.stages) == ["featurize", "predict"]
+	assert profile.stages["featurize"]["records"] == 100
+	assert profile.stages["featurize"]["bytes"] == sum(len(x["sequence"]) for x in example_fasta)
+	assert profile.stages["predict"]["records"] == 100
+
+	profile = Profile()
+	for _ in classify_stream(iter_read_batches(ex_fastq_file, 30), model, profile = profile):
+		pass
+	assert set(profile.stages) == {"parse", "featurize", "predict"}
+	assert profile.stages["parse"]["records"] == 100
+	assert profile.stages["parse"]["calls"] == 4
+	assert profile.stages["featurize"]["records"] == 100
+	assert profile.stages["predict"]["records"] == 100
@@ -1,9 +1,11 @@
 import os
+import json
 import sys
 import pytest
 
 from alfie import alf
-from alfie import ex_fasta_file, ex_fastq_file
+from alfie import seqio
+from alfie import ex_fasta_file, ex_fastq_file, fourmer_numpy_file
 
 
 def test_argparser():
@@ -16,16 +18,29 @@ def test_argparser():
 	assert out1.kmer == 4
 	assert out1.batch == 0
 	assert out1.classes == 'kingdoms'
+	assert out1.canonical == False
+	assert out1.compress == None
+	assert out1.dereplicate == False
+	assert out1.cache == None
+	assert out1.top_k == 0
+	assert out1.fallback_model == None
+	assert out1.threshold == 0.9
+	assert out1.jobs == 2
+	assert out1.summary == False
+	assert out1.read_ids == False
+	assert out1.profile == False
 
 	out2 = alf.alfie_parser(['-f', 'example.fasta',
 							'-k', '10',
-							'-m', 'wacky_custom'])
+							'-m', 'wacky_custom',
+							'-r'])
 
 	assert out2.file == 'example.fasta'
 	assert out2.model == 'wacky_custom'
 	assert out2.kmer == 10
 	assert out2.batch == 0
 	assert out2.classes == 'kingdoms'
+	assert out2.canonical == True
 
 
 def test_main_with_args():
@@ -58,6 +73,17 @@ def test_main_with_args():
 	os.rmdir("alfie_out")
 
 
+	#process a fasta file with the numpy model
+	sys.argv = ['alfie', "-f", ex_fasta_file, "-m", fourmer_numpy_file]
+	alf.main()
+
+	assert sorted(os.listdir('alfie_out')) == fasta_main_outputs
+	assert len(seqio.read_fasta('alfie_out/animalia_example_data.fasta')) > 0
+	for x in fasta_main_outputs:
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+
 	#batch process a fasta file
 	sys.argv = ['alfie', "-f", ex_fasta_file, "-b", "20"]
 	alf.main()
@@ -94,19 +120,142 @@ def test_main_with_args():
 		os.remove("alfie_out/"+x)
 	os.rmdir("alfie_out")
 
-	#batch process a fastq file
-	sys.argv = ['alfie', "-f", ex_fastq_file, "-b", "20"]
+	#dereplicate a fastq file, with an abundance table and a prediction cache
+	sys.argv = ['alfie', "-f", ex_fastq_file, "-d", "-e", "alfie_test_cache.sqlite"]
 	alf.main()
+	alf.main()
+	for x in os.listdir('.'):
+		if x.startswith('alfie_test_cache.sqlite'):
+			os.remove(x)
 
-	fastq_main_outputs = ['animalia_example_data.fastq',
-							'bacteria_example_data.fastq',
-							'fungi_example_data.fastq',
-							'plantae_example_data.fastq',
-							'protista_example_data.fastq']
+	assert sorted(os.listdir('alfie_out')) == ['abundance_example_data.fastq.tsv'] + fastq_main_outputs
+	with open('alfie_out/abundance_example_data.fastq.tsv') as f:
+		table = f.readlines()
+	assert len(table) == 101
+	assert table[0] == "name\tabundance\tclass\n"
+	assert table[1] == "seq1_plantae\t1\tplantae\n"
+
+	for x in fastq_main_outputs + ['abundance_example_data.fastq.tsv']:
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+	#write the top 2 classes of each sequence, with a cascade to the tensorflow model
+	sys.argv = ['alfie', "-f", ex_fastq_file, "-t", "2", "-m", fourmer_numpy_file, 
+				"--fallback_model", "4mer", "--threshold", "0.99"]
+	alf.main()
+
+	with open('alfie_out/predictions_example_data.fastq.tsv') as f:
+		table = [x.rstrip('\n').split('\t') for x in f]
+	assert len(table) == 101
+	assert table[0] == ["name", "class_1", "probability_1", "class_2", "probability_2"]
+	assert table[1][:2] == ["seq1_plantae", "plantae"]
+
+	for x in fastq_main_outputs + ['predictions_example_data.fastq.tsv']:
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+	#batch process a fastq file, with compressed output
+	sys.argv = ['alfie', "-f", ex_fastq_file, "-b", "20", "-z", "gz"]
+	alf.main()
+
+	fastq_main_outputs = ['animalia_example_data.fastq.gz',
+							'bacteria_example_data.fastq.gz',
+							'fungi_example_data.fastq.gz',
+							'plantae_example_data.fastq.gz',
+							'protista_example_data.fastq.gz']
 
 	#check for outputs
 	assert sorted(os.listdir('alfie_out')) == fastq_main_outputs
+	assert seqio.read_fastq('alfie_out/animalia_example_data.fastq.gz')[0]['name'] == 'seq4_animalia'
 
 	for x in fastq_main_outputs:
 		os.remove("alfie_out/"+x)
 	os.rmdir("alfie_out")
+
+
+def test_main_with_directory(tmp_path):
+
+	#a directory with several samples, and a file that is not sequence data
+	for i in range(3):
+		seqio.write_fastq(seqio.read_fastq(ex_fastq_file)[i * 10:(i + 1) * 10], 
+							str(tmp_path / f"sample{i}.fastq.gz"))
+	seqio.write_fasta(seqio.read_fasta(ex_fasta_file), str(tmp_path / "sample3.fasta"))
+	(tmp_path / "notes.txt").write_text("not sequences")
+
+	sys.argv = ['alfie', "-f", str(tmp_path), "-j", "3"]
+	alf.main()
+
+	#output files are only made for the classes present in each sample
+	outputs = os.listdir('alfie_out')
+	assert 'alfie_summary.tsv' in outputs
+	assert 'plantae_sample0.fastq' in outputs
+	assert 'animalia_sample3.fasta' in outputs
+	assert all("_sample" in x for x in outputs if x != 'alfie_summary.tsv')
+
+	with open('alfie_out/alfie_summary.tsv') as f:
+		summary = [x.rstrip('\n').split('\t') for x in f]
+	assert summary[0] == ["file", "total", "animalia", "bacteria", "fungi", "plantae", "protista"]
+	assert [x[1] for x in summary[1:]] == ["10", "10", "10", "100", "130"]
+	assert summary[4][0] == str(tmp_path / "sample3.fasta")
+
+	for x in outputs:
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+	#a glob pattern
+	sys.argv = ['alfie', "-f", str(tmp_path / "sample[12].fastq.gz")]
+	alf.main()
+	with open('alfie_out/alfie_summary.tsv') as f:
+		assert [x.split('\t')[1] for x in f] == ["total", "10", "10", "20"]
+
+	for x in os.listdir('alfie_out'):
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+	with pytest.raises(ValueError):
+		seqio.input_files(str(tmp_path / "*.txt"))
+
+
+def test_main_summary_mode():
+
+	#only the class counts
+	sys.argv = ['alfie', "-f", ex_fasta_file, "-s"]
+	alf.main()
+	assert os.listdir('alfie_out') == ['counts_example_data.fasta.tsv']
+
+	with open('alfie_out/counts_example_data.fasta.tsv') as f:
+		table = [x.rstrip('\n').split('\t') for x in f]
+	assert table[0] == ["class", "count"]
+	assert [x[0] for x in table[1:]] == ["animalia", "bacteria", "fungi", "plantae", "protista"]
+	assert sum(int(x[1]) for x in table[1:]) == 100
+	os.remove('alfie_out/counts_example_data.fasta.tsv')
+
+	#with lists of the read names in each class
+	sys.argv = ['alfie', "-f", ex_fastq_file, "-s", "-i"]
+	alf.main()
+	assert 'animalia_example_data.fastq.ids' in os.listdir('alfie_out')
+
+	with open('alfie_out/animalia_example_data.fastq.ids') as f:
+		names = f.read().split()
+	assert names[0] == 'seq4_animalia'
+	assert all(x.endswith('animalia') for x in names)
+
+	for x in os.listdir('alfie_out'):
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
+
+
+def test_main_profile():
+
+	sys.argv = ['alfie', "-f", ex_fasta_file, "-s", "-p"]
+	alf.main()
+
+	with open('alfie_out/alfie_profile.json') as f:
+		profile = json.load(f)
+	assert set(profile["stages"]) == {"parse", "featurize", "predict", "write"}
+	assert all(x["records"] == 100 for x in profile["stages"].values())
+	assert profile["wall_seconds"] > 0
+
+	for x in os.listdir('alfie_out'):
+		os.remove("alfie_out/"+x)
+	os.rmdir("alfie_out")
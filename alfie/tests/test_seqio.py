@@ -2,15 +2,25 @@ import os
 import types
 import pytest
 
-from alfie.seqio import file_type, outfile_dict
+from alfie.seqio import file_type, compression_type, outfile_dict, input_files
 from alfie.seqio import read_fasta, read_fastq
 from alfie.seqio import iter_read_fasta, iter_read_fastq
 from alfie.seqio import write_fasta, write_fastq
+from alfie.seqio import iter_read_batches, SeqBatch, ClassWriter, sequence_digests
 
 from alfie import example_fasta, example_fastq
 from alfie import ex_fasta_file, ex_fastq_file
 
 
+def test_input_files():
+	data_folder = os.path.dirname(ex_fasta_file)
+	assert input_files(ex_fasta_file) == [ex_fasta_file]
+	assert input_files(data_folder) == [ex_fasta_file, ex_fastq_file]
+	assert input_files(os.path.join(data_folder, "*.fastq")) == [ex_fastq_file]
+	with pytest.raises(ValueError):
+		input_files(os.path.join(data_folder, "*.npz"))
+
+
 def test_file_type():
 	"""Test that the file type is properly identified."""
 	assert file_type("file_1.fa") == "fasta"
@@ -19,6 +29,10 @@ def test_file_type():
 	assert file_type("file_2.fq") == "fastq"
 	assert file_type("file_2.fastq") == "fastq"
 	assert file_type("in.file_2.fq") == "fastq"
+	assert file_type("file_2.fastq.gz") == "fastq"
+	assert file_type("file_1.fa.bz2") == "fasta"
+	assert compression_type("file_1.fa.xz") == "xz"
+	assert compression_type("file_1.fa") == None
 
 	with pytest.raises(ValueError):
 		file_type("infile_2.txt")
@@ -26,6 +40,9 @@ def test_file_type():
 	with pytest.raises(ValueError):
 		file_type("in.file_2.csv")
 
+	with pytest.raises(ValueError):
+		file_type("in.file_2.gz")
+
 
 def test_outfile_builder():
 	"""Test that the output file set is generated properly."""
@@ -47,6 +64,13 @@ def test_outfile_builder():
 	out2 = outfile_dict("in_data/test.fastq", folder_prefix = 'diff_place/') 
 	assert out2 == expected_kingdom_dict2
 
+	out3 = outfile_dict("in_data/test.fastq.gz", labels = ["a", "b"], folder_prefix = None)
+	assert out3 == {0: "a_test.fastq", 1: "b_test.fastq"}
+
+	out4 = outfile_dict("in_data/test.fastq", labels = ["a", "b"], folder_prefix = None, 
+							compression = "gz")
+	assert out4 == {0: "a_test.fastq.gz", 1: "b_test.fastq.gz"}
+
 	os.rmdir("alfie_out")
 	os.rmdir("diff_place")
 
@@ -158,3 +182,97 @@ def test_fastq_writer():
 
 	os.remove('temp_test/test_example_out.fq')
 	os.rmdir("temp_test/")
+
+
+def test_iter_batch_reader():
+	"""The columnar reader gives the same records as the dictionary readers."""
+	for filename, records in [(ex_fasta_file, read_fasta(ex_fasta_file)), 
+								(ex_fastq_file, read_fastq(ex_fastq_file))]:
+
+		batches = list(iter_read_batches(filename, batch = 30, chunk_size = 1000))
+		assert [len(b) for b in batches] == [30, 30, 30, 10]
+		assert all(isinstance(b, SeqBatch) for b in batches)
+
+		all_records = []
+		for b in batches:
+			all_records.extend(b.to_records())
+		assert all_records == records
+
+		whole = list(iter_read_batches(filename, batch = None, use_mmap = True))
+		assert len(whole) == 1
+		assert whole[0].to_records() == records
+		assert whole[0].sequences()[2] == records[2]['sequence']
+		assert whole[0].offsets[-1] == len(whole[0].buffer)
+
+		assert SeqBatch.from_records(records).to_records() == records
+
+	assert batches[0].ftype == 'fastq'
+	assert whole[0].names[:2] == ["seq1_plantae", "seq2_bacteria"]
+
+
+
+def test_batch_take_and_digests():
+	records = read_fastq(ex_fastq_file)
+	batch = SeqBatch.from_records(records)
+
+	subset = batch.take([7, 2, 7])
+	assert subset.to_records() == [records[7], records[2], records[7]]
+	assert len(batch.take([])) == 0
+
+	digests = sequence_digests(batch)
+	assert digests == sequence_digests(records)
+	assert len(set(digests)) == 100
+	assert len(digests[0]) == 16
+
+	#case insensitive
+	lower = [{"name" : "a", "sequence" : records[0]["sequence"].lower()}]
+	assert sequence_digests(lower) == digests[:1]
+	assert sequence_digests(SeqBatch.from_records(lower)) == digests[:1]
+
+def test_class_writer():
+	"""Records are written to the file of their class, in input order."""
+	fastq_records = read_fastq(ex_fastq_file)
+	predictions = [i % 3 for i in range(len(fastq_records))]
+	outfiles = outfile_dict(ex_fastq_file, labels = ["a", "b", "c"], folder_prefix = "temp_test/")
+
+	with pytest.raises(ValueError):
+		ClassWriter(outfiles, 'fasta')
+
+	#small buffer, so the files are written to before the writer is closed
+	with ClassWriter(outfiles, 'fastq', buffer_size = 1000) as writer:
+		writer.write(fastq_records[:50], predictions[:50])
+		assert os.path.exists(outfiles[0])
+		writer.write(next(iter_read_batches(ex_fastq_file, batch = None)), predictions)
+
+	for klass in range(3):
+		expected = [x for i, x in enumerate(fastq_records) if predictions[i] == klass]
+		assert read_fastq(outfiles[klass]) == expected[:17 - (klass == 2)] + expected
+		os.remove(outfiles[klass])
+
+	os.rmdir("temp_test/")
+
+
+def test_compressed_io():
+	"""Compressed files are read and written transparently."""
+	fasta_records = read_fasta(ex_fasta_file)
+	fastq_records = read_fastq(ex_fastq_file)
+
+	os.mkdir('temp_test/')
+
+	for ext in ["gz", "bz2", "xz"]:
+		write_fasta(fasta_records, f'temp_test/out.fa.{ext}')
+		write_fastq(fastq_records, f'temp_test/out.fq.{ext}')
+
+		assert read_fasta(f'temp_test/out.fa.{ext}') == fasta_records
+		assert read_fastq(f'temp_test/out.fq.{ext}') == fastq_records
+
+		batches = list(iter_read_fastq(f'temp_test/out.fq.{ext}', batch = 30))
+		assert [len(x) for x in batches] == [30, 30, 30, 10]
+
+		batches = list(iter_read_batches(f'temp_test/out.fa.{ext}', batch = 30, use_mmap = True))
+		assert batches[0].to_records() == fasta_records[:30]
+
+		os.remove(f'temp_test/out.fa.{ext}')
+		os.remove(f'temp_test/out.fq.{ext}')
+
+	os.rmdir("temp_test/")
@@ -1,9 +1,11 @@
 """Unit tests for the module: alfie.training """
+import os
 import pytest
 import numpy as np
 import pandas as pd
 
 import alfie.training as training
+from alfie.kmerseq import kmer_frequencies
 
 def test_split():
 	"""Tests for the stratified_taxon_split function."""
@@ -69,6 +71,181 @@ def test_process_sequences():
 	assert np.all(out_dat2.ids == ex_dat.processid)
 	assert out_dat2['data'][0].shape == (16,)
 
+	#canonical k-mer features
+	out_dat3 = training.process_sequences(ex_dat, canonical = True, subsample = False)
+	assert out_dat3['data'][0].shape == (136,)
+
+	#sparse k-mer features, one row per observation
+	out_dat4 = training.process_sequences(ex_dat, k = 6, sparse = True, subsample = False)
+	assert out_dat4['data'].shape == (5, 4096)
+	assert np.allclose(out_dat4['data'][1].toarray()[0],
+						training.process_sequences(ex_dat, k = 6, subsample = False)['data'][1])
+
+	with pytest.raises(ValueError):
+		training.process_sequences(ex_dat, sparse = True, to_dataframe = True)
+
+
+def test_process_sequences_store(tmp_path, monkeypatch):
+
+	ex_dat = pd.DataFrame({"processid" : ["ex1", "ex2", "ex3", "ex4", "ex5",],
+							"sequence" : ["AAAAAG" * 50 , "AAATAA" * 50, "AAGAAA" * 50, "TTTTAT" * 50, "TCTTCT" * 50],
+							"kingdom" : ["animalia", "bacteria", "fungi", "plantae", "protista"]})
+	store = str(tmp_path / "store")
+
+	out = training.process_sequences(ex_dat, n = 3, seed = 1738, store = store)
+	assert isinstance(out['data'], np.memmap)
+	assert out['data'].shape == (15, 256)
+	assert out['data'].dtype == np.float32
+	assert list(out['ids'][:4]) == ["ex1"] * 3 + ["ex2"]
+	assert list(out['labels'][-1:]) == ["protista"]
+	assert 'seq' not in out
+
+	#the same features as without a store
+	expected = training.process_sequences(ex_dat, n = 3, seed = 1738)
+	assert np.allclose(out['data'], np.array(expected['data']))
+	assert len(os.listdir(store)) == 3
+
+	#a second call reuses the store, without featurizing
+	def fail(*args, **kwargs):
+		raise AssertionError("features were recomputed")
+	monkeypatch.setattr(training, "kmer_frequencies", fail)
+	again = training.process_sequences(ex_dat, n = 3, seed = 1738, store = store)
+	assert np.array_equal(again['data'], out['data'])
+	monkeypatch.undo()
+
+	#different settings are stored separately
+	whole = training.process_sequences(ex_dat, k = 2, subsample = False, store = store)
+	assert whole['data'].shape == (5, 16)
+	assert len(os.listdir(store)) == 6
+
+	#int labels are stored as ints
+	encoded = ex_dat.assign(kingdom = range(5))
+	ints = training.process_sequences(encoded, subsample = False, store = store)
+	assert ints['labels'].dtype.kind == 'i'
+	assert list(ints['labels']) == [0, 1, 2, 3, 4]
+
+	#string labels with the same text are stored separately
+	text = ex_dat.assign(kingdom = [str(x) for x in range(5)])
+	strs = training.process_sequences(text, subsample = False, store = store)
+	assert list(strs['labels']) == ["0", "1", "2", "3", "4"]
+	assert len(os.listdir(store)) == 12
+
+	#an incomplete store is rewritten
+	os.remove(os.path.join(store, [x for x in os.listdir(store) if x.endswith("_ids.npy")][0]))
+	training.process_sequences(ex_dat, n = 3, seed = 1738, store = store)
+	training.process_sequences(ex_dat, k = 2, subsample = False, store = store)
+	training.process_sequences(encoded, subsample = False, store = store)
+	training.process_sequences(text, subsample = False, store = store)
+	assert len(os.listdir(store)) == 12
+
+	#a failed write leaves no temporary file in the store
+	monkeypatch.setattr(training, "kmer_frequencies", fail)
+	with pytest.raises(AssertionError):
+		training.process_sequences(ex_dat, k = 3, subsample = False, store = store)
+	monkeypatch.undo()
+	assert not any(x.endswith(".tmp") for x in os.listdir(store))
+
+	#with workers, blocks are featurized together so they can be split between processes
+	sizes = []
+	def spy(seqs, **kwargs):
+		sizes.append(len(seqs))
+		return kmer_frequencies(seqs, **kwargs)
+	monkeypatch.setattr(training, "kmer_frequencies", spy)
+	many = pd.concat([ex_dat] * 500, ignore_index = True)
+	parallel = training.process_sequences(many, seed = 1, workers = 2, store = store)
+	monkeypatch.undo()
+	assert sizes == [2000, 500]
+	assert np.allclose(parallel['data'], np.array(training.process_sequences(many, seed = 1)['data']))
+
+	with pytest.raises(ValueError):
+		training.process_sequences(ex_dat, store = store)
+	with pytest.raises(ValueError):
+		training.process_sequences(ex_dat, seed = 1, sparse = True, store = store)
+
+
+def test_build_training_data():
+
+	ex_dat = pd.DataFrame({"processid" : ["ex1", "ex2", "ex3", "ex4", "ex5",],
+							"sequence" : ["AAAAAG" * 50 , "AAATAA" * 50, "AAGAAA" * 50, "TTTTAT" * 50, "TCTTCT" * 50],
+							"kingdom" : ["plantae", "bacteria", "fungi", "plantae", "protista"]})
+
+	out = training.build_training_data(ex_dat, n = 4, seed = 1738, keep_seq = True, chunk_size = 7)
+
+	assert out['data'].shape == (20, 256)
+	assert out['data'].dtype == np.float32
+	assert list(out['classes']) == ["bacteria", "fungi", "plantae", "protista"]
+	assert list(out['labels'][::4]) == [2, 0, 1, 2, 3]
+	assert list(out['ids'][:5]) == ["ex1"] * 4 + ["ex2"]
+
+	#the windows are substrings of their sequence, within the size range
+	for i, x in zip(out['ids'], out['seq']):
+		assert x in ex_dat.sequence[ex_dat.processid == i].iloc[0]
+		assert 200 <= len(x) < 300
+	assert np.allclose(out['data'], kmer_frequencies(out['seq']))
+
+	#repeatable with a seed
+	assert np.all(training.build_training_data(ex_dat, n = 4, seed = 1738)['data'] == out['data'])
+
+	#whole sequences, with the classes in a given order
+	out2 = training.build_training_data(ex_dat, subsample = False, canonical = True,
+										classes = ["protista", "plantae", "fungi", "bacteria"])
+	assert 'seq' not in out2
+	assert list(out2['labels']) == [1, 3, 2, 1, 0]
+	assert np.allclose(out2['data'], kmer_frequencies(list(ex_dat.sequence), canonical = True))
+
+	#the classes of another training set, as an array
+	out3 = training.build_training_data(ex_dat.iloc[:2], subsample = False, classes = out['classes'])
+	assert list(out3['classes']) == list(out['classes'])
+	assert list(out3['labels']) == [2, 0]
+
+	with pytest.raises(ValueError):
+		training.build_training_data(ex_dat, classes = ["plantae"])
+
+	with pytest.raises(ValueError):
+		training.build_training_data(ex_dat, min_size = 400)
+
+
+def test_window_sequence():
+
+	ex_dat = pd.DataFrame({"sequence" : ["AAAAAG" * 50 , "AAATAA" * 50, "AAGAAA" * 50, "TTTTAT" * 50, "TCTTCT" * 50],
+							"kingdom" : ["plantae", "bacteria", "fungi", "plantae", "protista"]})
+
+	windows = training.WindowSequence(ex_dat, n = 10, batch_size = 16, seed = 1738)
+	assert len(windows) == 4
+	assert list(windows.classes) == ["bacteria", "fungi", "plantae", "protista"]
+
+	x, y = windows[0]
+	assert x.shape == (16, 256)
+	assert x.dtype == np.float32
+	x_last, y_last = windows[3]
+	assert x_last.shape == (2, 256)
+
+	#the features are those of the windows of the epoch
+	subseqs = [ex_dat.sequence[r][s:e] for r, s, e in 
+				zip(windows._record[:16], windows._starts[:16], windows._ends[:16])]
+	assert all(200 <= len(x) < 300 for x in subseqs)
+	assert np.allclose(x, kmer_frequencies(subseqs))
+	assert np.all(y == training._encode_labels(ex_dat.kingdom)[1][windows._record[:16]])
+
+	#repeatable with a seed, new windows every epoch
+	assert np.all(training.WindowSequence(ex_dat, n = 10, batch_size = 16, seed = 1738)[0][0] == x)
+	windows.on_epoch_end()
+	assert np.any(windows[0][0] != x)
+
+	#windows in sequence order
+	ordered = training.WindowSequence(ex_dat, n = 2, batch_size = 4, shuffle = False, seed = 1)
+	assert list(ordered[0][1]) == [2, 2, 0, 0]
+
+	#the classes of another training set, as an array
+	reordered = training.WindowSequence(ex_dat, n = 2, batch_size = 4, shuffle = False, seed = 1,
+										classes = windows.classes[::-1])
+	assert list(reordered[0][1]) == [1, 1, 3, 3]
+
+	model = training.alfie_dnn_default(in_shape = windows.n_features, n_classes = 4)
+	model.fit(windows, epochs = 2, verbose = 0)
+
+	with pytest.raises(ValueError):
+		training.WindowSequence(ex_dat, min_size = 400)
 
 
 def test_shuffle_unison():
@@ -92,6 +269,62 @@ def test_shuffle_unison():
 	with pytest.raises(ValueError):
 		training.shuffle_unison(x, np.array([[1,1],[1,2]]), seed = 1738)
 
+
+def test_random_generators():
+	"""Seeded sampling is repeatable, accepts Generators and leaves the global random state alone."""
+	in_seq = "AAAAAAAAAATTTTTTTTTTGGGGGGGGGGCCCCCCCCCCAAAAAAAAAATTTTTTTTTTGGGGGGGGGG"
+
+	np.random.seed(42)
+	expected = np.random.rand()
+	np.random.seed(42)
+	training.sample_seq(in_seq, min_size = 25, max_size = 70, seed = 1738)
+	training.shuffle_unison(np.arange(5), np.arange(5), seed = 1738)
+	assert np.random.rand() == expected
+
+	#generators are drawn from, seed sequences give repeatable samples
+	rng = np.random.default_rng(1738)
+	out1 = training.sample_seq(in_seq, min_size = 25, max_size = 70, n = 3, seed = rng)
+	out2 = training.sample_seq(in_seq, min_size = 25, max_size = 70, n = 3, seed = rng)
+	assert out1 != out2
+	assert out1 == training.sample_seq(in_seq, min_size = 25, max_size = 70, n = 3, 
+										seed = np.random.default_rng(1738))
+	assert training.sample_seq(in_seq, 25, 70, 3, np.random.SeedSequence(5)) == \
+			training.sample_seq(in_seq, 25, 70, 3, np.random.SeedSequence(5))
+
+	x, y = training.shuffle_unison(np.arange(10), np.arange(10), seed = np.random.default_rng(1))
+	assert np.all(x == y)
+	assert np.all(x == training.shuffle_unison(np.arange(10), np.arange(10), 
+												seed = np.random.default_rng(1))[0])
+
+	data = pd.DataFrame({"phylum" : ["Mollusca"]*10 + ["Arthropoda"] * 15, "data_col" : range(25)})
+	train1, _ = training.stratified_taxon_split(data, "phylum", silent = True, seed = np.random.default_rng(3))
+	train2, _ = training.stratified_taxon_split(data, "phylum", silent = True, seed = np.random.default_rng(3))
+	assert list(train1.index) == list(train2.index)
+
+	#independent streams, repeatable for a seed
+	rngs = training.spawn_generators(1738, 3)
+	draws = [x.integers(0, 1 << 30) for x in rngs]
+	assert len(set(draws)) == 3
+	assert draws == [x.integers(0, 1 << 30) for x in training.spawn_generators(1738, 3)]
+
+	#process_sequences gives the same training set for a seed, with different windows for each row
+	ex_dat = pd.DataFrame({"processid" : [f"ex{i}" for i in range(1500)],
+							"sequence" : ["ACGTTGCAAG" * 40] * 1500,
+							"kingdom" : ["animalia"] * 1500})
+	out1 = training.process_sequences(ex_dat, n = 2, seed = 1738)
+	out2 = training.process_sequences(ex_dat, n = 2, seed = 1738)
+	assert out1['seq'] == out2['seq']
+	assert len(set(out1['seq'])) > 1000
+	assert out1['seq'] != training.process_sequences(ex_dat, n = 2, seed = 1739)['seq']
+
+	#without a seed, the output is repeatable from the global random state
+	np.random.seed(1738)
+	out3 = training.process_sequences(ex_dat, n = 2)
+	np.random.seed(1738)
+	assert out3['seq'] == training.process_sequences(ex_dat, n = 2)['seq']
+	assert out3['seq'] != training.process_sequences(ex_dat, n = 2)['seq']
+
+
 def test_alfie_dnn_default():
 
 	model1 = training.alfie_dnn_default(hidden_sizes = [10,4], in_shape = 4, n_classes = 2)
@@ -7,25 +7,104 @@ Functions
 
 alfie_dnn_default : Construct a neural network for alignment-free classification. 
 
+build_training_data : Build a training feature matrix and encoded labels, with vectorized subsampling.
+
 process_sequences : Conduct subsampling of the sequences and generate kmer information for sequence.
 
 sample_seq : Take a full sequence and return a list of random subsamples.
 
 shuffle_unison : Shuffle the two input numpy arrays in unison.
 
+spawn_generators : Return independent random number generators derived from a seed, i.e. one per worker.
+
 stratified_taxon_split : Conduct a stratified train/test split based on a user defined categorical column.
 
+==========
+Classes
+==========
+
+WindowSequence : A keras Sequence of k-mer frequencies of random windows, redrawn each epoch.
+
 """
 
+import os
+import hashlib
+
 import numpy as np
 import pandas as pd
 
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout
+from tensorflow.keras.utils import Sequence
 
 from sklearn.model_selection import StratifiedShuffleSplit
 
-from alfie.kmerseq import KmerFeatures
+from alfie.kmerseq import encode_sequences, kmer_frequencies, n_kmer_features, \
+							window_kmer_counts, count_frequencies
+
+
+# the number of rows of process_sequences sampled with each spawned random stream
+_SAMPLE_BLOCK = 1000
+
+
+def _random_state(seed):
+	"""The source of randomness for a seed, without reseeding the global numpy random state."""
+	if seed is None:
+		#the functions of numpy.random use the global random state
+		return np.random
+	if isinstance(seed, (np.random.Generator, np.random.RandomState)):
+		return seed
+	if isinstance(seed, np.random.SeedSequence):
+		return np.random.default_rng(seed)
+	#a private legacy random state gives the same draws as np.random.seed(seed)
+	return np.random.RandomState(seed)
+
+
+def _randint(rng, low, high):
+	"""A random integer in [low, high) from a Generator or a legacy random state."""
+	if isinstance(rng, np.random.Generator):
+		return int(rng.integers(low, high))
+	return rng.randint(low, high)
+
+
+def _sklearn_seed(seed):
+	"""Convert a seed to a random_state accepted by scikit learn (an int, RandomState or None)."""
+	if isinstance(seed, np.random.Generator):
+		return int(seed.integers(0, 2 ** 32))
+	if isinstance(seed, np.random.SeedSequence):
+		return int(seed.generate_state(1)[0])
+	return seed
+
+
+def spawn_generators(seed, n):
+	"""
+	Return independent random number generators derived from a seed, i.e. one per worker.
+
+	The generators are built from child SeedSequences (see numpy.random.SeedSequence.spawn), so 
+	their streams don't overlap, and work split over the generators can run in any order, or in
+	parallel, and still give the same output for a given seed.
+
+	Arguments
+	---------
+	seed : int, numpy.random.SeedSequence, numpy.random.Generator or None. A SeedSequence spawns 
+		new children on each call, a Generator is advanced. None draws fresh entropy.
+
+	n : int, the number of generators.
+
+	Returns
+	---------
+	out : list, a list of n numpy.random.Generator.
+
+	Examples
+	---------
+	>>> rngs = spawn_generators(1738, 4)
+	>>> [sample_seq("ACGT" * 100, n = 2, seed = rng) for rng in rngs]
+	"""
+	if isinstance(seed, np.random.Generator):
+		seed = np.random.SeedSequence(seed.integers(0, 2 ** 63, size = 4))
+	elif not isinstance(seed, np.random.SeedSequence):
+		seed = np.random.SeedSequence(seed)
+	return [np.random.default_rng(x) for x in seed.spawn(n)]
 
 
 def stratified_taxon_split(input_data, class_col, test_size = 0.3, silent = False, seed = None):
@@ -48,7 +127,8 @@ def stratified_taxon_split(input_data, class_col, test_size = 0.3, silent = Fals
 
 	silent : bool, should the split criteria be echoded, defualt is True.
 
-	seed : int, a random seed for repeatable random sampling. Default is None.
+	seed : int, numpy.random.Generator or numpy.random.SeedSequence, a random seed for repeatable 
+		random sampling. Default is None.
 
 
 	Returns
@@ -74,7 +154,7 @@ def stratified_taxon_split(input_data, class_col, test_size = 0.3, silent = Fals
 		print(f'Conducting train/test split, split evenly by: {class_col}')
 
 	#split off a test/valid set, 30% of the data total
-	strat_index = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+	strat_index = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=_sklearn_seed(seed))
 
 	for train_index, test_valid_index in strat_index.split(input_data, input_data[class_col]):
 		train, test = input_data.loc[train_index], input_data.loc[test_valid_index] 
@@ -101,7 +181,11 @@ def sample_seq(seq, min_size = 200, max_size = 600, n = 1, seed = None):
 	n : int, the number of random samples to generte from each input sequence.
 		Default is 1 (no upsampling).
 
-	seed : int, a random seed for repeatable random sampling. Default is None.
+	seed : int, numpy.random.Generator or numpy.random.SeedSequence, the source of randomness for 
+		repeatable random sampling. Default is None (the global numpy random state). The global 
+		random state is never reseeded: an int seeds a private legacy random state (giving the 
+		same samples as earlier versions of alfie), a Generator is drawn from (so successive calls
+		give different samples), and a SeedSequence seeds a new Generator.
 
 	Returns
 	---------
@@ -123,20 +207,18 @@ def sample_seq(seq, min_size = 200, max_size = 600, n = 1, seed = None):
 	"""
 	#list of output sequences
 	outseqs = []
-	#set random seed if passed by user
-	if seed != None:
-		np.random.seed(seed)
+	rng = _random_state(seed)
 	#set the max to seq length if its shorter
 	if max_size > len(seq):
 		max_size = len(seq)
 	if min_size > len(seq):
 		raise ValueError("Minimum sample size exceeds sequence length")
 	#get the set of random window sizes
-	win_sizes = [np.random.randint(min_size, max_size) for x in range(n)]
+	win_sizes = [_randint(rng, min_size, max_size) for x in range(n)]
 	#for each window size, randomly subset the sequence by choosing a start point
 	#and slicing the seq.
 	for win_x in win_sizes:
-		win_start = np.random.randint(0, (len(seq) - win_x))
+		win_start = _randint(rng, 0, (len(seq) - win_x))
 		subseq = seq[win_start:(win_start+win_x)]
 		outseqs.append(subseq)
 
@@ -147,8 +229,12 @@ def process_sequences(seq_df, id_col = 'processid',
 							seq_col = 'sequence', 
 							label_col = 'kingdom',
 							k = 4, 
+							canonical = False,
+							sparse = False,
 							to_dataframe = False, 
 							subsample = True, 
+							workers = 1,
+							store = None,
 							**kwargs):
 	"""
 	Conduct subsampling of the sequences and generate kmer information for sequence.
@@ -174,6 +260,17 @@ def process_sequences(seq_df, id_col = 'processid',
 
 	label_col : string, the column used to generate the 'label'	
 
+	k : int, the size of k-mers to generate frequencies for. Default is 4.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. The resulting features are independent of the sequence orientation,
+		and there are fewer of them (see alfie.kmerseq.n_kmer_features). Default is False.
+
+	sparse : bool, should the k-mer frequencies be returned as a single scipy.sparse CSR matrix,
+		with one row per observation, instead of a list of arrays. This is recommended for 
+		large k (k >= 6) and models that accept sparse input (i.e. scikit learn's LinearSVC).
+		Cannot be combined with to_dataframe. Default is False.
+
 	to_dataframe : bool, logical indicating if the output should be returned as a
 		pandas DataFrame. Default is False - returned as a dictionary of lists.
 	
@@ -181,8 +278,26 @@ def process_sequences(seq_df, id_col = 'processid',
 		with the sample_seq function. Default is true. If false, kmer frequencies are
 		based on the unaltered input sequences and no upsampling is performed.
 
+	workers : int, the number of processes used to generate the k-mer frequencies of dense output
+		(see alfie.kmerseq.kmer_frequencies). Default is 1 (featurize in the calling process).
+
+	store : str, a directory for an on-disk feature store. Default is None (no store).
+		The k-mer frequencies are written block by block into a float32 .npy file in the directory,
+		named after a fingerprint of the input ids, labels and sequences, k, canonical and the 
+		sampling arguments, and the file is opened as a read-only numpy memmap. A later call with 
+		the same inputs reuses the file instead of recomputing the features. The returned 'ids' 
+		and 'labels' are numpy arrays, 'data' is the memmap of shape (n_observations, n_features),
+		and the subsampled sequences are not kept (there is no 'seq' key). Subsampled features
+		are only stored for an int seed (so they can be reproduced). Cannot be combined with
+		sparse or to_dataframe. With workers, around 1000 * workers rows are featurized at a
+		time (held in memory before they are written).
+
 	**kwargs : additional keyword arguments to be passed to the sample_seq function.
-		See: alfie.training.sample_seq for a list of arguments.
+		See: alfie.training.sample_seq for a list of arguments. A seed (int, SeedSequence or
+		Generator) is used to spawn an independent random stream for each block of 1000 rows 
+		(see spawn_generators), the output for a given seed is the same for any number of workers.
+		Without a seed, the streams are spawned from a seed drawn from the global numpy random
+		state (so calling np.random.seed beforehand gives repeatable output).
 
 	Returns
 	---------
@@ -192,7 +307,8 @@ def process_sequences(seq_df, id_col = 'processid',
 		key descriptions:
 			ids - the sequence IDs
 			label - the sequence label column 
-			data - the kmer array frequencies for the given sequence
+			data - the kmer array frequencies for the given sequence (a sparse matrix,
+				with one row per sequence, if sparse = True)
 			seq - the subsample of the DNA sequence used to generate the kmer frequencies
 
 	Examples
@@ -218,31 +334,47 @@ def process_sequences(seq_df, id_col = 'processid',
 
 	>>> out_dat2.columns
 	Index(['ids', 'labels', 'data', 'seq'], dtype='object')
+
+	#features written to (or reused from) a memory-mapped store, for repeated experiments
+	>>> out_dat3 = process_sequences(ex_dat, n = 5, seed = 1738, store = "feature_store")
+	>>> out_dat3['data'].shape
+	(25, 256)
 	"""
 
+	if sparse == True and to_dataframe == True:
+		raise ValueError("Sparse k-mer data cannot be returned as a DataFrame.")
+
+	ids = seq_df[id_col].tolist()
+	labels = seq_df[label_col].tolist()
+	seqs = seq_df[seq_col].tolist()
+
+	#the rows are subsampled in fixed size blocks, each with its own random stream, 
+	#so the output for a seed doesn't depend on the order (or process) the blocks are sampled in
+	seed = kwargs.pop('seed', None)
+
+	if store != None:
+		return _stored_features(store, ids, labels, seqs, k, canonical, sparse, to_dataframe, 
+								subsample, workers, seed, kwargs)
+
 	#stores tuples of (processid, kingdom, kmer_freqs)
 	samples = {'ids': [],
 				'labels': [],
 				'data': [],
 				'seq': []}
-	# data are split to train and test
+
 	# now do the upsampling and generation of the output data files.
-	for entry in seq_df.iterrows():
-		processid =  entry[1][id_col]
-		label = entry[1][label_col]
-		seq =  entry[1][seq_col]
-
-		if subsample == True:
-			sub_seqs = sample_seq(seq, **kwargs)
-		else:
-			sub_seqs = [seq]
-
-		for s in sub_seqs:
-			k_seq = KmerFeatures(processid, s, k=k)
-			samples['ids'].append(processid)
-			samples['labels'].append(label)
-			samples['data'].append(k_seq.kmer_freqs)
-			samples['seq'].append(s)
+	for block in _sample_blocks(ids, labels, seqs, subsample, seed, kwargs):
+		for x, block_values in zip(['ids', 'labels', 'seq'], block):
+			samples[x].extend(block_values)
+
+	#the k-mer frequencies of all the sequences are generated in one pass
+	data = kmer_frequencies(samples['seq'], k = k, canonical = canonical, 
+								sparse = sparse, dtype = np.float64, workers = workers)
+
+	if sparse == True:
+		samples['data'] = data
+	else:
+		samples['data'] = list(data)
 
 	if to_dataframe == True:
 		return pd.DataFrame(samples)
@@ -250,6 +382,368 @@ def process_sequences(seq_df, id_col = 'processid',
 	return samples
 
 
+def _sample_blocks(ids, labels, seqs, subsample, seed, kwargs):
+	"""Yield the ids, labels and (subsampled) sequences of each block of rows."""
+	n_blocks = -(-len(seqs) // _SAMPLE_BLOCK)
+	if subsample == True and seed is None:
+		#drawn from the global random state, so np.random.seed still makes the output repeatable
+		seed = np.random.randint(2 ** 32, dtype = np.int64)
+	rngs = spawn_generators(seed, n_blocks) if subsample == True else [None] * n_blocks
+
+	for block, rng in enumerate(rngs):
+		out = ([], [], [])
+		for i in range(block * _SAMPLE_BLOCK, min((block + 1) * _SAMPLE_BLOCK, len(seqs))):
+			if subsample == True:
+				sub_seqs = sample_seq(seqs[i], seed = rng, **kwargs)
+			else:
+				sub_seqs = [seqs[i]]
+
+			for s in sub_seqs:
+				out[0].append(ids[i])
+				out[1].append(labels[i])
+				out[2].append(s)
+		yield out
+
+
+def _merge_blocks(blocks, min_rows):
+	"""Join consecutive blocks of ids, labels and sequences, until each has at least min_rows rows."""
+	out = ([], [], [])
+	for block in blocks:
+		for x, values in zip(out, block):
+			x.extend(values)
+		if len(out[2]) >= min_rows:
+			yield out
+			out = ([], [], [])
+	if len(out[2]) > 0:
+		yield out
+
+
+def _store_key(ids, labels, seqs, k, canonical, subsample, seed, kwargs):
+	"""Fingerprint the inputs and settings of process_sequences, naming its feature store files."""
+	h = hashlib.blake2b(digest_size = 16)
+	settings = {'k' : k, 'canonical' : canonical, 'subsample' : subsample}
+	if subsample == True:
+		settings.update(kwargs, seed = seed)
+	h.update(repr(sorted(settings.items())).encode())
+	for x in (ids, labels, seqs):
+		h.update(str(len(x)).encode())
+		for value in x:
+			#the type is hashed too, so the label 1 and the label '1' are stored separately
+			h.update(f"{type(value).__name__}:{value}".encode())
+			h.update(b"\0")
+	return h.hexdigest()
+
+
+def _stored_features(store, ids, labels, seqs, k, canonical, sparse, to_dataframe, subsample, 
+						workers, seed, kwargs):
+	"""Load the features of process_sequences from a store, computing and writing them if needed."""
+	if sparse == True or to_dataframe == True:
+		raise ValueError("Stored k-mer data cannot be sparse or returned as a DataFrame.")
+	if subsample == True and isinstance(seed, (int, np.integer)) == False:
+		raise ValueError("An int seed is required to store the features of subsampled sequences.")
+
+	key = _store_key(ids, labels, seqs, k, canonical, subsample, seed, kwargs)
+	filename = os.path.join(store, key)
+
+	names = {x : filename + x + ".npy" for x in ("_ids", "_labels", "")}
+	if not all(os.path.exists(x) for x in names.values()):
+		os.makedirs(store, exist_ok = True)
+		n_out = len(seqs) * (kwargs.get('n', 1) if subsample == True else 1)
+		#the files are written under temporary names, and renamed once all three are complete
+		tmp_files = {x : y + f".{os.getpid()}.tmp" for x, y in names.items()}
+		try:
+			data = np.lib.format.open_memmap(tmp_files[""], mode = 'w+', dtype = np.float32,
+												shape = (n_out, n_kmer_features(k, canonical)))
+			out_ids = []
+			out_labels = []
+			row = 0
+			#blocks are featurized together, so each call can be split between the workers
+			blocks = _merge_blocks(_sample_blocks(ids, labels, seqs, subsample, seed, kwargs), 
+									_SAMPLE_BLOCK * workers if workers > 1 else 0)
+			for block_ids, block_labels, block_seqs in blocks:
+				data[row:row + len(block_seqs)] = kmer_frequencies(block_seqs, k = k, canonical = canonical,
+															dtype = np.float32, workers = workers)
+				row += len(block_seqs)
+				out_ids.extend(block_ids)
+				out_labels.extend(block_labels)
+			data.flush()
+			del data
+
+			#ids and labels keep their type (i.e. int labels are not saved as strings)
+			for x, values in (("_ids", out_ids), ("_labels", out_labels)):
+				with open(tmp_files[x], 'wb') as f:
+					np.save(f, np.asarray(values))
+			#the features are renamed last, a store is only reused once all three files exist
+			for x in ("_ids", "_labels", ""):
+				os.replace(tmp_files[x], names[x])
+		finally:
+			#an interrupted write doesn't leave partial files behind
+			for x in tmp_files.values():
+				if os.path.exists(x):
+					os.remove(x)
+
+	return {'ids' : np.load(names["_ids"]),
+			'labels' : np.load(names["_labels"]),
+			'data' : np.load(names[""], mmap_mode = 'r')}
+
+
+def _encode_labels(labels, classes = None):
+	"""Encode labels as the index of their class, by default the classes are in alphabetical order."""
+	if classes is None:
+		classes, encoded = np.unique(np.asarray(labels), return_inverse = True)
+		return classes, encoded.astype(np.int64)
+	classes = np.asarray(classes)
+	position = {x : i for i, x in enumerate(classes)}
+	try:
+		return classes, np.array([position[x] for x in labels], dtype = np.int64)
+	except KeyError as e:
+		raise ValueError(f"The label {e} is not one of the classes.")
+
+
+def _sample_windows(lengths, n, min_size, max_size, rng):
+	"""Draw the sizes and starts of n random windows of each sequence, as in sample_seq."""
+	if np.any(lengths < min_size):
+		raise ValueError("Minimum sample size exceeds sequence length")
+	lengths = np.repeat(lengths, n)
+	#the max is the sequence length if it is shorter
+	high = np.maximum(np.minimum(max_size, lengths), min_size + 1)
+	sizes = rng.integers(min_size, high)
+	starts = rng.integers(0, np.maximum(lengths - sizes, 1))
+	return starts, sizes
+
+
+def build_training_data(seq_df, id_col = 'processid',
+							seq_col = 'sequence', 
+							label_col = 'kingdom',
+							k = 4, 
+							canonical = False,
+							subsample = True,
+							min_size = 200,
+							max_size = 600,
+							n = 1,
+							seed = None,
+							classes = None,
+							keep_seq = False,
+							chunk_size = 2 ** 22,
+							workers = 1):
+	"""
+	Build a training feature matrix and encoded labels, with vectorized subsampling.
+
+	A faster, lower memory alternative to process_sequences for large training sets. The sequences
+	are encoded into a single byte buffer, the sizes and starts of all the random windows are drawn
+	in batched numpy calls (windows are drawn as in sample_seq), and the k-mer frequencies of the 
+	windows are written into one contiguous float32 matrix, a chunk of windows at a time. No string
+	or KmerFeatures instance is created per window: the k-mers of each sequence are located once,
+	and the counts of its windows are differences of prefix counts (see 
+	alfie.kmerseq.window_kmer_counts), so the cost of a window does not depend on its length.
+
+	Arguments
+	---------
+	seq_df : pd.DataFrame, a data frame with columns containing 
+		dna sequences, labels (classifications), and id information.
+
+	id_col, seq_col, label_col : string, the names of the id, sequence and label columns.
+		Defaults are 'processid', 'sequence' and 'kingdom'.
+
+	k : int, the size of k-mers to generate frequencies for. Default is 4.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	subsample : bool, should random windows of the sequences be featurized. Default is True.
+		If False, the k-mer frequencies of the whole sequences are generated.
+
+	min_size, max_size, n : int, the size range of the windows and the number of windows drawn 
+		from each sequence (see sample_seq). Defaults are 200, 600 and 1.
+
+	seed : int, numpy.random.Generator or numpy.random.SeedSequence, a seed for repeatable random 
+		sampling (see numpy.random.default_rng). Default is None.
+
+	classes : list, the classes in the order they are encoded. Default is None, the distinct
+		labels in alphabetical order.
+
+	keep_seq : bool, should the sequence of each window be returned. Default is False.
+
+	chunk_size : int, the approximate number of k-mer counts (windows * features) featurized at
+		a time, this bounds the temporary memory used for any k. Default is 2 ** 22 (i.e. 16384 
+		windows at k = 4).
+
+	workers : int, the number of processes used to generate the k-mer frequencies of whole
+		sequences, when subsample is False (see alfie.kmerseq.kmer_frequencies). Default is 1.
+
+	Returns
+	---------
+	out : dict with the keys:
+			ids - numpy.ndarray, the sequence ID of each observation
+			labels - numpy.ndarray, the encoded label of each observation (the index in classes)
+			classes - numpy.ndarray, the class names
+			data - numpy.ndarray, a float32 matrix with the k-mer frequencies of each observation
+			seq - list, the sequence of each observation (only if keep_seq is True)
+
+	Examples
+	---------
+	>>> ex_dat = pd.DataFrame({
+	>>>		"processid" : ["ex1", "ex2", "ex3", "ex4", "ex5"],
+	>>>		"sequence" : ["AAAAAG"*50, "AAATAA"*50, "AAGAAA"*50, "TTTTAT"*50, "TCTTCT"*50],
+	>>>		"kingdom" : ["animalia", "bacteria", "fungi", "plantae", "protista"]})
+
+	>>> out_dat = build_training_data(ex_dat, n = 5, seed = 1738)
+	>>> out_dat['data'].shape
+	(25, 256)
+	>>> out_dat['labels'][:6]
+	array([0, 0, 0, 0, 0, 1])
+	"""
+	sequences = seq_df[seq_col].tolist()
+	buffer, offsets = encode_sequences(sequences)
+	lengths = np.diff(offsets)
+
+	classes, labels = _encode_labels(seq_df[label_col], classes)
+
+	if subsample == True:
+		starts, sizes = _sample_windows(lengths, n, min_size, max_size, np.random.default_rng(seed))
+		record = np.repeat(np.arange(len(sequences)), n)
+
+		data = np.empty((len(record), n_kmer_features(k, canonical)), dtype = np.float32)
+		#the windows of a chunk of sequences are counted together, windows are in sequence order
+		step = max(1, chunk_size // n_kmer_features(k, canonical) // n)
+		for first in range(0, len(sequences), step):
+			last = min(first + step, len(sequences))
+			w = slice(first * n, last * n)
+			counts = window_kmer_counts(buffer[offsets[first]:offsets[last]], record[w] - first, 
+										starts[w], starts[w] + sizes[w], k = k, 
+										offsets = offsets[first:last + 1] - offsets[first], 
+										canonical = canonical)
+			data[w] = count_frequencies(counts)
+		starts = starts + offsets[:-1][record]
+	else:
+		record = np.arange(len(sequences))
+		starts, sizes = offsets[:-1], lengths
+		data = kmer_frequencies(buffer, k, offsets = offsets, canonical = canonical, 
+									dtype = np.float32, workers = workers)
+
+	out = {'ids' : seq_df[id_col].to_numpy()[record],
+			'labels' : labels[record],
+			'classes' : classes,
+			'data' : data}
+
+	if keep_seq == True:
+		out['seq'] = [buffer[x:x + z].tobytes().decode() for x, z in zip(starts, sizes)]
+
+	return out
+
+
+class WindowSequence(Sequence):
+	"""
+	A keras Sequence of k-mer frequencies of random windows, redrawn each epoch.
+
+	An alternative to building an upsampled training set with process_sequences or 
+	build_training_data before training. The random windows (drawn as in sample_seq) are 
+	featurized batch by batch as the model is trained, and new windows are drawn at the end of 
+	every epoch, so the memory used does not depend on the upsampling factor n and each epoch 
+	sees different windows. The windows of an epoch are drawn in advance, so batches can be 
+	featurized in parallel threads (i.e. model.fit(sequence, workers = 4)) and the output only 
+	depends on the seed. The k-mer counts of the windows are computed from prefix counts
+	(see alfie.kmerseq.window_kmer_counts), no substring is created.
+
+	Arguments
+	---------
+	seq_df : pd.DataFrame, a data frame with columns containing dna sequences and labels.
+
+	seq_col, label_col : string, the names of the sequence and label columns. 
+		Defaults are 'sequence' and 'kingdom'.
+
+	k : int, the size of k-mers to generate frequencies for. Default is 4.
+
+	canonical : bool, should k-mers and their reverse complements be counted as a single
+		canonical k-mer. Default is False.
+
+	min_size, max_size : int, the size range of the windows (see sample_seq). Defaults are 200 and 600.
+
+	n : int, the number of windows drawn from each sequence per epoch. Default is 1.
+
+	batch_size : int, the number of windows in each batch. Default is 256.
+
+	shuffle : bool, should the windows of each epoch be in a random order. Default is True.
+		If False, the windows are in the order of the sequences.
+
+	seed : int, numpy.random.Generator or numpy.random.SeedSequence, a seed for repeatable random 
+		sampling (see numpy.random.default_rng). Default is None.
+
+	classes : list, the classes in the order they are encoded. Default is None, the distinct
+		labels in alphabetical order.
+
+	**kwargs : additional keyword arguments passed to the keras Sequence (i.e. workers, 
+		with keras 3).
+
+	Attributes
+	---------
+	classes : numpy.ndarray, the class names, in the order of the encoded labels.
+
+	n_features : int, the number of k-mer features (the in_shape of alfie_dnn_default).
+
+	Examples
+	---------
+	>>> ex_dat = pd.DataFrame({
+	>>>		"sequence" : ["AAAAAG"*50, "AAATAA"*50, "AAGAAA"*50, "TTTTAT"*50, "TCTTCT"*50],
+	>>>		"kingdom" : ["animalia", "bacteria", "fungi", "plantae", "protista"]})
+
+	>>> windows = WindowSequence(ex_dat, n = 10, batch_size = 16, seed = 1738)
+	>>> x, y = windows[0]
+	>>> x.shape
+	(16, 256)
+	>>> model = alfie_dnn_default(in_shape = windows.n_features, n_classes = len(windows.classes))
+	>>> model.fit(windows, epochs = 5, workers = 2)
+	"""
+	def __init__(self, seq_df, seq_col = 'sequence', label_col = 'kingdom', k = 4, canonical = False,
+					min_size = 200, max_size = 600, n = 1, batch_size = 256, shuffle = True, 
+					seed = None, classes = None, **kwargs):
+		super().__init__(**kwargs)
+		self.k = k
+		self.canonical = canonical
+		self.min_size = min_size
+		self.max_size = max_size
+		self.n = n
+		self.batch_size = batch_size
+		self.shuffle = shuffle
+
+		self._buffer, self._offsets = encode_sequences(seq_df[seq_col].tolist())
+		self._lengths = np.diff(self._offsets)
+		if np.any(self._lengths < min_size):
+			raise ValueError("Minimum sample size exceeds sequence length")
+		self.classes, self._labels = _encode_labels(seq_df[label_col], classes)
+		self.n_features = n_kmer_features(k, canonical)
+
+		self._rng = np.random.default_rng(seed)
+		self.on_epoch_end()
+
+	def __len__(self):
+		return int(np.ceil(len(self._record) / self.batch_size))
+
+	def on_epoch_end(self):
+		"""Draw the windows of the next epoch."""
+		starts, sizes = _sample_windows(self._lengths, self.n, self.min_size, self.max_size, self._rng)
+		record = np.repeat(np.arange(len(self._lengths)), self.n)
+		order = self._rng.permutation(len(record)) if self.shuffle == True else np.arange(len(record))
+		self._record = record[order]
+		self._starts = starts[order]
+		self._ends = starts[order] + sizes[order]
+
+	def __getitem__(self, i):
+		window = slice(i * self.batch_size, (i + 1) * self.batch_size)
+		record = self._record[window]
+
+		#only the sequences of the batch are featurized
+		unique, inverse = np.unique(record, return_inverse = True)
+		sizes = self._lengths[unique]
+		offsets = np.zeros(len(unique) + 1, dtype = np.int64)
+		np.cumsum(sizes, out = offsets[1:])
+		buffer = self._buffer[np.arange(offsets[-1]) - np.repeat(offsets[:-1] - self._offsets[unique], sizes)]
+
+		counts = window_kmer_counts(buffer, inverse, self._starts[window], self._ends[window], 
+									k = self.k, offsets = offsets, canonical = self.canonical)
+		return count_frequencies(counts), self._labels[record]
+
+
 def shuffle_unison(x, y, seed = None):
 	"""
 	Shuffle the two input numpy arrays in unison.
@@ -263,7 +757,8 @@ def shuffle_unison(x, y, seed = None):
 
 	y : np.array, the second array to shuffle
 
-	seed : int, a random seed for repeatable random sampling. Default is None.
+	seed : int, numpy.random.Generator or numpy.random.SeedSequence, the source of randomness for
+		a repeatable shuffle (see sample_seq). Default is None (the global numpy random state).
 
 	Returns
 	---------
@@ -294,10 +789,8 @@ def shuffle_unison(x, y, seed = None):
 	"""
 	if len(x) != len(y):
 		raise ValueError("The input arrays do not have equal lengths.")
-	if seed != None:
-		np.random.seed(seed)
 
-	p = np.random.permutation(len(x))
+	p = _random_state(seed).permutation(len(x))
 	return x[p], y[p]
 
 
@@ -313,7 +806,8 @@ def alfie_dnn_default(hidden_sizes = [100], dropout = 0.3,
 	dropout : float, fraction of dropout applied after each hidden layer, for no dropout pass 0.
 		Default is 0.3. 
 	in_shape : int, the number of predictor variables, assumes 1d inputs. 
-		Default is 256 (4mer size).
+		Default is 256 (4mer size). For canonical k-mer features, use 
+		alfie.kmerseq.n_kmer_features(k, canonical = True) (136 for 4mers).
 	n_classes - int, the number of output classes. Default is 5 (kingdoms).
 
 	Returns
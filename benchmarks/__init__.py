@@ -0,0 +1,15 @@
+"""
+Benchmarks of alfie on synthetic COI-like barcode data.
+
+The benchmarks are not part of the installed package, run them from the root of the repository:
+	python -m benchmarks --sizes 10000 100000 --out results.json
+
+==========
+Modules
+==========
+
+synthetic : A seeded generator of synthetic COI-like barcode sequences and reads.
+
+run : Run the benchmarks and save the results as JSON.
+
+"""
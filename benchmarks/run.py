@@ -0,0 +1,251 @@
+"""
+Run the alfie benchmarks and save the results as JSON.
+
+Each benchmark is timed on synthetic data (see benchmarks.synthetic) at each of the requested
+scales, the best time of the repeats is kept. Results saved from an earlier version can be
+passed with --compare, to print the speedup (or slowdown) of each benchmark.
+
+Usage:
+	python -m benchmarks --sizes 10000 100000 --out results.json
+	python -m benchmarks --sizes 10000 --compare results_v1.json
+
+==========
+Benchmarks
+==========
+
+read_fasta, read_fastq : read a file of synthetic barcodes or reads with alfie.seqio.
+
+iter_read_batches : stream a file of synthetic reads in columnar batches.
+
+kmer_features : build a KmerFeatures instance for each sequence.
+
+kmer_frequencies : featurize all the sequences in a single vectorized call.
+
+classify_records : classify the sequences with the numpy export of the default model.
+
+process_sequences : build a training set, with subsampling (n = 5 windows per sequence).
+
+build_training_data : build the same training set with the vectorized builder.
+
+cli : classify a fastq file end to end with the command line interface (summary mode).
+
+The input of each benchmark (a file, records, sequences or a data frame) is generated just before
+it is timed, and freed after, so large scales only need the memory of one input at a time. Files
+are written in chunks, once per scale. records_per_second is per input record, and mb_per_second
+per byte of input (the file size, or the total sequence length). The training set benchmarks also
+report windows_per_second, the rate of output rows (n = 5 per record), which compares with the 
+records/s of the classification benchmarks.
+
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import functools
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from alfie import fourmer_numpy_file
+from alfie.seqio import read_fasta, read_fastq, iter_read_batches
+from alfie.kmerseq import KmerFeatures, kmer_frequencies
+from alfie.classify import classify_records
+from alfie.inference import NumpyModel
+from alfie.training import process_sequences, build_training_data
+
+from benchmarks.synthetic import iter_synthetic_barcodes, synthetic_barcodes, synthetic_dataframe, \
+								write_synthetic
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+# the number of windows drawn from each sequence by the training set benchmarks
+N_WINDOWS = 5
+
+
+def bench_read_fasta(filename):
+	read_fasta(filename)
+
+def bench_read_fastq(filename):
+	read_fastq(filename)
+
+def bench_iter_read_batches(filename):
+	for _ in iter_read_batches(filename, 10000):
+		pass
+
+def bench_kmer_features(records):
+	for x in records:
+		KmerFeatures(x["name"], x["sequence"])
+
+def bench_kmer_frequencies(sequences):
+	kmer_frequencies(sequences)
+
+def bench_classify_records(records):
+	classify_records(records, _numpy_model(), keep_kmers = False)
+
+def bench_process_sequences(frame):
+	process_sequences(frame, n = N_WINDOWS)
+
+def bench_build_training_data(frame):
+	build_training_data(frame, n = N_WINDOWS)
+
+def bench_cli(filename):
+	#the output folder is written next to the input, so alfie is imported from the repo root
+	pythonpath = os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))
+	subprocess.run([sys.executable, "-m", "alfie.alf", "-f", filename, "-m", fourmer_numpy_file,
+					"-s"], cwd = os.path.dirname(filename), check = True, stdout = subprocess.DEVNULL,
+					env = {**os.environ, "PYTHONPATH" : pythonpath})
+
+
+@functools.lru_cache(maxsize = None)
+def _numpy_model():
+	return NumpyModel.load(fourmer_numpy_file)
+
+
+def fasta_input(n, seed, folder):
+	"""A fasta file of n synthetic barcodes, written once per folder (streamed, in chunks)."""
+	filename = os.path.join(folder, f"barcodes_{n}.fasta")
+	if not os.path.exists(filename):
+		write_synthetic(filename, n, seed)
+	return filename
+
+def fastq_input(n, seed, folder):
+	"""A fastq file of n synthetic reads, written once per folder (streamed, in chunks)."""
+	filename = os.path.join(folder, f"reads_{n}.fastq")
+	if not os.path.exists(filename):
+		write_synthetic(filename, n, seed)
+	return filename
+
+def records_input(n, seed, folder):
+	"""A list of n synthetic barcode records."""
+	return synthetic_barcodes(n, seed)
+
+def sequences_input(n, seed, folder):
+	"""The sequence strings of n synthetic barcodes, without record dictionaries."""
+	return [x["sequence"] for records in iter_synthetic_barcodes(n, seed) for x in records]
+
+def frame_input(n, seed, folder):
+	"""A training data frame of n synthetic barcodes."""
+	return synthetic_dataframe(n, seed)
+
+
+# the function of each benchmark, and the function building its input. Inputs are built 
+# before a benchmark is timed, and freed after it, so only one is held in memory at a time
+BENCHMARKS = {"read_fasta" : (bench_read_fasta, fasta_input),
+				"read_fastq" : (bench_read_fastq, fastq_input),
+				"iter_read_batches" : (bench_iter_read_batches, fastq_input),
+				"kmer_features" : (bench_kmer_features, records_input),
+				"kmer_frequencies" : (bench_kmer_frequencies, sequences_input),
+				"classify_records" : (bench_classify_records, records_input),
+				"process_sequences" : (bench_process_sequences, frame_input),
+				"build_training_data" : (bench_build_training_data, frame_input),
+				"cli" : (bench_cli, fastq_input)}
+
+# the benchmarks whose output has N_WINDOWS rows per input sequence
+WINDOWED = {"process_sequences", "build_training_data"}
+
+
+def input_bytes(x):
+	"""The size of a benchmark input: the file size of a file, or the total sequence length."""
+	if isinstance(x, str):
+		return os.path.getsize(x)
+	if isinstance(x, pd.DataFrame):
+		return int(x["sequence"].str.len().sum())
+	return sum(len(s) if isinstance(s, str) else len(s["sequence"]) for s in x)
+
+
+def run_benchmark(name, n, seed, folder, repeat = 3):
+	"""Build the input of a benchmark of size n, and time it, returning the best of repeat runs."""
+	bench, build_input = BENCHMARKS[name]
+	x = build_input(n, seed, folder)
+	n_bytes = input_bytes(x)
+
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		bench(x)
+		times.append(time.perf_counter() - start)
+	seconds = min(times)
+
+	out = {"benchmark" : name,
+			"n" : n,
+			"seconds" : seconds,
+			"records_per_second" : n / seconds,
+			"mb_per_second" : n_bytes / seconds / 1e6}
+	if name in WINDOWED:
+		#the rows of the training set, comparable to the records/s of the classification benchmarks
+		out["windows"] = n * N_WINDOWS
+		out["windows_per_second"] = n * N_WINDOWS / seconds
+	return out
+
+
+def environment():
+	"""The versions and machine the benchmarks were run with."""
+	try:
+		commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+								cwd = REPO_ROOT).stdout.strip()
+	except OSError:
+		commit = ""
+	return {"date" : datetime.datetime.now().isoformat(timespec = "seconds"),
+			"commit" : commit,
+			"python" : platform.python_version(),
+			"numpy" : np.__version__,
+			"platform" : platform.platform(),
+			"cpus" : os.cpu_count()}
+
+
+def compare(results, previous):
+	"""Print the speedup of each benchmark relative to an earlier set of results."""
+	before = {(x["benchmark"], x["n"]) : x["seconds"] for x in previous["results"]}
+	for x in results["results"]:
+		key = (x["benchmark"], x["n"])
+		if key in before:
+			print(f"{x['benchmark']:<20}{x['n']:>10}{before[key] / x['seconds']:>10.2f}x")
+
+
+def main(args = None):
+	parser = argparse.ArgumentParser(prog = "python -m benchmarks",
+		description = "Run the alfie benchmarks on synthetic data.")
+	parser.add_argument("--sizes", type = int, nargs = "+", default = [10000],
+		help = "The number of records of each benchmark run. Default is 10000.")
+	parser.add_argument("--only", type = str, nargs = "+", default = list(BENCHMARKS),
+		choices = list(BENCHMARKS), help = "The benchmarks to run. Default is all.")
+	parser.add_argument("--repeat", type = int, default = 3,
+		help = "The number of times each benchmark is run, the best time is kept. Default is 3.")
+	parser.add_argument("--seed", type = int, default = 0,
+		help = "The seed of the synthetic data. Default is 0.")
+	parser.add_argument("--out", type = str, default = "benchmark_results.json",
+		help = "The JSON file the results are written to. Default is benchmark_results.json.")
+	parser.add_argument("--compare", type = str, default = None,
+		help = "A JSON file of earlier results, the speedup of each benchmark is printed.")
+	args = parser.parse_args(args)
+
+	results = {"environment" : environment(), "seed" : args.seed, "results" : []}
+
+	for n in args.sizes:
+		with tempfile.TemporaryDirectory() as folder:
+			for name in args.only:
+				x = run_benchmark(name, n, args.seed, folder, args.repeat)
+				results["results"].append(x)
+				line = f"{name:<20}{n:>10}{x['seconds']:>10.3f}s{x['records_per_second']:>12.0f} records/s"
+				if "windows_per_second" in x:
+					line += f"{x['windows_per_second']:>12.0f} windows/s"
+				print(line)
+
+	with open(args.out, "w") as f:
+		json.dump(results, f, indent = 2)
+
+	if args.compare != None:
+		with open(args.compare) as f:
+			compare(results, json.load(f))
+
+	return results
+
+
+if __name__ == "__main__":
+	main()
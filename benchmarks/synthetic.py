@@ -0,0 +1,208 @@
+"""
+A seeded generator of synthetic COI-like barcode sequences and reads, for benchmarking.
+
+Sequences are drawn from a set of random 'species' templates per kingdom, with the base
+composition of the kingdom (i.e. AT rich animal barcodes) and a stronger bias at the third
+codon position, as in real COI-5P barcodes. Each sequence is a mutated and trimmed copy of
+a template, with a small fraction of ambiguous bases (N) and alignment gaps (-). Reads are
+fragments of the barcode sequences with fastq quality strings that decline along the read.
+
+The output is the same for a given seed, and is generated in chunks so millions of records
+can be written without holding them in memory.
+
+==========
+Functions
+==========
+
+iter_synthetic_barcodes : Generate synthetic barcode sequence records, in chunks.
+
+iter_synthetic_reads : Generate synthetic fastq read records, in chunks.
+
+synthetic_barcodes : Return a list of synthetic barcode sequence records.
+
+synthetic_dataframe : Return synthetic barcode sequences as a training data frame.
+
+write_synthetic : Write synthetic barcodes (fasta) or reads (fastq) to a file.
+
+"""
+import numpy as np
+import pandas as pd
+
+from alfie.seqio import file_type, write_fasta, write_fastq
+
+KINGDOMS = ["animalia", "bacteria", "fungi", "plantae", "protista"]
+
+# approximate GC content of COI-5P barcodes in each kingdom
+_GC = {"animalia" : 0.38, "bacteria" : 0.52, "fungi" : 0.32, "plantae" : 0.45, "protista" : 0.36}
+
+# the full length of the COI-5P barcode region
+_BARCODE_SIZE = 658
+
+_BASES = np.frombuffer(b"ACGT", dtype = np.uint8)
+
+
+def _templates(rng, n_templates, size):
+	"""Random template sequences for each kingdom, as arrays of ascii codes."""
+	out = []
+	codon_position = np.arange(size) % 3
+	for kingdom in KINGDOMS:
+		#third codon positions are more biased than the first two
+		gc = np.where(codon_position == 2, _GC[kingdom] - 0.1, _GC[kingdom] + 0.05)
+		gc = np.clip(gc, 0.05, 0.95)
+		u = rng.random((n_templates, size))
+		#A and T share (1 - gc), C and G share gc
+		codes = np.where(u < (1 - gc) / 2, 0, np.where(u < 0.5, 1, np.where(u < 0.5 + gc / 2, 2, 3)))
+		out.append(_BASES[codes])
+	return np.stack(out)
+
+
+def iter_synthetic_barcodes(n, seed = 0, chunk = 100000, min_size = 500, max_size = _BARCODE_SIZE,
+							n_templates = 50, mutation_rate = 0.03, n_rate = 0.002, gap_rate = 0.001):
+	"""
+	Generate synthetic barcode sequence records, in chunks.
+
+	Arguments
+	---------
+	n : int, the number of records.
+
+	seed : int, the random seed. Default is 0.
+
+	chunk : int, the number of records in each yielded list. Default is 100000.
+
+	min_size, max_size : int, the range of the sequence lengths. Default is 500 to 658.
+
+	n_templates : int, the number of distinct templates ('species') per kingdom. Default is 50.
+
+	mutation_rate : float, the fraction of bases substituted relative to the template. Default is 0.03.
+
+	n_rate, gap_rate : float, the fraction of ambiguous bases (N) and gaps (-). Default 0.002 and 0.001.
+
+	Returns
+	---------
+	out : generator, yields lists of sequence records with the keys 'name', 'sequence' and
+		'kingdom'. Names are of the form 'synth<i>_<kingdom>'.
+
+	Examples
+	---------
+	>>> for records in iter_synthetic_barcodes(1000, chunk = 500):
+	>>> 	print(len(records), records[0]['name'])
+	500 synth0_plantae
+	500 synth500_fungi
+	"""
+	rng = np.random.default_rng(seed)
+	templates = _templates(rng, n_templates, max_size)
+
+	for start in range(0, n, chunk):
+		size = min(chunk, n - start)
+		kingdom = rng.integers(0, len(KINGDOMS), size)
+		seqs = templates[kingdom, rng.integers(0, n_templates, size)]
+
+		u = rng.random(seqs.shape)
+		substitute = u < mutation_rate
+		seqs[substitute] = _BASES[rng.integers(0, 4, int(substitute.sum()))]
+		seqs[(u >= mutation_rate) & (u < mutation_rate + n_rate)] = ord('N')
+		seqs[(u >= mutation_rate + n_rate) & (u < mutation_rate + n_rate + gap_rate)] = ord('-')
+
+		#each sequence is trimmed to a random length, from a random start
+		lengths = rng.integers(min_size, max_size + 1, size)
+		offsets = rng.integers(0, max_size - lengths + 1)
+
+		records = []
+		for i in range(size):
+			label = KINGDOMS[kingdom[i]]
+			sequence = seqs[i, offsets[i]:offsets[i] + lengths[i]].tobytes().decode()
+			records.append({"name" : f"synth{start + i}_{label}", "sequence" : sequence, "kingdom" : label})
+		yield records
+
+
+def iter_synthetic_reads(n, seed = 0, chunk = 100000, min_size = 150, max_size = 300, **kwargs):
+	"""
+	Generate synthetic fastq read records, in chunks.
+
+	Each read is a fragment of a synthetic barcode sequence (see iter_synthetic_barcodes),
+	with a phred+33 quality string that declines towards the end of the read.
+
+	Arguments
+	---------
+	n : int, the number of reads.
+
+	seed : int, the random seed. Default is 0.
+
+	chunk : int, the number of reads in each yielded list. Default is 100000.
+
+	min_size, max_size : int, the range of the read lengths. Default is 150 to 300.
+
+	**kwargs : additional keyword arguments passed to iter_synthetic_barcodes.
+
+	Returns
+	---------
+	out : generator, yields lists of sequence records with the keys 'name', 'sequence', 'strand',
+		'quality' and 'kingdom'.
+	"""
+	rng = np.random.default_rng([seed, 1])
+	for records in iter_synthetic_barcodes(n, seed, chunk, **kwargs):
+		lengths = rng.integers(min_size, max_size + 1, len(records))
+		quality = 38 - np.arange(max_size) * 0.04 + rng.normal(0, 3, (len(records), max_size))
+		quality = np.clip(quality, 2, 41).astype(np.uint8) + 33
+
+		for i, x in enumerate(records):
+			size = min(lengths[i], len(x['sequence']))
+			start = rng.integers(0, len(x['sequence']) - size + 1)
+			x['sequence'] = x['sequence'][start:start + size]
+			x['strand'] = '+'
+			x['quality'] = quality[i, :size].tobytes().decode()
+		yield records
+
+
+def synthetic_barcodes(n, seed = 0, **kwargs):
+	"""
+	Return a list of synthetic barcode sequence records, see iter_synthetic_barcodes.
+
+	Examples
+	---------
+	>>> records = synthetic_barcodes(100, seed = 1)
+	>>> records[0].keys()
+	dict_keys(['name', 'sequence', 'kingdom'])
+	"""
+	return [x for records in iter_synthetic_barcodes(n, seed, **kwargs) for x in records]
+
+
+def synthetic_dataframe(n, seed = 0, **kwargs):
+	"""
+	Return synthetic barcode sequences as a training data frame, with the columns 'processid',
+	'sequence' and 'kingdom' (the defaults of alfie.training.process_sequences).
+	"""
+	out = pd.DataFrame(synthetic_barcodes(n, seed, **kwargs))
+	return out.rename(columns = {"name" : "processid"})
+
+
+def write_synthetic(filename, n, seed = 0, **kwargs):
+	"""
+	Write synthetic barcodes (fasta) or reads (fastq) to a file.
+
+	The file type, and optional compression, are inferred from the extension.
+
+	Arguments
+	---------
+	filename : str, the output file, with a fasta or fastq extension (i.e. 'reads.fastq.gz').
+
+	n : int, the number of records.
+
+	seed : int, the random seed. Default is 0.
+
+	**kwargs : additional keyword arguments passed to iter_synthetic_barcodes (fasta) or
+		iter_synthetic_reads (fastq).
+
+	Examples
+	---------
+	>>> write_synthetic("synthetic_reads.fastq", 1000000, seed = 1)
+	"""
+	if file_type(filename) == 'fastq':
+		chunks, write = iter_synthetic_reads(n, seed, **kwargs), write_fastq
+	else:
+		chunks, write = iter_synthetic_barcodes(n, seed, **kwargs), write_fasta
+
+	#truncate the file, then append each chunk
+	write([], filename, append_seq = False)
+	for records in chunks:
+		write(records, filename)
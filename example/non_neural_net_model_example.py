@@ -29,6 +29,10 @@ train, test = stratified_taxon_split(data, class_col = 'class', test_size = 0.3,
 train_kmer_data = process_sequences(train, label_col = 'class')
 test_kmer_data = process_sequences(test, label_col = 'class')
 
+# note: for larger values of k (i.e. k = 8), pass sparse = True to process_sequences
+# and classify_records. The k-mer data are then a scipy.sparse matrix, which the 
+# LinearSVC accepts directly in place of the X arrays built below.
+
 #####
 # encode the predictor and response data
 #####
@@ -33,13 +33,13 @@ setup(
 	description = 'alignment free identification of edna',
 	long_description = long_description,
 	license= 'LICENSE.md',
-	packages = find_packages(),
+	packages = find_packages(exclude = ['benchmarks', 'benchmarks.*']),
 	package_data={'alfie': ['data/*']},
 	entry_points = {
 	'console_scripts':[
 	'alfie = alfie.alf:main']
 	},
-	python_requires='>=3.6',
+	python_requires='>=3.8',
 	install_requires = requirements,
 
 	)